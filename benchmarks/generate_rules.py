@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Seeded synthetic firewall_rules.csv generator for the benchmarks.
+
+Rows follow the firewall_rules.csv schema with distributions taken from the real file:
+a few security groups own most rules (Zipf), about 70% of rules reference another group
+and most of the rest a CIDR drawn from a reused pool, ports cluster on a handful of service
+ports with the occasional range, and protocols are mostly tcp. Every row is valid and
+unique, so validation does the full amount of work instead of stopping at an error.
+The same seed and size always give the same file.
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["RequestID", "name", "security_group_id", "direction", "from_port", "to_port", "ip_protocol",
+           "referenced_security_group_id", "cidr_ipv4", "cidr_ipv6", "prefix_list_id", "business_justification"]
+
+PROTOCOLS = np.array(["tcp", "udp", "icmp", "-1"])
+PROTOCOL_WEIGHTS = [0.80, 0.135, 0.05, 0.015]
+
+SERVICE_PORTS = np.array([443, 53, 80, 123, 10250, 15017, 9443, 6379, 5432, 8080, 22, 3306, 30000])
+SERVICE_PORT_WEIGHTS = np.array([34, 12, 7, 6, 4, 4, 3, 3, 3, 3, 2, 2, 4], dtype=float)
+
+# Share of rules with each kind of source; the remainder are IPv4 CIDRs
+SG_REFERENCE_SHARE = 0.69
+CIDR_IPV6_SHARE = 0.01
+PREFIX_LIST_SHARE = 0.02
+
+PREFIX_LISTS = np.array(["s3", "dynamodb"])
+
+
+def _zipf_choice(rng: np.random.Generator, count: int, size: int, exponent: float = 1.2) -> np.ndarray:
+    """Indices in [0, count) where low indices are far more common, like rule owners in practice."""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return rng.choice(count, size=size, p=weights / weights.sum())
+
+
+def generate_rules(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Build a synthetic rule table of `rows` unique rows."""
+    rng = np.random.default_rng(seed)
+    # Over-generate, then drop duplicate rules
+    draw = int(rows * 1.3) + 100
+    groups = max(20, int(np.sqrt(rows) * 2))
+    sg_names = np.array([f"sg_{i:05d}" for i in range(groups)])
+
+    owners = sg_names[_zipf_choice(rng, groups, draw)]
+    directions = np.where(rng.random(draw) < 0.545, "egress", "ingress")
+    protocols = rng.choice(PROTOCOLS, size=draw, p=PROTOCOL_WEIGHTS)
+
+    from_ports = rng.choice(SERVICE_PORTS, size=draw, p=SERVICE_PORT_WEIGHTS / SERVICE_PORT_WEIGHTS.sum())
+    # A quarter of rules use an arbitrary port, and 7% open a range
+    random_port = rng.random(draw) < 0.25
+    from_ports = np.where(random_port, rng.integers(1024, 65000, size=draw), from_ports)
+    to_ports = np.where(rng.random(draw) < 0.07, np.minimum(from_ports + rng.integers(1, 1000, size=draw), 65535),
+                        from_ports)
+    # icmp ports are type/code; -1 covers everything and is written as 0-0
+    is_icmp = protocols == "icmp"
+    from_ports = np.where(is_icmp, rng.integers(0, 16, size=draw), from_ports)
+    to_ports = np.where(is_icmp, rng.integers(0, 16, size=draw), to_ports)
+    from_ports = np.where(protocols == "-1", 0, from_ports)
+    to_ports = np.where(protocols == "-1", 0, to_ports)
+
+    null = np.full(draw, "null", dtype=object)
+    kind = rng.random(draw)
+    is_reference = kind < SG_REFERENCE_SHARE
+    is_ipv6 = (kind >= SG_REFERENCE_SHARE) & (kind < SG_REFERENCE_SHARE + CIDR_IPV6_SHARE)
+    is_prefix_list = ((kind >= SG_REFERENCE_SHARE + CIDR_IPV6_SHARE)
+                      & (kind < SG_REFERENCE_SHARE + CIDR_IPV6_SHARE + PREFIX_LIST_SHARE))
+    is_ipv4 = ~(is_reference | is_ipv6 | is_prefix_list)
+
+    references = np.where(is_reference, sg_names[_zipf_choice(rng, groups, draw)], null)
+    # CIDRs come from a reused pool, as firewall_rules.csv repeats the same few hundred blocks
+    pool_size = max(50, rows // 50)
+    pool_prefixes = rng.choice([8, 16, 24, 32, 32, 32], size=pool_size)
+    pool_addresses = rng.integers(1, 2 ** 32 - 1, size=pool_size, dtype=np.int64)
+    pool = np.array([
+        f"{(address >> 24) & 255}.{(address >> 16) & 255}.{(address >> 8) & 255}.{address & 255}/32"
+        if prefix == 32 else
+        f"{(address >> 24) & 255}.{(address >> 16) & 255 if prefix > 8 else 0}.{(address >> 8) & 255 if prefix > 16 else 0}.0/{prefix}"
+        for address, prefix in zip(pool_addresses, pool_prefixes)
+    ])
+    cidr_ipv4 = np.where(is_ipv4, pool[_zipf_choice(rng, pool_size, draw, exponent=0.8)], null)
+    cidr_ipv6 = np.where(is_ipv6, np.array([f"2600:{i:x}::/48" for i in rng.integers(0, 4096, size=draw)]), null)
+    prefix_lists = np.where(is_prefix_list, rng.choice(PREFIX_LISTS, size=draw), null)
+
+    df = pd.DataFrame({
+        "RequestID": [f"Request{i:05d}" for i in rng.integers(1, max(2, rows // 100), size=draw)],
+        "name": owners,
+        "security_group_id": owners,
+        "direction": directions,
+        "from_port": from_ports,
+        "to_port": to_ports,
+        "ip_protocol": protocols,
+        "referenced_security_group_id": references,
+        "cidr_ipv4": cidr_ipv4,
+        "cidr_ipv6": cidr_ipv6,
+        "prefix_list_id": prefix_lists,
+        "business_justification": rng.choice(["app traffic", "dns", "monitoring", "vpc endpoint"], size=draw),
+    }, columns=COLUMNS)
+    df = df.drop_duplicates(subset=COLUMNS[1:11]).head(rows)
+    if len(df) < rows:
+        raise ValueError(f"only {len(df)} unique rules could be generated for {rows} rows; try another seed")
+    return df.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a seeded synthetic firewall rules CSV.')
+    parser.add_argument('--rows', type=int, required=True, help='Number of rules')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--output-file', required=True, help='CSV file to write')
+    args = parser.parse_args()
+    generate_rules(args.rows, args.seed).to_csv(args.output_file, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Time and memory-profile the CSV rule pipeline on synthetic rule sets.
+
+For each size, a seeded CSV from generate_rules.py is read with read_rules, then every
+registered validator, validate_rules and process_rules are run. Each benchmark reports the
+best wall time of --repeat runs and the peak traced allocation (tracemalloc, measured in a
+separate run so tracing does not skew the timings).
+
+Results are compared with a tracked JSON baseline, and the run fails when a benchmark is
+slower or uses more memory than the baseline by more than --tolerance:
+    python benchmarks/run_benchmarks.py                      # compare with baseline.json
+    python benchmarks/run_benchmarks.py --sizes 1000000      # one size, 1M rules
+    python benchmarks/run_benchmarks.py --update-baseline    # record a new baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "rule_validation"))
+sys.path.insert(0, os.path.join(ROOT, "rule_conversion"))
+from rule_common.loader import read_rules
+from validate import VALIDATORS, validate_rules
+import convert
+from generate_rules import generate_rules
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = [10000, 100000]
+
+# Differences below this many seconds are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.05
+
+
+def measure(func: Callable[[], Any], setup: Callable[[], Any] = None, repeat: int = 3) -> Dict[str, float]:
+    """Best wall time of `repeat` calls and the peak memory traced during one more call."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(min(times), 4), "peak_mb": round(peak / 1e6, 2)}
+
+
+def run_size(rows: int, seed: int, repeat: int, work_dir: str) -> Dict[str, Dict[str, float]]:
+    """Run every benchmark on a synthetic rule set of `rows` rules."""
+    input_file = os.path.join(work_dir, f"rules-{rows}-{seed}.csv")
+    generate_rules(rows, seed).to_csv(input_file, index=False)
+
+    results = {"read_rules": measure(lambda: read_rules(input_file), repeat=repeat)}
+    df = read_rules(input_file)
+    line_numbers = df.index.to_series() + 2
+    for v in VALIDATORS:
+        results[f"validator:{v.issue_type}"] = measure(lambda v=v: v.func(df, line_numbers), repeat=repeat)
+    results["validate_rules"] = measure(lambda: validate_rules(df, line_numbers), repeat=repeat)
+
+    # process_rules writes sg_rules/ and rule_count.txt to the working directory; start each run empty
+    output_dir = os.path.join(work_dir, "sg_rules")
+
+    def clean():
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    def convert_rules():
+        with contextlib.redirect_stdout(io.StringIO()):
+            convert.process_rules(input_file)
+
+    cwd, configured_dir = os.getcwd(), convert.CONFIG["OUTPUT_DIR"]
+    os.chdir(work_dir)
+    convert.CONFIG["OUTPUT_DIR"] = output_dir
+    try:
+        results["process_rules"] = measure(convert_rules, setup=clean, repeat=repeat)
+    finally:
+        os.chdir(cwd)
+        convert.CONFIG["OUTPUT_DIR"] = configured_dir
+    return results
+
+
+def run_benchmarks(sizes: List[int], seed: int = 0, repeat: int = 3) -> Dict[str, Any]:
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = {}
+        for rows in sizes:
+            print(f"Benchmarking {rows} rules...", file=sys.stderr)
+            results[str(rows)] = run_size(rows, seed, repeat, work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+    return {
+        "seed": seed,
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def find_regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Benchmarks slower or larger than the baseline by more than tolerance (0.5 = 50%)."""
+    regressions = []
+    for rows, benchmarks in report["results"].items():
+        for name, result in benchmarks.items():
+            base = baseline.get("results", {}).get(rows, {}).get(name)
+            if base is None:
+                continue
+            if (result["seconds"] > base["seconds"] * (1 + tolerance)
+                    and result["seconds"] - base["seconds"] > MIN_SECONDS_DELTA):
+                regressions.append(f"{name} at {rows} rules: {result['seconds']}s vs {base['seconds']}s")
+            if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) and result["peak_mb"] - base["peak_mb"] > 1:
+                regressions.append(f"{name} at {rows} rules: {result['peak_mb']} MB vs {base['peak_mb']} MB")
+    return regressions
+
+
+def print_table(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    for rows, benchmarks in report["results"].items():
+        print(f"\n{rows} rules:")
+        for name, result in benchmarks.items():
+            base = baseline.get("results", {}).get(rows, {}).get(name)
+            change = ""
+            if base and base["seconds"] > 0:
+                change = f" ({result['seconds'] / base['seconds'] - 1:+.0%} vs baseline)"
+            print(f"- {name} : {result['seconds']:.4f}s, {result['peak_mb']:.2f} MB peak{change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rule validation and conversion on synthetic rule sets.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help=f'Rule counts to benchmark (default: {" ".join(map(str, DEFAULT_SIZES))})')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark; the best is kept (default: 3)')
+    parser.add_argument('--baseline-file', default=BASELINE_FILE, help='Baseline JSON to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown or memory growth over the baseline (default: 0.5 = 50%%)')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results to the baseline file')
+    parser.add_argument('--output-file', help='Also write the results as JSON here')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.seed, args.repeat)
+    baseline = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file) as f:
+            baseline = json.load(f)
+    print_table(report, baseline)
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.update_baseline:
+        with open(args.baseline_file, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline_file}")
+        return
+
+    if baseline.get("seed", args.seed) != args.seed:
+        print(f"\nWarning: baseline was recorded with seed {baseline['seed']}; not comparing.")
+        return
+    regressions = find_regressions(report, baseline, args.tolerance)
+    if regressions:
+        print("\nError: regressions against the baseline:")
+        for regression in regressions:
+            print(f"- {regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Helpers shared by the rule_validation and rule_conversion actions."""
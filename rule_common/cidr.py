@@ -0,0 +1,36 @@
+"""Shared CIDR parsing for the firewall rule pipeline.
+
+firewall_rules.csv repeats the same few hundred CIDRs across thousands of rows, so each
+distinct string is parsed once through an LRU cache shared by every check that needs it.
+"""
+import ipaddress
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+CACHE_SIZE = 65536
+
+
+class ParsedCidr(NamedTuple):
+    network: int
+    prefixlen: int
+    version: int
+
+    @property
+    def max_prefixlen(self) -> int:
+        return 32 if self.version == 4 else 128
+
+    @property
+    def last(self) -> int:
+        """Integer value of the last address in the network."""
+        return self.network + (1 << (self.max_prefixlen - self.prefixlen)) - 1
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_cidr(value: str) -> Optional[ParsedCidr]:
+    """Parse a CIDR string (host bits allowed), or return None if it is not a valid network."""
+    try:
+        network = ipaddress.ip_network(value, strict=False)
+    except (ValueError, TypeError):
+        return None
+    return ParsedCidr(int(network.network_address), network.prefixlen, network.version)
+
@@ -0,0 +1,53 @@
+"""Validation errors for rows of the rule table.
+
+Each error carries the offending row, but a check can find many more errors than the
+report shows once the error cap applies, so rows are only converted to dicts when read.
+"""
+from collections.abc import Mapping
+from typing import Any, Dict, List
+import pandas as pd
+
+
+class LazyRow(Mapping):
+    """Row data attached to an error, only converted to a dict when it is read or printed.
+    Errors that are never reported never pay for the conversion.
+    """
+    __slots__ = ("_df", "_pos", "_row")
+
+    def __init__(self, df: pd.DataFrame, pos: int):
+        self._df, self._pos, self._row = df, pos, None
+
+    def materialize(self) -> Dict[str, Any]:
+        if self._row is None:
+            self._row = self._df.iloc[self._pos].to_dict()
+            self._df = None
+        return self._row
+
+    def __getitem__(self, key):
+        return self.materialize()[key]
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
+
+    def __repr__(self):
+        return repr(self.materialize())
+
+
+def row_errors(df: pd.DataFrame, line_numbers, positions, messages) -> List[Dict[str, Any]]:
+    """Build error dicts for the offending row positions only.
+    messages is either one message per position or a single message shared by all of them.
+    """
+    if isinstance(messages, str):
+        messages = [messages] * len(positions)
+    errors = []
+    for pos, message in zip(positions, messages):
+        index = df.index[pos]
+        errors.append({
+            "line_number": line_numbers.get(index, "Unknown"),
+            "row": LazyRow(df, pos),
+            "error": message
+        })
+    return errors
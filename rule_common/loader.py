@@ -0,0 +1,214 @@
+"""Typed loading of firewall_rules.csv for the rule_validation and rule_conversion actions.
+
+Almost every cell repeats a small set of values (directions, protocols, security group and
+request ids, "null"), so those columns are read as categoricals: each distinct string is
+stored once and rows only hold integer codes. Ports become Int64 when every value is an
+integer; otherwise integer-valued ports (443, 80.0) still become ints and only the rest stay
+text. The pyarrow CSV reader is used when pyarrow is installed; it is told to read every
+column as text with pandas' missing-value strings, so both engines load the same table.
+
+Categorical columns hash the same as the plain strings they hold, so frames from this loader
+can be checked against a DuplicateIndex built from text (see rule_validation/validate.py).
+
+Given a snapshot_dir, read_rules stores the parsed table keyed by the CSV's SHA-256 and later
+calls with the same content load it instead of parsing again. Snapshots are Feather files,
+which hold only data, so a snapshot directory restored from a shared cache cannot run code;
+without pyarrow the snapshot_dir is ignored. Snapshots keep the categorical dtypes and hold
+ports as text; ports are converted after loading, which only parses the distinct values.
+"""
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+from typing import Dict, Iterator, Optional
+import numpy as np
+import pandas as pd
+from pandas.errors import ParserError
+
+NULL = "null"
+
+PORT_COLUMNS = ["from_port", "to_port"]
+
+# Low-cardinality columns; anything not listed here (the cidrs, unknown extras) stays plain text
+CATEGORY_COLUMNS = [
+    "RequestID", "name", "security_group_id", "direction", "ip_protocol",
+    "referenced_security_group_id", "prefix_list_id", "business_justification",
+] + PORT_COLUMNS
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Part of every snapshot name; bump when the schema or normalization here changes
+SNAPSHOT_VERSION = 2
+
+
+# Cells pandas' C parser reads as missing by default; the pyarrow reader is given the same list
+NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+
+def _dtypes(input_file: str) -> Dict[str, str]:
+    """Map each column in the file's header to its declared dtype."""
+    columns = pd.read_csv(input_file, nrows=0).columns
+    return {column: "category" if column in CATEGORY_COLUMNS else object for column in columns}
+
+
+def _read_pyarrow(input_file: str, dtypes: Dict[str, str]) -> pd.DataFrame:
+    """Read the CSV with pyarrow, every column as text (dictionary-encoded for categoricals).
+    pandas' engine="pyarrow" infers types first and casts afterwards, which turns empty cells
+    into "None" and 443 into "443.0", so pyarrow.csv is used directly.
+    """
+    import pyarrow as pa
+    from pyarrow import csv
+
+    column_types = {column: pa.dictionary(pa.int32(), pa.string()) if dtype == "category" else pa.string()
+                    for column, dtype in dtypes.items()}
+    try:
+        table = csv.read_csv(input_file, convert_options=csv.ConvertOptions(
+            column_types=column_types, null_values=NA_VALUES, strings_can_be_null=True))
+    except pa.ArrowInvalid as e:
+        # Report malformed rows the way the C parser does
+        raise ParserError(str(e)) from e
+    df = table.to_pandas()
+    # Categories in sorted order, as the C parser declares them
+    for column, dtype in dtypes.items():
+        if dtype == "category":
+            df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+    return df
+
+
+def _fill_null(df: pd.DataFrame) -> pd.DataFrame:
+    """Replace missing cells with "null", the way fillna("null") does on an object frame.
+    Every categorical gets a "null" category, so later fillna("null") calls stay valid.
+    """
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype) and NULL not in series.cat.categories:
+            series = series.cat.add_categories(NULL)
+        if series.isna().any():
+            series = series.fillna(NULL)
+        df[column] = series
+    return df
+
+
+def parse_port(value) -> Optional[int]:
+    """The integer a port cell holds, or None. Integer-valued decimals (80.0) count, the way
+    read_csv parses a numeric column; 1.5, "http" and "null" do not.
+    """
+    try:
+        return int(value)
+    except (ValueError, TypeError, OverflowError):
+        pass
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    return int(number) if number.is_integer() else None
+
+
+def _integer_ports(column: pd.Series) -> pd.Series:
+    """Return a categorical port column as Int64 if every value is an integer. Otherwise the
+    integer-valued categories become ints and the rest ("null", "http", 1.5) stay as written.
+    Only the distinct values are parsed.
+    """
+    used = column.cat.remove_unused_categories()
+    categories = used.cat.categories
+    numbers = [parse_port(value) for value in categories]
+    if not any(number is not None for number in numbers):
+        return column
+    if all(number is not None and -2**63 <= number < 2**63 for number in numbers):
+        values = np.array(numbers, dtype=np.int64)
+        return pd.Series(values[used.cat.codes.to_numpy()], index=column.index, dtype="Int64")
+
+    # "80" and "80.0" map to the same int, so the categories are rebuilt from the mapped values
+    mapped = pd.Index([value if number is None else number for value, number in zip(categories, numbers)],
+                      dtype=object)
+    codes, uniques = pd.factorize(mapped)
+    return pd.Series(pd.Categorical.from_codes(codes[used.cat.codes.to_numpy()], uniques),
+                     index=column.index)
+
+
+def content_hash(input_file: str) -> str:
+    """SHA-256 of the file's bytes, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(input_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_path(snapshot_dir: str, digest: str) -> str:
+    """Where the snapshot of a CSV with the given content hash is stored."""
+    return os.path.join(snapshot_dir, f"rules-v{SNAPSHOT_VERSION}-{digest}.feather")
+
+
+def _load_snapshot(path: str) -> Optional[pd.DataFrame]:
+    """Load a snapshot, or return None if it is missing or unreadable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_feather(path)
+    except Exception as e:
+        print(f"Warning: ignoring unreadable snapshot {path}: {e}", file=sys.stderr)
+        return None
+
+
+def _save_snapshot(df: pd.DataFrame, path: str) -> None:
+    """Write a snapshot through a temporary file, so readers never see a partial one."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _parse_rules(input_file: str) -> pd.DataFrame:
+    """The table with every column as text, as stored in snapshots."""
+    dtypes = _dtypes(input_file)
+    if HAS_PYARROW:
+        df = _read_pyarrow(input_file, dtypes)
+    else:
+        df = pd.read_csv(input_file, dtype=dtypes)
+    return _fill_null(df)
+
+
+def _convert_ports(df: pd.DataFrame) -> pd.DataFrame:
+    for column in PORT_COLUMNS:
+        if column in df.columns:
+            df[column] = _integer_ports(df[column])
+    return df
+
+
+def read_rules(input_file: str, int_ports: bool = True, snapshot_dir: str = None) -> pd.DataFrame:
+    """Read a rules CSV with the declared dtypes, with missing cells filled as "null".
+    With int_ports=False, or when a port cell is not an integer, ports are kept as text so
+    invalid values can still be reported as written.
+    With a snapshot_dir, a snapshot of the same CSV content is loaded instead of parsing,
+    and a fresh parse is saved there for the next caller. Without pyarrow it is ignored.
+    """
+    if snapshot_dir and not HAS_PYARROW:
+        print("Warning: snapshots need pyarrow; reading the CSV without one", file=sys.stderr)
+        snapshot_dir = None
+    if not snapshot_dir:
+        df = _parse_rules(input_file)
+    else:
+        # Snapshots keep ports as text, so one snapshot serves both int_ports modes
+        path = snapshot_path(snapshot_dir, content_hash(input_file))
+        df = _load_snapshot(path)
+        if df is None:
+            df = _parse_rules(input_file)
+            _save_snapshot(df, path)
+    return _convert_ports(df) if int_ports else df
+
+
+def iter_rule_chunks(input_file: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Read a rules CSV chunk_size rows at a time with the declared dtypes.
+    Ports stay text so every chunk hashes the same way; chunks keep a running RangeIndex.
+    The pyarrow engine cannot stream, so chunks always use the C engine.
+    """
+    for chunk in pd.read_csv(input_file, dtype=_dtypes(input_file), chunksize=chunk_size):
+        yield _fill_null(chunk)
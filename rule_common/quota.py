@@ -0,0 +1,168 @@
+"""Security group quota and capacity accounting for firewall_rules.csv.
+
+Usage is counted per security group and direction in one groupby over the rule table. A
+rule normally uses one slot of the rules-per-SG quota; a rule referencing a prefix list
+uses references_per_rule slots, since AWS counts it as the prefix list's max entries.
+The limit a group is held to is the rules-per-SG quota, lowered when needed so that
+rules_per_sg x sgs_per_eni stays within the AWS limit of RULES_PER_ENI rules per network
+interface.
+
+Rule and prefix list counts per security group and direction (usage_counts) do not depend
+on the quotas, so a baseline can keep them and a delta only adds its own rows to them.
+"""
+import argparse
+from typing import Any, Dict, Tuple
+import numpy as np
+import pandas as pd
+
+DEFAULT_QUOTAS = {
+    # Inbound, and separately outbound, rules per security group
+    "rules_per_sg": 60,
+    # Security groups per network interface
+    "sgs_per_eni": 5,
+    # Slots a prefix list reference uses (the prefix list's max entries)
+    "references_per_rule": 1,
+}
+
+RULES_PER_ENI = 1000
+
+DIRECTIONS = ["ingress", "egress"]
+
+
+def parse_quota(text: str) -> Tuple[str, int]:
+    """argparse type for NAME=VALUE quota overrides."""
+    name, _, value = text.partition("=")
+    if name not in DEFAULT_QUOTAS:
+        raise argparse.ArgumentTypeError(f"unknown quota {name!r}; expected one of {', '.join(DEFAULT_QUOTAS)}")
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"quota {name} needs a positive integer value, got {value!r}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"quota {name} needs a positive integer value, got {value!r}")
+    return name, number
+
+
+def rule_limit(quotas: Dict[str, int]) -> int:
+    """Rules each security group may hold per direction under quotas."""
+    return min(quotas["rules_per_sg"], RULES_PER_ENI // quotas["sgs_per_eni"])
+
+
+def _usage_frame(df: pd.DataFrame, quotas: Dict[str, int]) -> pd.DataFrame:
+    """Security group, direction, slots used and whether it references a security group, per rule."""
+    prefix_list = df["prefix_list_id"].astype(str).str.lower().to_numpy() != "null"
+    sg_reference = df["referenced_security_group_id"].astype(str).str.lower().to_numpy() != "null"
+    return pd.DataFrame({
+        "security_group_id": df["security_group_id"].astype(str).to_numpy(),
+        "direction": df["direction"].astype(str).str.lower().to_numpy(),
+        "used": np.where(prefix_list, quotas["references_per_rule"], 1),
+        "references": sg_reference.astype(np.int64),
+    }, index=df.index)
+
+
+def usage_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """Rules and prefix list rules per (security_group_id, direction)."""
+    counts = pd.DataFrame({
+        "security_group_id": df["security_group_id"].astype(str).to_numpy(),
+        "direction": df["direction"].astype(str).str.lower().to_numpy(),
+        "rules": np.ones(len(df), dtype=np.int64),
+        "prefix_lists": (df["prefix_list_id"].astype(str).str.lower().to_numpy() != "null").astype(np.int64),
+    })
+    return counts.groupby(["security_group_id", "direction"]).sum()
+
+
+def empty_usage_counts() -> pd.DataFrame:
+    """A usage_counts table with no security groups."""
+    return pd.DataFrame({"rules": np.empty(0, dtype=np.int64), "prefix_lists": np.empty(0, dtype=np.int64)},
+                        index=pd.MultiIndex.from_arrays([[], []], names=["security_group_id", "direction"]))
+
+
+def add_usage_counts(counts: pd.DataFrame, more: pd.DataFrame) -> pd.DataFrame:
+    """Sum two usage_counts tables."""
+    return counts.add(more, fill_value=0).astype(np.int64)
+
+
+def cumulative_usage(df: pd.DataFrame, quotas: Dict[str, int], baseline: pd.DataFrame = None) -> pd.Series:
+    """Slots used by each row's security group and direction up to and including the row,
+    on top of the baseline's usage_counts when given.
+    """
+    usage = _usage_frame(df, quotas)
+    cumulative = usage.groupby(["security_group_id", "direction"], sort=False)["used"].cumsum()
+    if baseline is None or baseline.empty:
+        return cumulative
+    used = baseline["rules"] + baseline["prefix_lists"] * (quotas["references_per_rule"] - 1)
+    keys = pd.MultiIndex.from_arrays([usage["security_group_id"], usage["direction"]])
+    offsets = used.reindex(keys, fill_value=0).to_numpy()
+    return cumulative + offsets
+
+
+def capacity_table(df: pd.DataFrame, quotas: Dict[str, int]) -> pd.DataFrame:
+    """Rules, slots used and headroom per security group and direction, most utilized first."""
+    usage = _usage_frame(df, quotas)
+    usage = usage[usage["direction"].isin(DIRECTIONS)]
+    table = (usage.groupby(["security_group_id", "direction"])
+             .agg(rules=("used", "size"), used=("used", "sum"), references=("references", "sum"))
+             .unstack("direction", fill_value=0))
+    table = table.reindex(columns=pd.MultiIndex.from_product([["rules", "used", "references"], DIRECTIONS]),
+                          fill_value=0)
+
+    limit = rule_limit(quotas)
+    result = pd.DataFrame(index=table.index)
+    for direction in DIRECTIONS:
+        result[f"{direction}_rules"] = table[("rules", direction)]
+        result[f"{direction}_used"] = table[("used", direction)]
+        result[f"{direction}_headroom"] = limit - table[("used", direction)]
+    result["sg_references"] = table[("references", "ingress")] + table[("references", "egress")]
+    result["utilization"] = result[[f"{d}_used" for d in DIRECTIONS]].max(axis=1) / limit
+    return result.sort_values(["utilization"], ascending=False, kind="stable")
+
+
+def capacity_report(df: pd.DataFrame, quotas: Dict[str, int]) -> Dict[str, Any]:
+    """The capacity table as a JSON-ready report."""
+    table = capacity_table(df, quotas)
+    groups = []
+    for sg_name, row in zip(table.index, table.to_dict("records")):
+        groups.append({
+            "security_group_id": sg_name,
+            **{direction: {
+                "rules": int(row[f"{direction}_rules"]),
+                "used": int(row[f"{direction}_used"]),
+                "headroom": int(row[f"{direction}_headroom"]),
+            } for direction in DIRECTIONS},
+            "sg_references": int(row["sg_references"]),
+            "utilization": round(float(row["utilization"]), 4),
+        })
+    return {
+        "quotas": dict(quotas, rules_per_direction=rule_limit(quotas)),
+        "over_quota": [group["security_group_id"] for group in groups if group["utilization"] > 1],
+        "security_groups": groups,
+    }
+
+
+def format_markdown(report: Dict[str, Any], top: int = 10) -> str:
+    """Render a capacity report: the quotas in effect, then the `top` groups closest to the limit."""
+    quotas = report["quotas"]
+    lines = [
+        "# Security Group Capacity Report",
+        "",
+        f"Limit: {quotas['rules_per_direction']} rules per direction "
+        f"(rules_per_sg={quotas['rules_per_sg']}, sgs_per_eni={quotas['sgs_per_eni']}, "
+        f"references_per_rule={quotas['references_per_rule']})",
+        "",
+    ]
+    if report["over_quota"]:
+        lines += [f"Over quota: {', '.join(report['over_quota'])}", ""]
+    lines += [
+        f"## Closest to the limit (top {min(top, len(report['security_groups']))} "
+        f"of {len(report['security_groups'])})",
+        "",
+        "| Security group | Ingress used | Ingress headroom | Egress used | Egress headroom | SG references | Utilization |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for group in report["security_groups"][:top]:
+        lines.append(
+            f"| {group['security_group_id']} | {group['ingress']['used']} | {group['ingress']['headroom']} "
+            f"| {group['egress']['used']} | {group['egress']['headroom']} | {group['sg_references']} "
+            f"| {group['utilization']:.0%} |"
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,128 @@
+"""Optional compaction of converted rules.
+
+Within one security group and direction, rules that match in every field except RequestID and
+either the port range or the CIDR are merged:
+- tcp/udp port ranges that overlap or touch ([80, 89] and [90, 99]) become one range;
+- cidr_ipv4 / cidr_ipv6 blocks are aggregated the way ipaddress.collapse_addresses does.
+Both passes repeat until nothing more merges. Every compacted rule lists the RequestIDs it
+came from in source_request_ids, and keeps the RequestID of its first source rule.
+"""
+import ipaddress
+import os
+import sys
+from bisect import bisect_right
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_common.loader import parse_port
+
+PORT_PROTOCOLS = ("tcp", "udp")
+CIDR_FIELDS = ("cidr_ipv4", "cidr_ipv6")
+
+# Fields that never prevent two rules from merging
+TRACE_FIELDS = ("RequestID", "source_request_ids")
+
+
+def _merge_key(rule: Dict[str, Any], *merged_fields: str):
+    return tuple((field, str(value)) for field, value in rule.items()
+                 if field not in TRACE_FIELDS and field not in merged_fields)
+
+
+def _combine(sources: List[Dict[str, Any]], **fields) -> Dict[str, Any]:
+    """One rule standing for all of sources, with fields overridden."""
+    if len(sources) == 1 and not fields:
+        return sources[0]
+    rule = dict(sources[0], **fields)
+    request_ids = []
+    for source in sources:
+        request_ids.extend(i for i in source["source_request_ids"] if i not in request_ids)
+    rule["source_request_ids"] = request_ids
+    return rule
+
+
+def _merge_ports(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge overlapping or adjacent port ranges of otherwise identical tcp/udp rules."""
+    compacted, groups = [], {}
+    for rule in records:
+        if (str(rule["ip_protocol"]).lower() in PORT_PROTOCOLS
+                and parse_port(rule["from_port"]) is not None and parse_port(rule["to_port"]) is not None):
+            groups.setdefault(_merge_key(rule, "from_port", "to_port"), []).append(rule)
+        else:
+            compacted.append(rule)
+
+    for members in groups.values():
+        members.sort(key=lambda r: (parse_port(r["from_port"]), parse_port(r["to_port"])))
+        run, end = [], None
+        for rule in members + [None]:
+            if rule is not None and run and parse_port(rule["from_port"]) <= end + 1:
+                run.append(rule)
+                end = max(end, parse_port(rule["to_port"]))
+                continue
+            if len(run) > 1:
+                to_port = type(run[0]["to_port"])(end)
+                compacted.append(_combine(run, to_port=to_port))
+            elif run:
+                compacted.append(run[0])
+            if rule is not None:
+                run, end = [rule], parse_port(rule["to_port"])
+    return compacted
+
+
+def _collapse_cidrs(records: List[Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
+    """Aggregate the `field` CIDRs of otherwise identical rules into the fewest blocks."""
+    compacted, groups = [], {}
+    for rule in records:
+        if str(rule.get(field, "null")).lower() == "null":
+            compacted.append(rule)
+        else:
+            groups.setdefault(_merge_key(rule, field), []).append(rule)
+
+    for members in groups.values():
+        try:
+            networks = [ipaddress.ip_network(str(rule[field]), strict=False) for rule in members]
+            collapsed = list(ipaddress.collapse_addresses(networks))
+        except (ValueError, TypeError):
+            compacted.extend(members)
+            continue
+        if len(collapsed) == len(members):
+            compacted.extend(members)
+            continue
+
+        # Collapsed blocks are sorted and disjoint, so each source block falls in exactly one
+        starts = [int(network.network_address) for network in collapsed]
+        buckets = [[] for _ in collapsed]
+        for rule, network in zip(members, networks):
+            buckets[bisect_right(starts, int(network.network_address)) - 1].append(rule)
+        for network, bucket in zip(collapsed, buckets):
+            if len(bucket) == 1 and str(bucket[0][field]) == str(network):
+                compacted.append(bucket[0])
+            else:
+                compacted.append(_combine(bucket, **{field: str(network)}))
+    return compacted
+
+
+def compact_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compact one security group's rules for one direction. Order is not preserved."""
+    records = [dict(rule, source_request_ids=[rule["RequestID"]]) for rule in records]
+    while True:
+        compacted = _merge_ports(records)
+        for field in CIDR_FIELDS:
+            compacted = _collapse_cidrs(compacted, field)
+        if len(compacted) == len(records):
+            return compacted
+        records = compacted
+
+
+def compact_rules(rules: Dict[str, Dict[str, List[Dict[str, Any]]]],
+                  sort_columns: List[str]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Compact every group of rules as returned by convert.group_rules, re-sorted by the
+    str() form of sort_columns so files keep their usual order.
+    """
+    return {
+        direction: {
+            sg_name: sorted(compact_records(records),
+                            key=lambda rule: tuple(str(rule[column]) for column in sort_columns))
+            for sg_name, records in groups.items()
+        }
+        for direction, groups in rules.items()
+    }
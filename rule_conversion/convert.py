@@ -1,120 +1,361 @@
-#!/usr/bin/env python3
-import argparse
-import os
-import json
-import sys
-import pandas as pd
-from typing import Dict, List, Any
-
-
-CONFIG = {
-    "OUTPUT_DIR": "./sg_rules"
-}
-
-def read_existing_json(file_path: str) -> List[Dict[str, Any]]:
-    """Read existing JSON file if it exists."""
-    if os.path.exists(file_path):
-        with open(file_path, "r") as jsonfile:
-            try:
-                return json.load(jsonfile)
-            except json.JSONDecodeError:
-                print(f"Warning: {file_path} is not a valid JSON. It will be overwritten.")
-    return []
-
-def rules_changed(existing_rules: List[Dict[str, Any]], new_rules: List[Dict[str, Any]]) -> bool:
-    """Compare existing and new rules to determine if updates are needed."""
-    return existing_rules != new_rules
-
-def write_rule_count(rules):
-    """Write the count of rules per security group per direction to rule_count.txt in the root directory."""
-    rule_count_file = "rule_count.txt"
-    with open(rule_count_file, "w") as f:
-        f.write("# Security Group Rule Count:\n")
-        
-        for direction in ["ingress", "egress"]:
-            f.write(f"\n## {direction.capitalize()} Rules:\n")
-            for sg_name in sorted(rules[direction].keys()):
-                rule_list = rules[direction][sg_name]
-                f.write(f"- {sg_name} : {len(rule_list)} rules\n")
-    
-    print(f"Rule count written to {rule_count_file}")
-
-
-def process_rules(input_file: str) -> None:
-    """Main function to process rules into JSON."""
-    # Create output directory if it doesn't exist
-    os.makedirs(CONFIG["OUTPUT_DIR"], exist_ok=True)
-    
-    # Read CSV file into pandas DataFrame and replace NaN with "null"
-    df = pd.read_csv(input_file).fillna("null")
-   
-    # Process valid rules
-    rules = {"ingress": {}, "egress": {}}
-    
-    # Group rules by direction and security group
-    for direction in ["ingress", "egress"]:
-        direction_df = df[df['direction'] == direction]
-        for sg_name, group in direction_df.groupby('security_group_id'):
-            rules[direction][sg_name] = group.to_dict('records')
-    
-    # Get current security groups from CSV
-    all_security_groups = set(rules["ingress"].keys()).union(rules["egress"].keys())
-    
-    # Get existing security group files
-    existing_files = set(f.replace('.json', '') for f in os.listdir(CONFIG["OUTPUT_DIR"]) 
-                        if f.endswith('.json'))
-    
-    # Find security groups that need to be emptied
-    to_empty = existing_files - all_security_groups
-    
-    # Handle security groups no longer in CSV
-    if to_empty:
-        print("\nThe following security groups are no longer in the CSV and will be emptied:")
-        for sg in to_empty:
-            output_file = os.path.join(CONFIG["OUTPUT_DIR"], f"{sg}.json")
-            with open(output_file, "w") as jsonfile:
-                json.dump([], jsonfile, indent=4)
-            print(f"- Cleared rules for: {sg}")
-    
-    # Process current security groups
-    changes_detected = False
-    for sg_name in all_security_groups:
-        # Combine ingress and egress rules for the security group
-        combined_rules = (rules["ingress"].get(sg_name, []) + 
-                         rules["egress"].get(sg_name, []))
-        
-        output_file = os.path.join(CONFIG["OUTPUT_DIR"], f"{sg_name}.json")
-        
-        # Read existing JSON rules for comparison
-        existing_rules = read_existing_json(output_file) or []
-        
-        # Sort combined rules for consistency
-        combined_rules_sorted = sorted(combined_rules, key=lambda x: (
-            x["direction"], str(x["from_port"]), str(x["to_port"]), 
-            x["ip_protocol"], str(x.get("referenced_security_group_id", "")),
-            str(x.get("cidr_ipv4", "")), str(x.get("cidr_ipv6", ""))
-        ))
-        
-        # Overwrite only if rules have changed
-        if rules_changed(existing_rules, combined_rules_sorted):
-            with open(output_file, "w") as jsonfile:
-                json.dump(combined_rules_sorted, jsonfile, indent=4)
-            print(f"Updated: {output_file}")
-            changes_detected = True
-        else:
-            print(f"No changes: {output_file}")
-    
-    print(f"\nJSON files have been synchronized in {CONFIG['OUTPUT_DIR']}")
-
-    # Write rule count to the root folder
-    write_rule_count(rules)
-    
-
-def main():
-    parser = argparse.ArgumentParser(description='Convert firewall rules CSV into json.')
-    parser.add_argument('--input-file', required=True, help='Input CSV file')
-    args = parser.parse_args()
-    process_rules(args.input_file)
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import os
+import json
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, NamedTuple, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_common.loader import read_rules
+from rule_common.quota import DEFAULT_QUOTAS, capacity_report, format_markdown, parse_quota
+from terraform import terraform_document
+from compaction import compact_rules
+from sharding import parse_max_rules, shard_records
+
+
+CONFIG = {
+    "OUTPUT_DIR": "./sg_rules",
+    # sha256sum-format list of the JSON files last written to OUTPUT_DIR
+    "MANIFEST_FILE": "manifest.sha256",
+    # Security group files serialized and written concurrently
+    "WRITE_JOBS": 8,
+    # Groups with more rules than this in either direction are split into <sg>.part-N.json
+    # files (None writes every group to a single file)
+    "MAX_RULES_PER_DIRECTION": None,
+    # Capacity report written next to rule_count.txt, as <name>.md and <name>.json
+    "CAPACITY_REPORT": "capacity_report"
+}
+
+class SyncResult(NamedTuple):
+    sg_name: str
+    output_file: str
+    digest: str
+    written: Optional[int]  # bytes written, None if the file was already up to date
+
+def read_existing_json(file_path: str) -> List[Dict[str, Any]]:
+    """Read existing JSON file if it exists."""
+    if os.path.exists(file_path):
+        with open(file_path, "r") as jsonfile:
+            try:
+                return json.load(jsonfile)
+            except json.JSONDecodeError:
+                print(f"Warning: {file_path} is not a valid JSON. It will be overwritten.")
+    return []
+
+def rules_changed(existing_rules: List[Dict[str, Any]], new_rules: List[Dict[str, Any]]) -> bool:
+    """Compare existing and new rules to determine if updates are needed."""
+    return existing_rules != new_rules
+
+def write_atomic(file_path: str, content: bytes) -> None:
+    """Write content through a temporary file in the same directory and rename it into place,
+    so an interrupted run never leaves a partially written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def read_manifest() -> Dict[str, str]:
+    """Read the manifest in OUTPUT_DIR as {file name: sha256}, or {} if there is none."""
+    manifest_file = os.path.join(CONFIG["OUTPUT_DIR"], CONFIG["MANIFEST_FILE"])
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file, "r") as f:
+            for line in f:
+                digest, _, file_name = line.rstrip("\r\n").partition("  ")
+                if file_name:
+                    manifest[file_name] = digest
+    return manifest
+
+def write_manifest(manifest: Dict[str, str]) -> None:
+    """Write the manifest so `sha256sum -c manifest.sha256` can check OUTPUT_DIR."""
+    manifest_file = os.path.join(CONFIG["OUTPUT_DIR"], CONFIG["MANIFEST_FILE"])
+    lines = "".join(f"{manifest[file_name]}  {file_name}\n" for file_name in sorted(manifest))
+    write_atomic(manifest_file, lines.encode())
+
+def matches_manifest(manifest: Dict[str, str], output_file: str, content: bytes, digest: str) -> bool:
+    """Whether output_file already holds content, judged from the manifest and the file size
+    alone, without opening the file.
+    """
+    if manifest.get(os.path.basename(output_file)) != digest:
+        return False
+    try:
+        return os.path.getsize(output_file) == len(content)
+    except OSError:
+        return False
+
+def write_rule_count(rules, shards=None):
+    """Write the count of rules per security group per direction to rule_count.txt in the root directory,
+    followed by the rules per shard of any sharded groups.
+    """
+    rule_count_file = "rule_count.txt"
+    lines = ["# Security Group Rule Count:\n"]
+    
+    for direction in ["ingress", "egress"]:
+        lines.append(f"\n## {direction.capitalize()} Rules:\n")
+        for sg_name in sorted(rules[direction].keys()):
+            rule_list = rules[direction][sg_name]
+            lines.append(f"- {sg_name} : {len(rule_list)} rules\n")
+
+    if shards:
+        lines.append("\n## Shards:\n")
+        for sg_name in sorted(shards):
+            lines.append(f"- {sg_name} : {len(shards[sg_name])} shards\n")
+            for shard, records in shards[sg_name].items():
+                ingress = sum(1 for rule in records if rule["direction"] == "ingress")
+                lines.append(f"  - {shard_name(sg_name, shard)} : {ingress} ingress, "
+                             f"{len(records) - ingress} egress rules\n")
+    write_atomic(rule_count_file, "".join(lines).encode())
+    
+    print(f"Rule count written to {rule_count_file}")
+
+def write_capacity_report(df: pd.DataFrame, quotas: Dict[str, int] = None) -> None:
+    """Write the quota headroom of every security group in the rule table as markdown and JSON."""
+    report = capacity_report(df, quotas or DEFAULT_QUOTAS)
+    markdown_file = f"{CONFIG['CAPACITY_REPORT']}.md"
+    json_file = f"{CONFIG['CAPACITY_REPORT']}.json"
+    write_atomic(markdown_file, format_markdown(report).encode())
+    write_atomic(json_file, (json.dumps(report, indent=4) + "\n").encode())
+    if report["over_quota"]:
+        print(f"Warning: over quota: {', '.join(report['over_quota'])}")
+    print(f"Capacity report written to {markdown_file} and {json_file}")
+
+
+# Order of rules within a security group file; ties keep CSV order
+SORT_COLUMNS = ["direction", "from_port", "to_port", "ip_protocol",
+                "referenced_security_group_id", "cidr_ipv4", "cidr_ipv6"]
+
+def _string_order(column: pd.Series) -> pd.Series:
+    """Rank each value by its str() form, so ports and other typed columns sort as text,
+    the way rules are ordered in the JSON files. Only the distinct values are converted.
+    """
+    codes, uniques = pd.factorize(column)
+    text = np.array([str(value) for value in uniques], dtype=str)
+    ranks = np.empty(len(uniques), dtype=np.int64)
+    ranks[np.argsort(text, kind="stable")] = np.arange(len(uniques))
+    return pd.Series(ranks[codes], index=column.index)
+
+def group_rules(df: pd.DataFrame) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Group rule rows by direction and security group, each group's records already in
+    output order: one stable sort of the whole table, then one groupby over both keys.
+    """
+    rules = {"ingress": {}, "egress": {}}
+    df = df[df['direction'].isin(["ingress", "egress"])]
+    df = df.sort_values(["security_group_id"] + SORT_COLUMNS, key=_string_order, kind="stable")
+
+    # Build records straight from column lists instead of per-group to_dict calls
+    columns = list(df.columns)
+    values = [df[column].tolist() for column in columns]
+    records = [dict(zip(columns, row)) for row in zip(*values)]
+
+    groups = df.groupby(['security_group_id', 'direction'], observed=True, sort=False).indices
+    for (sg_name, direction), positions in groups.items():
+        rules[direction][sg_name] = records[positions[0]:positions[-1] + 1]
+    return rules
+
+
+def security_group_rules(rules: Dict[str, Dict[str, List[Dict[str, Any]]]], sg_name: str) -> List[Dict[str, Any]]:
+    """Combine a security group's rules in file order; each direction is already sorted and egress sorts first."""
+    return rules["egress"].get(sg_name, []) + rules["ingress"].get(sg_name, [])
+
+
+def shard_name(sg_name: str, shard: int) -> str:
+    """File name, without .json, of one shard of a security group."""
+    return f"{sg_name}.part-{shard}"
+
+
+def shard_groups(rules: Dict[str, Dict[str, List[Dict[str, Any]]]],
+                 max_rules: int = None) -> Dict[str, Dict[int, List[Dict[str, Any]]]]:
+    """Shards of every security group with more than max_rules rules in a direction, as
+    {sg: {shard number: records}}. Groups within the cap, or any group when max_rules is
+    None, are left out.
+    """
+    if not max_rules:
+        return {}
+    shards = {}
+    for sg_name in sorted(set(rules["ingress"]).union(rules["egress"])):
+        parts = shard_records(security_group_rules(rules, sg_name), max_rules)
+        if len(parts) > 1:
+            shards[sg_name] = parts
+    return shards
+
+
+def output_files(rules: Dict[str, Dict[str, List[Dict[str, Any]]]],
+                 shards: Dict[str, Dict[int, List[Dict[str, Any]]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Map each JSON file to write, by name without .json, to its rules in file order."""
+    outputs = {}
+    for sg_name in set(rules["ingress"]).union(rules["egress"]):
+        if sg_name in shards:
+            for shard, records in shards[sg_name].items():
+                outputs[shard_name(sg_name, shard)] = records
+        else:
+            outputs[sg_name] = security_group_rules(rules, sg_name)
+    return outputs
+
+
+def read_bytes(file_path: str) -> bytes:
+    """Return the file's content, or None if it does not exist."""
+    try:
+        with open(file_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def sync_rules(rules: Dict[str, Dict[str, List[Dict[str, Any]]]], jobs: int = None, max_rules: int = None) -> None:
+    """Write each security group's rules, as returned by group_rules, to OUTPUT_DIR, empty the
+    files of groups no longer present, and write the rule count. Groups are serialized and
+    written by a pool of `jobs` threads (CONFIG["WRITE_JOBS"] by default); every file is
+    replaced atomically. Groups over max_rules rules in a direction (CONFIG["MAX_RULES_PER_DIRECTION"]
+    by default) are written as <sg>.part-N.json shards instead of <sg>.json.
+    """
+    # Create output directory if it doesn't exist
+    os.makedirs(CONFIG["OUTPUT_DIR"], exist_ok=True)
+    
+    # Get current output files (security groups, or their shards) from CSV
+    shards = shard_groups(rules, max_rules or CONFIG["MAX_RULES_PER_DIRECTION"])
+    outputs = output_files(rules, shards)
+    all_outputs = set(outputs)
+    
+    # Get existing security group files
+    existing_files = set(f.replace('.json', '') for f in os.listdir(CONFIG["OUTPUT_DIR"]) 
+                        if f.endswith('.json'))
+    
+    # Find security groups that need to be emptied
+    to_empty = existing_files - all_outputs
+    
+    # Groups whose serialized rules hash to the manifest entry are skipped without reading their file
+    manifest = read_manifest()
+    empty_content = json.dumps([], indent=4).encode()
+    empty_digest = hashlib.sha256(empty_content).hexdigest()
+
+    def sync_group(sg_name: str) -> SyncResult:
+        """Serialize one group's rules and write them if they changed. Runs on the writer pool."""
+        output_file = os.path.join(CONFIG["OUTPUT_DIR"], f"{sg_name}.json")
+        if sg_name in to_empty:
+            if matches_manifest(manifest, output_file, empty_content, empty_digest):
+                return SyncResult(sg_name, output_file, empty_digest, None)
+            write_atomic(output_file, empty_content)
+            return SyncResult(sg_name, output_file, empty_digest, len(empty_content))
+
+        combined_rules_sorted = outputs[sg_name]
+        content = json.dumps(combined_rules_sorted, indent=4).encode()
+        digest = hashlib.sha256(content).hexdigest()
+
+        if f"{sg_name}.json" in manifest:
+            unchanged = matches_manifest(manifest, output_file, content, digest)
+        else:
+            # Not in the manifest yet, so compare against the existing file's rules
+            unchanged = not rules_changed(read_existing_json(output_file) or [], combined_rules_sorted)
+        if unchanged:
+            return SyncResult(sg_name, output_file, digest, None)
+        write_atomic(output_file, content)
+        return SyncResult(sg_name, output_file, digest, len(content))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, jobs or CONFIG["WRITE_JOBS"])) as pool:
+        emptied = list(pool.map(sync_group, sorted(to_empty)))
+        current = list(pool.map(sync_group, sorted(all_outputs)))
+    elapsed = time.perf_counter() - start
+
+    # Report in a stable order once every write has finished
+    cleared = [result.sg_name for result in emptied if result.written is not None]
+    if cleared:
+        print("\nThe following security groups are no longer in the CSV and will be emptied:")
+        for sg in cleared:
+            print(f"- Cleared rules for: {sg}")
+    for result in current:
+        print(f"{'Updated' if result.written is not None else 'No changes'}: {result.output_file}")
+
+    written = [result.written for result in emptied + current if result.written is not None]
+    rate = f"{len(written) / elapsed:,.0f} files/s" if elapsed > 0 else "n/a"
+    print(f"\nWrote {len(written)} of {len(emptied) + len(current)} files "
+          f"({sum(written) / 1e6:.2f} MB) in {elapsed:.3f}s ({rate})")
+
+    new_manifest = {f"{result.sg_name}.json": result.digest for result in emptied + current}
+    if new_manifest != manifest:
+        write_manifest(new_manifest)
+    print(f"\nJSON files have been synchronized in {CONFIG['OUTPUT_DIR']}")
+
+    # Write rule count to the root folder
+    write_rule_count(rules, shards)
+
+
+def sync_terraform(rules: Dict[str, Dict[str, List[Dict[str, Any]]]], terraform_dir: str, jobs: int = None) -> None:
+    """Write each security group's rules, as returned by group_rules, to terraform_dir as
+    <sg>.tf.json security group rule resources. Files of groups no longer present are emptied
+    and files whose content is unchanged are left alone.
+    """
+    os.makedirs(terraform_dir, exist_ok=True)
+    all_security_groups = set(rules["ingress"].keys()).union(rules["egress"].keys())
+    stale = set(f[:-len(".tf.json")] for f in os.listdir(terraform_dir)
+                if f.endswith(".tf.json")) - all_security_groups
+
+    def sync_group(sg_name: str) -> bool:
+        records = [] if sg_name in stale else security_group_rules(rules, sg_name)
+        content = json.dumps(terraform_document(records), indent=2).encode()
+        output_file = os.path.join(terraform_dir, f"{sg_name}.tf.json")
+        if read_bytes(output_file) == content:
+            return False
+        write_atomic(output_file, content)
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs or CONFIG["WRITE_JOBS"])) as pool:
+        changed = list(pool.map(sync_group, sorted(stale | all_security_groups)))
+    print(f"Terraform files updated: {sum(changed)} of {len(changed)} in {terraform_dir}")
+
+
+def process_rules(input_file: str, snapshot_dir: str = None, jobs: int = None, terraform_dir: str = None,
+                  compact: bool = False, max_rules: int = None, quotas: Dict[str, int] = None) -> None:
+    """Main function to process rules into JSON.
+    With a snapshot_dir, a snapshot left by rule_validation for the same CSV content is reused.
+    With a terraform_dir, the same rules are also written as .tf.json resources.
+    With compact, adjacent port ranges and CIDRs of otherwise identical rules are merged first.
+    With max_rules, groups over that many rules in a direction are split into shards.
+    With quotas, a capacity report against them is written as well.
+    """
+    # Read CSV file with the shared typed schema; missing cells are filled as "null"
+    df = read_rules(input_file, snapshot_dir=snapshot_dir)
+    rules = group_rules(df)
+    if compact:
+        rules = compact_rules(rules, SORT_COLUMNS)
+    sync_rules(rules, jobs, max_rules)
+    if quotas is not None:
+        write_capacity_report(df, quotas)
+    if terraform_dir:
+        sync_terraform(rules, terraform_dir, jobs)
+    
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert firewall rules CSV into json.')
+    parser.add_argument('--input-file', required=True, help='Input CSV file')
+    parser.add_argument('--snapshot-dir', help='Reuse (or save) a parsed snapshot of the CSV keyed by its content hash')
+    parser.add_argument('--jobs', type=int, help=f'Write security group files in this many threads (default: {CONFIG["WRITE_JOBS"]})')
+    parser.add_argument('--terraform-dir', help='Also write each security group as <sg>.tf.json Terraform resources here')
+    parser.add_argument('--compact', action='store_true',
+                        help='Merge adjacent port ranges and CIDRs of otherwise identical rules, keeping their RequestIDs')
+    parser.add_argument('--max-rules-per-direction', type=parse_max_rules,
+                        help='Split groups with more rules than this in a direction into <sg>.part-N.json shards')
+    parser.add_argument('--capacity-report', action='store_true',
+                        help=f'Also write quota headroom per security group to {CONFIG["CAPACITY_REPORT"]}.md and .json')
+    parser.add_argument('--quota', type=parse_quota, action='append', default=[], metavar='NAME=VALUE',
+                        help=f'Override a quota for --capacity-report (defaults: '
+                             f'{", ".join(f"{k}={v}" for k, v in DEFAULT_QUOTAS.items())})')
+    args = parser.parse_args()
+    quotas = dict(DEFAULT_QUOTAS, **dict(args.quota)) if args.capacity_report else None
+    process_rules(args.input_file, args.snapshot_dir, args.jobs, args.terraform_dir, args.compact,
+                  args.max_rules_per_direction, quotas)
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""Splitting of oversized security groups into shards of at most max_rules rules per direction.
+
+Each rule is placed by a hash of its identity fields (see terraform.identity_digest), read as
+a path in a binary trie: a node holding more than max_rules ingress or egress rules splits
+its rules in two by the next bit of the hash. The leaves are the shards, numbered the way a
+binary heap numbers its nodes (the root is 1, the children of n are 2n and 2n + 1).
+
+A shard's rules and number depend only on the rules in its own hash range, so adding or
+removing a rule rewrites the one shard it falls in (or, when that shard splits or its two
+halves rejoin, only those shards), and editing a rule's name or justification rewrites only
+its own shard.
+"""
+import argparse
+from typing import Any, Dict, List
+
+from terraform import identity_digest
+
+# Hash bits a group can be split on; rules with identical identities can never be separated
+KEY_BITS = 64
+
+
+def parse_max_rules(text: str) -> int:
+    """argparse type for --max-rules-per-direction."""
+    try:
+        number = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"needs a positive integer, got {text!r}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"needs a positive integer, got {text!r}")
+    return number
+
+
+def _key(rule: Dict[str, Any]) -> int:
+    return int(identity_digest(rule)[:KEY_BITS // 4], 16)
+
+
+def _over(records: List[Dict[str, Any]], max_rules: int) -> bool:
+    ingress = sum(1 for rule in records if rule["direction"] == "ingress")
+    return ingress > max_rules or len(records) - ingress > max_rules
+
+
+def shard_records(records: List[Dict[str, Any]], max_rules: int) -> Dict[int, List[Dict[str, Any]]]:
+    """Split one security group's records into {shard number: records}, each keeping the
+    records' order. A group within max_rules per direction is the single shard 1.
+    """
+    if max_rules < 1:
+        # Every node, even an empty one, would be over the cap and split down to KEY_BITS
+        raise ValueError(f"max_rules must be a positive integer, got {max_rules}")
+    if not _over(records, max_rules):
+        return {1: records}
+    shards = {}
+    pending = [(1, 0, [(_key(rule), rule) for rule in records])]
+    while pending:
+        node, depth, members = pending.pop()
+        if depth == KEY_BITS or not _over([rule for _, rule in members], max_rules):
+            if members:
+                shards[node] = [rule for _, rule in members]
+            continue
+        bit = KEY_BITS - 1 - depth
+        pending.append((2 * node, depth + 1, [m for m in members if not m[0] >> bit & 1]))
+        pending.append((2 * node + 1, depth + 1, [m for m in members if m[0] >> bit & 1]))
+    return dict(sorted(shards.items()))
@@ -0,0 +1,96 @@
+"""Terraform JSON (.tf.json) output for rule_conversion.
+
+Each rule becomes an aws_vpc_security_group_ingress_rule or aws_vpc_security_group_egress_rule
+resource. Resource names are derived from the fields AWS identifies a rule by (security group,
+direction, protocol, ports and source), so a plan only replaces rules whose content changed;
+the rule name, RequestID and justification are tags and a description, which update in place.
+Security group and prefix list names are resolved through map variables the including
+configuration declares.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, List
+
+RESOURCE_TYPES = {
+    "ingress": "aws_vpc_security_group_ingress_rule",
+    "egress": "aws_vpc_security_group_egress_rule",
+}
+
+# Terraform expressions for names used in firewall_rules.csv
+SECURITY_GROUP_REF = '${{var.security_group_ids["{}"]}}'
+PREFIX_LIST_REF = '${{var.prefix_list_ids["{}"]}}'
+
+IDENTITY_FIELDS = ["security_group_id", "direction", "ip_protocol", "from_port", "to_port",
+                   "referenced_security_group_id", "cidr_ipv4", "cidr_ipv6", "prefix_list_id"]
+
+# AWS limit on security group rule descriptions
+MAX_DESCRIPTION = 255
+
+
+def _is_set(value) -> bool:
+    return str(value).lower() != "null"
+
+
+def identity_digest(rule: Dict[str, Any]) -> str:
+    """SHA-256 hex digest of the rule's identity fields; unchanged when only its name,
+    RequestID or justification change.
+    """
+    identity = json.dumps([str(rule.get(field, "null")) for field in IDENTITY_FIELDS])
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def resource_name(rule: Dict[str, Any]) -> str:
+    """Stable resource name: the security group name plus a hash of the rule's identity fields."""
+    digest = identity_digest(rule)[:16]
+    name = re.sub(r"[^A-Za-z0-9_-]", "_", str(rule["security_group_id"]))
+    if not re.match(r"[A-Za-z_]", name):
+        name = f"_{name}"
+    return f"{name}_{digest}"
+
+
+def rule_resource(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """Arguments of the security group rule resource for one rule record."""
+    resource = {
+        "security_group_id": SECURITY_GROUP_REF.format(rule["security_group_id"]),
+        "ip_protocol": str(rule["ip_protocol"]),
+    }
+    # Protocol -1 covers every port, and AWS rejects ports on it
+    if str(rule["ip_protocol"]) != "-1":
+        resource["from_port"] = int(rule["from_port"])
+        resource["to_port"] = int(rule["to_port"])
+
+    if _is_set(rule.get("referenced_security_group_id", "null")):
+        resource["referenced_security_group_id"] = SECURITY_GROUP_REF.format(rule["referenced_security_group_id"])
+    if _is_set(rule.get("cidr_ipv4", "null")):
+        resource["cidr_ipv4"] = str(rule["cidr_ipv4"])
+    if _is_set(rule.get("cidr_ipv6", "null")):
+        resource["cidr_ipv6"] = str(rule["cidr_ipv6"])
+    if _is_set(rule.get("prefix_list_id", "null")):
+        resource["prefix_list_id"] = PREFIX_LIST_REF.format(rule["prefix_list_id"])
+
+    if _is_set(rule.get("business_justification", "null")):
+        resource["description"] = str(rule["business_justification"]).strip()[:MAX_DESCRIPTION]
+    # Compacted rules list every RequestID they were merged from
+    request_ids = rule.get("source_request_ids", [rule["RequestID"]])
+    resource["tags"] = {"Name": str(rule["name"]), "RequestID": " ".join(str(i) for i in request_ids)}
+    return resource
+
+
+def terraform_document(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the .tf.json document for one security group's rule records.
+    Rules with the same identity (which AWS would reject as duplicates) get numbered suffixes
+    in record order.
+    """
+    resources = {resource_type: {} for resource_type in RESOURCE_TYPES.values()}
+    for rule in records:
+        by_name = resources[RESOURCE_TYPES[rule["direction"]]]
+        base = name = resource_name(rule)
+        suffix = 2
+        while name in by_name:
+            name = f"{base}_{suffix}"
+            suffix += 1
+        by_name[name] = rule_resource(rule)
+
+    resources = {resource_type: by_name for resource_type, by_name in resources.items() if by_name}
+    return {"resource": resources} if resources else {}
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Validate firewall_rules.csv and, only if it passes, convert it to sg_rules/*.json.
+
+Runs rule_validation/validate.py and rule_conversion/convert.py in one process over the same
+in-memory table, so pandas is imported and the CSV parsed and grouped once instead of twice.
+The separate validate.py and convert.py CLIs are unchanged.
+"""
+import argparse
+import os
+import sys
+from typing import Dict
+from pandas.errors import EmptyDataError, ParserError
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "rule_validation"))
+sys.path.insert(0, os.path.join(ROOT, "rule_conversion"))
+from rule_common.loader import read_rules
+from rule_common.quota import DEFAULT_QUOTAS, parse_quota
+from validate import MissingColumnsError, ValidationProfile, count_errors, print_report, validate_table
+from convert import SORT_COLUMNS, group_rules, sync_rules, sync_terraform, write_capacity_report
+from compaction import compact_rules
+from sharding import parse_max_rules
+
+
+def run_pipeline(input_file: str, snapshot_dir: str = None, max_errors: int = None, fail_fast: bool = False,
+                 jobs: int = 1, profile: ValidationProfile = None, check_shadowing: bool = False,
+                 terraform_dir: str = None, compact: bool = False, max_rules: int = None,
+                 quotas: Dict[str, int] = None, check_quotas: bool = False, capacity_report: bool = False,
+                 check_references: bool = False, check_pairing: bool = False) -> bool:
+    """Validate input_file and write the JSON outputs (and .tf.json files to terraform_dir, if
+    given) when it passed. Returns whether it passed.
+    With check_quotas, rules taking a security group over quotas (or the defaults) fail
+    validation; with capacity_report, the headroom against them is written next to rule_count.txt.
+    """
+    try:
+        df = read_rules(input_file, snapshot_dir=snapshot_dir)
+        issues = validate_table(df, max_errors, fail_fast, jobs, profile, check_shadowing,
+                                (quotas or DEFAULT_QUOTAS) if check_quotas else None, check_references,
+                                check_pairing)
+    except ParserError as e:
+        print("Error: malformed CSV input.")
+        print(f"Details: {e}")
+        return False
+    except MissingColumnsError as e:
+        print(f"Error: {e}")
+        return False
+    except (OSError, UnicodeDecodeError, EmptyDataError) as e:
+        # Only failures to read the input; errors in the checks themselves keep their traceback
+        print("Error: could not read CSV.")
+        print(f"Details: {e}")
+        return False
+
+    if profile is not None:
+        print(profile.report(), file=sys.stderr)
+    stopped_early = bool(issues) and (fail_fast or count_errors(issues) == max_errors)
+    print_report(issues, "text", stopped_early)
+    if issues:
+        return False
+
+    print()
+    rules = group_rules(df)
+    if compact:
+        rules = compact_rules(rules, SORT_COLUMNS)
+    sync_rules(rules, max_rules=max_rules)
+    if capacity_report:
+        write_capacity_report(df, quotas)
+    if terraform_dir:
+        sync_terraform(rules, terraform_dir)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate firewall rules CSV and convert it into json.')
+    parser.add_argument('--input-file', required=True, help='Input CSV file')
+    parser.add_argument('--snapshot-dir', help='Reuse (or save) a parsed snapshot of the CSV keyed by its content hash')
+    parser.add_argument('--check-shadowing', action='store_true',
+                        help='Also fail on rules shadowed by or overlapping another rule')
+    parser.add_argument('--max-errors', type=int, default=0,
+                        help='Stop validating once this many errors are found (default: no limit)')
+    parser.add_argument('--fail-fast', action='store_true', help='Stop after the first check that reports errors')
+    parser.add_argument('--jobs', type=int, default=1, help='Run validators concurrently in this many threads; once the error cap is reached, validators already running still finish')
+    parser.add_argument('--profile', action='store_true', help='Print wall time and row throughput per validator to stderr')
+    parser.add_argument('--terraform-dir', help='Also write each security group as <sg>.tf.json Terraform resources here')
+    parser.add_argument('--compact', action='store_true',
+                        help='Merge adjacent port ranges and CIDRs of otherwise identical rules, keeping their RequestIDs')
+    parser.add_argument('--max-rules-per-direction', type=parse_max_rules,
+                        help='Split groups with more rules than this in a direction into <sg>.part-N.json shards')
+    parser.add_argument('--check-references', action='store_true',
+                        help='Also fail rules referencing a security group no rule defines')
+    parser.add_argument('--check-pairing', action='store_true',
+                        help='Also fail SG-to-SG rules without the matching rule on the peer group')
+    parser.add_argument('--check-quotas', action='store_true',
+                        help='Also fail rules that take a security group over its rules quota')
+    parser.add_argument('--capacity-report', action='store_true',
+                        help='Also write quota headroom per security group next to rule_count.txt')
+    parser.add_argument('--quota', type=parse_quota, action='append', default=[], metavar='NAME=VALUE',
+                        help=f'Override a quota (defaults: {", ".join(f"{k}={v}" for k, v in DEFAULT_QUOTAS.items())})')
+    args = parser.parse_args()
+    quotas = dict(DEFAULT_QUOTAS, **dict(args.quota))
+
+    passed = run_pipeline(args.input_file, args.snapshot_dir, args.max_errors if args.max_errors > 0 else None,
+                          args.fail_fast, args.jobs, ValidationProfile() if args.profile else None,
+                          args.check_shadowing, args.terraform_dir, args.compact,
+                          args.max_rules_per_direction, quotas, args.check_quotas, args.capacity_report,
+                          args.check_references, args.check_pairing)
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
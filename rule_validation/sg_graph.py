@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Security group reference graph.
+
+Every rule with a referenced_security_group_id is an edge between two groups, built in one
+pass over the rule table: an ingress rule on X referencing Y lets Y send to X, an egress rule
+on X referencing Y lets X send to Y. Each edge keeps the protocol and port range of the rules
+behind it and which side (ingress on the receiver, egress on the sender) they are on, so
+reachability questions are answered from the index instead of rescanning sg_rules/*.json.
+
+Run as a script to summarize the graph or answer a reachability query:
+    python sg_graph.py --input-file firewall_rules.csv
+    python sg_graph.py --input-file firewall_rules.csv --reach cluster_endpoint --port 443
+"""
+import argparse
+import os
+import sys
+from typing import Dict, List, Any, NamedTuple, Set, Tuple
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_common.errors import row_errors
+from rule_common.loader import read_rules
+
+
+class Grant(NamedTuple):
+    side: str  # "ingress" (rule on the receiver) or "egress" (rule on the sender)
+    protocol: str
+    from_port: Any
+    to_port: Any
+    position: int  # row position in the rule table
+
+    def allows(self, protocol: str, port: int) -> bool:
+        if self.protocol == "-1":
+            return True
+        if self.protocol != protocol:
+            return False
+        try:
+            return int(self.from_port) <= port <= int(self.to_port)
+        except (ValueError, TypeError):
+            return False
+
+
+class ReferenceGraph:
+    """Adjacency index of security group references in a rule table."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.groups: Set[str] = set(df["security_group_id"].astype(str))
+        self.edges: Dict[Tuple[str, str], List[Grant]] = {}
+        self.successors: Dict[str, Set[str]] = {}
+        self.predecessors: Dict[str, Set[str]] = {}
+
+        references = df["referenced_security_group_id"].astype(str).to_numpy()
+        sgs = df["security_group_id"].astype(str).to_numpy()
+        directions = df["direction"].astype(str).str.lower().to_numpy()
+        protocols = df["ip_protocol"].astype(str).str.lower().to_numpy()
+        from_ports = df["from_port"].to_numpy()
+        to_ports = df["to_port"].to_numpy()
+
+        for pos in (references != "null").nonzero()[0]:
+            reference, sg = references[pos], sgs[pos]
+            if directions[pos] == "ingress":
+                sender, receiver = reference, sg
+            elif directions[pos] == "egress":
+                sender, receiver = sg, reference
+            else:
+                continue
+            grant = Grant(directions[pos], protocols[pos], from_ports[pos], to_ports[pos], int(pos))
+            self.edges.setdefault((sender, receiver), []).append(grant)
+            self.successors.setdefault(sender, set()).add(receiver)
+            self.predecessors.setdefault(receiver, set()).add(sender)
+
+    @property
+    def nodes(self) -> Set[str]:
+        return self.groups | set(self.successors) | set(self.predecessors)
+
+    def fan_in(self, sg: str) -> int:
+        """Number of groups that send to sg."""
+        return len(self.predecessors.get(sg, ()))
+
+    def fan_out(self, sg: str) -> int:
+        """Number of groups sg sends to."""
+        return len(self.successors.get(sg, ()))
+
+    def strongly_connected_components(self) -> List[List[str]]:
+        """Groups that can all reach each other through references (iterative Tarjan), largest
+        first. Single groups are only included when they reference themselves.
+        """
+        index, low, on_stack = {}, {}, set()
+        stack, components = [], []
+        for root in sorted(self.nodes):
+            if root in index:
+                continue
+            work = [(root, iter(sorted(self.successors.get(root, ()))))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(sorted(self.successors.get(child, ())))))
+                    elif child in on_stack:
+                        low[node] = min(low[node], index[child])
+                    continue
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in self.successors.get(node, ()):
+                        components.append(sorted(component))
+        return sorted(components, key=lambda c: (-len(c), c))
+
+    def who_can_reach(self, target: str, port: int, protocol: str = "tcp") -> List[Dict[str, Any]]:
+        """Groups that can send to target on protocol/port, and which side allows it. AWS only
+        lets the traffic through when both the receiver's ingress and the sender's egress do.
+        """
+        protocol = protocol.lower()
+        results = []
+        for sender in sorted(self.predecessors.get(target, ())):
+            grants = [g for g in self.edges[(sender, target)] if g.allows(protocol, port)]
+            sides = {g.side for g in grants}
+            if sides:
+                results.append({
+                    "security_group_id": sender,
+                    "ingress": "ingress" in sides,
+                    "egress": "egress" in sides,
+                    "positions": sorted(g.position for g in grants),
+                })
+        return results
+
+
+def find_unknown_references(df: pd.DataFrame, line_numbers) -> Dict[str, List[Dict[str, Any]]]:
+    """Report rules whose referenced_security_group_id is not a security_group_id in the table."""
+    references = df["referenced_security_group_id"].astype(str)
+    unknown = (references != "null") & ~references.isin(set(df["security_group_id"].astype(str)))
+    if not unknown.any():
+        return {}
+    positions = np.flatnonzero(unknown.to_numpy())
+    references = references.to_numpy()
+    return {"unknown_security_group_references": row_errors(
+        df, line_numbers, positions,
+        [f"Referenced security group {references[pos]} is not defined by any rule" for pos in positions])}
+
+
+def _pair_keys(df: pd.DataFrame, sender: pd.Series, receiver: pd.Series) -> pd.MultiIndex:
+    return pd.MultiIndex.from_arrays([
+        sender.to_numpy(), receiver.to_numpy(),
+        df["ip_protocol"].astype(str).str.lower().to_numpy(),
+        df["from_port"].astype(str).to_numpy(), df["to_port"].astype(str).to_numpy(),
+    ])
+
+
+def find_unpaired_rules(df: pd.DataFrame, line_numbers) -> Dict[str, List[Dict[str, Any]]]:
+    """Report SG-to-SG rules without a matching rule on the peer: an ingress rule on B referencing
+    A needs an egress rule on A referencing B with the same protocol and ports, and vice versa.
+    A protocol -1 rule on the other side pairs with any rule between the same two groups.
+    Both sides are hash-joined on (sender, receiver, protocol, from_port, to_port), so the check
+    is linear in the number of rules. References to groups no rule defines are left to
+    find_unknown_references.
+    """
+    references = df["referenced_security_group_id"].astype(str)
+    sgs = df["security_group_id"].astype(str)
+    directions = df["direction"].astype(str).str.lower()
+    protocols = df["ip_protocol"].astype(str).str.lower()
+    candidate = (references != "null") & references.isin(set(sgs))
+    ingress = (candidate & (directions == "ingress")).to_numpy()
+    egress = (candidate & (directions == "egress")).to_numpy()
+
+    # Key every rule by the traffic it allows: sender, receiver, protocol and ports
+    sender = sgs.where(directions == "egress", references)
+    receiver = references.where(directions == "egress", sgs)
+    keys = _pair_keys(df, sender, receiver)
+    pairs = pd.MultiIndex.from_arrays([sender.to_numpy(), receiver.to_numpy()])
+    any_protocol = (protocols == "-1").to_numpy()
+
+    unpaired = np.zeros(len(df), dtype=bool)
+    for side, other in ((ingress, egress), (egress, ingress)):
+        matched = keys[side].isin(keys[other]) | pairs[side].isin(pairs[other & any_protocol])
+        unpaired[np.flatnonzero(side)[~matched]] = True
+    if not unpaired.any():
+        return {}
+
+    peers = references.to_numpy()
+    expected = np.where(ingress, "egress", "ingress")
+    positions = np.flatnonzero(unpaired)
+    return {"unpaired_rules": row_errors(
+        df, line_numbers, positions,
+        [f"No matching {expected[pos]} rule on {peers[pos]} referencing {sgs.iat[pos]}" for pos in positions])}
+
+
+def print_summary(graph: ReferenceGraph, top: int = 10) -> None:
+    print(f"Security groups: {len(graph.groups)}, reference edges: {len(graph.edges)}")
+    unknown = sorted(graph.nodes - graph.groups)
+    if unknown:
+        print(f"Unknown referenced groups: {', '.join(unknown)}")
+    components = graph.strongly_connected_components()
+    print(f"\nStrongly connected components: {len(components)}")
+    for component in components:
+        print(f"- {', '.join(component)}")
+    for label, degree in (("fan-in", graph.fan_in), ("fan-out", graph.fan_out)):
+        ranked = sorted(graph.nodes, key=lambda sg: (-degree(sg), sg))[:top]
+        print(f"\nHighest {label}:")
+        for sg in ranked:
+            print(f"- {sg} : {degree(sg)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize or query security group references in a firewall rules CSV.')
+    parser.add_argument('--input-file', required=True, help='Input CSV file')
+    parser.add_argument('--snapshot-dir', help='Reuse (or save) a parsed snapshot of the CSV keyed by its content hash')
+    parser.add_argument('--reach', metavar='SG', help='List the groups that can send to SG')
+    parser.add_argument('--port', type=int, help='Port for --reach')
+    parser.add_argument('--protocol', default='tcp', help='Protocol for --reach (default: tcp)')
+    args = parser.parse_args()
+    if args.reach and args.port is None:
+        parser.error("--reach needs --port")
+
+    df = read_rules(args.input_file, snapshot_dir=args.snapshot_dir)
+    graph = ReferenceGraph(df)
+    if not args.reach:
+        print_summary(graph)
+        return
+
+    results = graph.who_can_reach(args.reach, args.port, args.protocol)
+    print(f"Groups that can reach {args.reach} on {args.protocol}/{args.port}:")
+    if not results:
+        print("- none")
+    for result in results:
+        if result["ingress"] and result["egress"]:
+            allowed = "allowed"
+        else:
+            allowed = f"{'ingress' if result['ingress'] else 'egress'} only"
+        lines = ", ".join(str(pos + 2) for pos in result["positions"])
+        print(f"- {result['security_group_id']} : {allowed} (lines {lines})")
+
+if __name__ == "__main__":
+    main()
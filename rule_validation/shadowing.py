@@ -0,0 +1,169 @@
+"""Shadowed and overlapping rule detection.
+
+A rule is shadowed when another rule on the same security group and direction already
+allows all of its traffic: the protocol matches (or the other rule is protocol -1), the
+port range contains its port range, and the source contains its source. CIDR sources are
+encoded as integer address intervals; since CIDR blocks are either nested or disjoint, the
+blocks containing a rule form a chain of at most 129 ancestors, found with a single sorted
+sweep. Each block keeps its port ranges sorted by from_port with a running max of to_port,
+so every containment probe is a binary search and the whole pass is O(n log n).
+"""
+import os
+import sys
+from bisect import bisect_right
+from typing import Dict, List, Any
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_common.cidr import parse_cidr
+from rule_common.errors import row_errors
+from rule_common.loader import parse_port
+
+ANY_PORT = (0, 65535)
+SOURCE_FIELDS = [
+    ("referenced_security_group_id", "sg"),
+    ("cidr_ipv4", "ipv4"),
+    ("cidr_ipv6", "ipv6"),
+    ("prefix_list_id", "prefix_list"),
+]
+
+
+def _address_interval(cidr: str, version: int):
+    """Return (first, last) integer addresses of a cidr string, or None if it does not parse."""
+    parsed = parse_cidr(cidr)
+    if parsed is None or parsed.version != version:
+        return None
+    return parsed.network, parsed.last
+
+
+class _PortRanges:
+    """Port ranges of one (source block, protocol), sorted by from_port with a running max of to_port."""
+
+    def __init__(self, ranges):
+        # ranges: (from_port, to_port, position) tuples; ties on from_port put the widest first
+        self.ranges = sorted(ranges, key=lambda r: (r[0], -r[1]))
+        self.starts = [r[0] for r in self.ranges]
+        self.widest = []
+        widest = None
+        for r in self.ranges:
+            if widest is None or r[1] > widest[1]:
+                widest = r
+            self.widest.append(widest)
+
+    def covering(self, from_port: int, to_port: int, end: int = None):
+        """Return the position of a rule whose range contains [from_port, to_port].
+        Only the first `end` sorted ranges are considered when given.
+        """
+        if end is None:
+            end = bisect_right(self.starts, from_port)
+        if end and self.widest[end - 1][1] >= to_port:
+            return self.widest[end - 1][2]
+        return None
+
+    def overlapping(self, index: int):
+        """Return the position of an earlier-starting rule that partially overlaps range `index`."""
+        from_port, to_port, _ = self.ranges[index]
+        if index and from_port <= self.widest[index - 1][1] < to_port:
+            return self.widest[index - 1][2]
+        return None
+
+
+def _rule_boxes(df: pd.DataFrame):
+    """Yield (position, group, address interval, protocol key, port range) for each analyzable rule."""
+    columns = {field: df[field].astype(str).to_numpy() for field, _ in SOURCE_FIELDS}
+    sgs = df["security_group_id"].astype(str).to_numpy()
+    directions = df["direction"].astype(str).str.lower().to_numpy()
+    protocols = df["ip_protocol"].astype(str).str.lower().to_numpy()
+    from_ports = df["from_port"].to_numpy()
+    to_ports = df["to_port"].to_numpy()
+
+    for pos in range(len(df)):
+        sources = [(kind, columns[field][pos]) for field, kind in SOURCE_FIELDS
+                   if columns[field][pos].lower() != "null"]
+        if len(sources) != 1:
+            continue
+        kind, value = sources[0]
+        if kind in ("ipv4", "ipv6"):
+            interval = _address_interval(value, 4 if kind == "ipv4" else 6)
+            if interval is None:
+                continue
+            group = (sgs[pos], directions[pos], kind, None)
+        else:
+            interval = (0, 0)
+            group = (sgs[pos], directions[pos], kind, value)
+
+        protocol = protocols[pos]
+        from_port, to_port = parse_port(from_ports[pos]), parse_port(to_ports[pos])
+        if protocol == "-1":
+            yield pos, group, interval, "-1", ANY_PORT
+        elif from_port is None or to_port is None:
+            continue
+        elif protocol == "icmp":
+            # ICMP from/to are type and code, which only match exactly
+            yield pos, group, interval, ("icmp", from_port, to_port), (0, 0)
+        elif protocol in ("tcp", "udp") and from_port <= to_port:
+            yield pos, group, interval, protocol, (from_port, to_port)
+
+
+def find_shadowed_rules(df: pd.DataFrame, line_numbers) -> Dict[str, List[Dict[str, Any]]]:
+    """Report rules fully covered by another rule, and rules whose port range partially
+    overlaps another rule with the same source and protocol.
+    """
+    def line_of(pos):
+        return line_numbers.get(df.index[pos], "Unknown")
+
+    shadowed, overlapping = {}, {}
+
+    # Identical boxes shadow each other; keep the first and report the rest against it
+    first_box = {}
+    blocks = {}
+    for pos, group, interval, protocol, ports in _rule_boxes(df):
+        box = (group, interval, protocol, ports)
+        if box in first_box:
+            shadowed[pos] = first_box[box]
+            continue
+        first_box[box] = pos
+        blocks.setdefault(group, {}).setdefault(interval, {}).setdefault(protocol, []).append(
+            (ports[0], ports[1], pos))
+
+    for group, intervals in blocks.items():
+        ranges = {interval: {protocol: _PortRanges(rules) for protocol, rules in by_protocol.items()}
+                  for interval, by_protocol in intervals.items()}
+
+        # Sweep blocks widest-first at each start address; the stack holds the enclosing blocks
+        ancestors = []
+        for interval in sorted(ranges, key=lambda i: (i[0], -i[1])):
+            while ancestors and ancestors[-1][1] < interval[0]:
+                ancestors.pop()
+            by_protocol = ranges[interval]
+
+            for protocol, port_ranges in by_protocol.items():
+                candidates = [(interval, "-1")] if protocol != "-1" else []
+                candidates += [(block, p) for block in reversed(ancestors) for p in (protocol, "-1")]
+                for index, (from_port, to_port, pos) in enumerate(port_ranges.ranges):
+                    # Ranges are unique within a block, so only those sorted earlier can contain this one
+                    cover = port_ranges.covering(from_port, to_port, end=index)
+                    for block, block_protocol in candidates:
+                        if cover is not None:
+                            break
+                        if block_protocol in ranges[block]:
+                            cover = ranges[block][block_protocol].covering(from_port, to_port)
+                    if cover is not None:
+                        shadowed[pos] = cover
+                    elif (other := port_ranges.overlapping(index)) is not None:
+                        overlapping[pos] = other
+
+            ancestors.append(interval)
+
+    issues = {}
+    if shadowed:
+        positions = sorted(shadowed)
+        issues["shadowed_rules"] = row_errors(
+            df, line_numbers, positions,
+            [f"Rule is shadowed by the rule on line {line_of(shadowed[pos])}" for pos in positions])
+    if overlapping:
+        positions = sorted(overlapping)
+        issues["overlapping_rules"] = row_errors(
+            df, line_numbers, positions,
+            [f"Port range overlaps the rule on line {line_of(overlapping[pos])}" for pos in positions])
+    return issues
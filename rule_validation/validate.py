@@ -1,316 +1,680 @@
-#!/usr/bin/env python3
-import argparse
-import sys
-import pandas as pd
-from typing import Dict, List, Any
-import ipaddress
-from pandas.errors import ParserError
-
-CONFIG = {
-    "VALID_PROTOCOLS": ["tcp", "udp", "icmp", "-1"]
-}
-
-def validate_required_fields(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Check all required fields are present"""
-    errors = []
-    required_fields = ['RequestID', 'name', 'security_group_id', 'direction', 
-                      'from_port', 'to_port', 'ip_protocol' ]
-    
-    for field in required_fields:
-        missing_mask = df[field].isna() | (df[field].astype(str).str.strip() == '')
-        if missing_mask.any():
-            for index, row in df[missing_mask].iterrows():
-                errors.append({
-                    "line_number": line_numbers.get(index, "Unknown"),
-                    "row": row.to_dict(),
-                    "error": f"Missing required field: {field}"
-                })
-    return errors
-
-def validate_field_values(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Check direction and protocol values are valid"""
-    errors = []
-    
-    invalid_direction = ~df['direction'].str.lower().isin(['ingress', 'egress'])
-    if invalid_direction.any():
-        for index, row in df[invalid_direction].iterrows():
-            errors.append({
-                "line_number": line_numbers.get(index, "Unknown"),
-                "row": row.to_dict(),
-                "error": "Direction must be either 'ingress' or 'egress'"
-            })
-
-    invalid_protocol = ~df['ip_protocol'].str.lower().isin(CONFIG['VALID_PROTOCOLS'])
-    if invalid_protocol.any():
-        for index, row in df[invalid_protocol].iterrows():
-            errors.append({
-                "line_number": line_numbers.get(index, "Unknown"),
-                "row": row.to_dict(),
-                "error": f"Protocol must be one of: {', '.join(CONFIG['VALID_PROTOCOLS'])}"
-            })
-
-    return errors
-
-def validate_ports(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Validate port ranges based on protocol:
-    - TCP/UDP: ports must be 0-65535 and from_port <= to_port
-    - ICMP: ports must be 0-255 (representing type/code)
-    """
-    validation_rules = {
-        'tcp/udp': "TCP/UDP: ports must be 0-65535 and from_port <= to_port",
-        'icmp': "ICMP: ports must be 0-255 (representing type/code)"
-    }
-    errors = []
-    
-    for index, row in df.iterrows():
-        try:
-            protocol = row['ip_protocol'].lower()
-
-            if protocol == '-1':
-                continue
-
-            from_port = int(row['from_port'])
-            to_port = int(row['to_port'])
-            
-            if protocol == 'icmp':
-                if not (0 <= from_port <= 255 and 0 <= to_port <= 255):
-                    errors.append({
-                        "line_number": line_numbers.get(index, "Unknown"),
-                        "row": row.to_dict(),
-                        "error": f"Invalid ICMP ports: {from_port}, {to_port}. {validation_rules['icmp']}"
-                    })
-            else: 
-                if not (0 <= from_port <= 65535 and 0 <= to_port <= 65535):
-                    errors.append({
-                        "line_number": line_numbers.get(index, "Unknown"),
-                        "row": row.to_dict(),
-                        "error": f"Invalid port range: {from_port}, {to_port}. {validation_rules['tcp/udp']}"
-                    })
-                elif from_port > to_port:
-                    errors.append({
-                        "line_number": line_numbers.get(index, "Unknown"),
-                        "row": row.to_dict(),
-                        "error": f"From port ({from_port}) cannot be greater than to port ({to_port})"
-                    })
-        except ValueError:
-            errors.append({
-                "line_number": line_numbers.get(index, "Unknown"),
-                "row": row.to_dict(),
-                "error": f"Port values must be integers, got from_port={row['from_port']}, to_port={row['to_port']}"
-            })
-    return errors
-
-def validate_input_declarations(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Check that only one source (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) is specified per rule"""
-    errors = []
-    rule_conditions = [
-        (df['referenced_security_group_id'].fillna('null') != 'null') & 
-        (df['referenced_security_group_id'].fillna('null').str.lower() != 'null'),
-        (df['cidr_ipv4'].fillna('null') != 'null') & 
-        (df['cidr_ipv4'].fillna('null').str.lower() != 'null'),
-        (df['cidr_ipv6'].fillna('null') != 'null') & 
-        (df['cidr_ipv6'].fillna('null').str.lower() != 'null'),
-        (df['prefix_list_id'].fillna('null') != 'null') & 
-        (df['prefix_list_id'].fillna('null').str.lower() != 'null')
-    ]
-    
-    multiple_inputs = sum(rule_conditions) > 1
-    if multiple_inputs.any():
-        for index, row in df[multiple_inputs].iterrows():
-            errors.append({
-                "line_number": line_numbers.get(index, "Unknown"),
-                "row": row.to_dict(),
-                "error": "Only one source (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) can be specified per rule"
-            })
-
-    return errors
-
-def validate_null_input(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Ensure that at least one input (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) is set per rule."""
-
-    errors = []
-    rule_conditions = [
-        (df['referenced_security_group_id'].fillna('null').str.lower() != 'null'),
-        (df['cidr_ipv4'].fillna('null').str.lower() != 'null'),
-        (df['cidr_ipv6'].fillna('null').str.lower() != 'null'),
-        (df['prefix_list_id'].fillna('null').str.lower() != 'null')
-    ]
-
-    missing_inputs = sum(rule_conditions) == 0
-    if missing_inputs.any():
-        for index, row in df[missing_inputs].iterrows():
-            errors.append({
-                "line_number": line_numbers.get(index, "Unknown"),
-                "row": row.to_dict(),
-                "error": "At least one input (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) must be specified."
-            })
-
-        return errors
-
-
-
-def validate_ip_addresses(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Check IP address formats and ensure proper CIDR notation for security group rules.
-    IPv4: Must use /0 to /32
-    IPv6: Must use /0 to /128
-    """
-    errors = []
-    
-    for index, row in df.iterrows():
-        for ip_field, version in [('cidr_ipv4', 4), ('cidr_ipv6', 6)]:
-            ip = row[ip_field]
-            if pd.isna(ip) or str(ip).lower() == 'null':
-                continue
-
-            # Check for CIDR notation
-            if '/' not in str(ip):
-                errors.append({
-                    "line_number": line_numbers.get(index, "Unknown"),
-                    "row": row.to_dict(),
-                    "error": f"IP address {ip} must be in CIDR notation (e.g., x.x.x.x/32 for IPv4, x:x:x:x:x:x:x:x/128 for IPv6)"
-                })
-                continue
-                
-            try:
-                ip_obj = ipaddress.ip_network(ip, strict=False)
-                
-                # Verify IP version
-                if ip_obj.version != version:
-                    errors.append({
-                        "line_number": line_numbers.get(index, "Unknown"),
-                        "row": row.to_dict(),
-                        "error": f"IP address {ip} must be a valid IPv{version} CIDR block"
-                    })
-                    continue
-
-                # Verify prefix length
-                max_prefix = 32 if version == 4 else 128
-                if not (0 <= ip_obj.prefixlen <= max_prefix):
-                    errors.append({
-                        "line_number": line_numbers.get(index, "Unknown"),
-                        "row": row.to_dict(),
-                        "error": f"IPv{version} CIDR {ip} must have a prefix length between 0 and {max_prefix}"
-                    })
-                    
-            except ValueError as e:
-                errors.append({
-                    "line_number": line_numbers.get(index, "Unknown"),
-                    "row": row.to_dict(),
-                    "error": f"Invalid CIDR block {ip}: Must be a valid IPv{version} CIDR notation"
-                })
-            except TypeError:
-                errors.append({
-                    "line_number": line_numbers.get(index, "Unknown"),
-                    "row": row.to_dict(),
-                    "error": f"Invalid IP format: {ip} must be a string in CIDR notation"
-                })
-    return errors
-
-def validate_prefix_lists(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Ensure prefix_list_id is only 's3' or 'dynamodb'."""
-    errors = []
-    valid_prefix_lists = [ "s3", "dynamodb", "null"]
-
-    invalid_rows = ~df["prefix_list_id"].isin(valid_prefix_lists)
-
-    if invalid_rows.any():
-        errors.extend([
-            {
-                "line_number": line_numbers.get(index, "Unknown"),
-                "row": row.to_dict(),
-                "error": f"Invalid prefix_list_id: '{row['prefix_list_id']}'. "
-                         f"Must be one of {', '.join(valid_prefix_lists)}."
-            }
-            for index, row in df[invalid_rows].iterrows()
-        ])
-    
-    return errors
-
-def check_duplicates(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
-    """Check for duplicate rules."""
-    errors = []
-    duplicate_mask = df.duplicated(subset=[
-        'name', 'security_group_id', 'direction', 'from_port', 
-        'to_port', 'ip_protocol', 'referenced_security_group_id',
-        'cidr_ipv4', 'cidr_ipv6', 'prefix_list_id'
-    ], keep=False)
-    
-    if duplicate_mask.any():
-        return [
-            {"line_number": line_numbers.get(index, "Unknown"), "row": row.to_dict(), "error": "Duplicate rule detected"}
-            for index, row in df[duplicate_mask].iterrows()
-        ]
-    return errors
-
-
-def validate_rules(df: pd.DataFrame, line_numbers) -> Dict[str, List[Dict[str, Any]]]:
-    """Main validation function that calls all validators in sequence"""
-    issues = {}
-    
-    # 1. Required fields
-    if field_errors := validate_required_fields(df, line_numbers):
-        issues["missing_fields"] = field_errors
-
-    # 2. Field values
-    if value_errors := validate_field_values(df, line_numbers):
-        issues["invalid_fields"] = value_errors
-
-    # 3. Ports
-    if port_errors := validate_ports(df, line_numbers):
-        issues["port_validation"] = port_errors
-
-    # 4. Source declarations
-    if input_errors := validate_input_declarations(df, line_numbers):
-        issues["multiple_input_declarations"] = input_errors
-        
-    # 5. IPs
-    if ip_errors := validate_ip_addresses(df, line_numbers):
-        issues["ip_validation"] = ip_errors
-
-    # 6. Duplicates
-    if duplicate_errors := check_duplicates(df, line_numbers):
-        issues["duplicates"] = duplicate_errors
-
-    # 7. Prefix Lists 
-    if prefix_errors := validate_prefix_lists(df, line_numbers):
-        issues["prefix_validation"] = prefix_errors
-
-    # 8. Null input
-    if invalid_input := validate_null_input(df, line_numbers):
-        issues["invalid_input"] = invalid_input
-
-
-    return issues
-
-def main():
-    parser = argparse.ArgumentParser(description='Validate firewall rules CSV.')
-    parser.add_argument('--input-file', required=True, help='Input CSV file')
-    args = parser.parse_args()
-
-    try:
-        df = pd.read_csv(args.input_file).fillna("null")
-    except ParserError as e:
-        print("Error: malformed CSV input.")
-        print(f"Details: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print("Error: unknown error reading CSV.")
-        sys.exit(1)
-
-    line_numbers = df.index.to_series() + 2
-    issues = validate_rules(df, line_numbers)
-
-    if issues:
-        print("Validation failed with the following issues:")
-        for issue_type, items in issues.items():
-            print(f"\n{issue_type.replace('_', ' ').title()}:")
-            for item in items:
-                print(f"Error: Line {item['line_number']}: {item['error']}")
-                print(f"Row data: {item['row']}\n")
-        sys.exit(1)
-    else:
-        print("Validation successful.")
-        sys.exit(0)
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, NamedTuple, Tuple
+from pandas.errors import EmptyDataError, ParserError
+from shadowing import find_shadowed_rules
+from sg_graph import find_unknown_references, find_unpaired_rules
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_common.cidr import parse_cidr
+from rule_common.errors import row_errors
+from rule_common.loader import read_rules, iter_rule_chunks, parse_port
+from rule_common.quota import (DEFAULT_QUOTAS, add_usage_counts, cumulative_usage, empty_usage_counts,
+                               parse_quota, rule_limit, usage_counts)
+
+CONFIG = {
+    "VALID_PROTOCOLS": ["tcp", "udp", "icmp", "-1"]
+}
+
+DUPLICATE_KEY_COLUMNS = [
+    'name', 'security_group_id', 'direction', 'from_port',
+    'to_port', 'ip_protocol', 'referenced_security_group_id',
+    'cidr_ipv4', 'cidr_ipv6', 'prefix_list_id'
+]
+
+REQUIRED_FIELDS = ['RequestID', 'name', 'security_group_id', 'direction',
+                   'from_port', 'to_port', 'ip_protocol']
+
+SOURCE_COLUMNS = ['referenced_security_group_id', 'cidr_ipv4', 'cidr_ipv6', 'prefix_list_id']
+
+class Validator(NamedTuple):
+    issue_type: str
+    func: Callable[[pd.DataFrame, Any], List[Dict[str, Any]]]
+    columns: Tuple[str, ...]
+    order: int
+
+# Registered validators, run by validate_rules in `order`
+VALIDATORS: List[Validator] = []
+
+def validator(issue_type: str, columns: List[str], order: int):
+    """Register a validator that reads `columns` and reports its errors under `issue_type`."""
+    def register(func):
+        VALIDATORS.append(Validator(issue_type, func, tuple(columns), order))
+        VALIDATORS.sort(key=lambda v: v.order)
+        return func
+    return register
+
+class MissingColumnsError(ValueError):
+    pass
+
+class ValidationProfile:
+    """Wall time per validator, accumulated across every frame or chunk validated."""
+
+    def __init__(self):
+        self.rows = 0
+        self.seconds: Dict[str, float] = {}
+
+    def record(self, issue_type: str, seconds: float) -> None:
+        self.seconds[issue_type] = self.seconds.get(issue_type, 0.0) + seconds
+
+    def report(self) -> str:
+        lines = [f"Validator profile ({self.rows} rows):"]
+        for issue_type, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            throughput = f"{self.rows / seconds:,.0f} rows/s" if seconds > 0 else "n/a"
+            lines.append(f"- {issue_type}: {seconds:.4f}s ({throughput})")
+        return "\n".join(lines)
+
+@validator("missing_fields", columns=REQUIRED_FIELDS, order=1)
+def validate_required_fields(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Check all required fields are present"""
+    errors = []
+
+    for field in REQUIRED_FIELDS:
+        missing_mask = df[field].isna() | (df[field].astype(str).str.strip() == '')
+        if missing_mask.any():
+            errors.extend(row_errors(df, line_numbers, np.flatnonzero(missing_mask.to_numpy()),
+                                      f"Missing required field: {field}"))
+    return errors
+
+@validator("invalid_fields", columns=['direction', 'ip_protocol'], order=2)
+def validate_field_values(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Check direction and protocol values are valid"""
+    errors = []
+    
+    invalid_direction = ~df['direction'].str.lower().isin(['ingress', 'egress'])
+    if invalid_direction.any():
+        errors.extend(row_errors(df, line_numbers, np.flatnonzero(invalid_direction.to_numpy()),
+                                  "Direction must be either 'ingress' or 'egress'"))
+
+    invalid_protocol = ~df['ip_protocol'].str.lower().isin(CONFIG['VALID_PROTOCOLS'])
+    if invalid_protocol.any():
+        errors.extend(row_errors(df, line_numbers, np.flatnonzero(invalid_protocol.to_numpy()),
+                                  f"Protocol must be one of: {', '.join(CONFIG['VALID_PROTOCOLS'])}"))
+
+    return errors
+
+def _port_values(column: pd.Series):
+    """Coerce a port column with parse_port (integers, and integer-valued decimals such as 80.0),
+    parsing each distinct value once.
+    Returns (values, valid) arrays; values are clamped so out-of-range ports still compare as invalid.
+    """
+    if pd.api.types.is_integer_dtype(column.dtype) and not column.isna().any():
+        values = column.to_numpy(dtype=np.int64)
+        return np.clip(values, -1, 65536), np.ones(len(column), dtype=bool)
+
+    codes, uniques = pd.factorize(column)
+    unique_values = np.zeros(len(uniques) + 1, dtype=np.int64)
+    unique_valid = np.zeros(len(uniques) + 1, dtype=bool)
+    for code, value in enumerate(uniques):
+        number = parse_port(value)
+        if number is not None:
+            unique_values[code] = min(max(number, -1), 65536)
+            unique_valid[code] = True
+    # NaN is factorized to -1, which lands on the trailing invalid slot
+    return unique_values[codes], unique_valid[codes]
+
+@validator("port_validation", columns=['ip_protocol', 'from_port', 'to_port'], order=3)
+def validate_ports(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Validate port ranges based on protocol:
+    - TCP/UDP: ports must be 0-65535 and from_port <= to_port
+    - ICMP: ports must be 0-255 (representing type/code)
+    """
+    validation_rules = {
+        'tcp/udp': "TCP/UDP: ports must be 0-65535 and from_port <= to_port",
+        'icmp': "ICMP: ports must be 0-255 (representing type/code)"
+    }
+
+    protocol = df['ip_protocol'].astype(str).str.lower().to_numpy()
+    from_port, from_valid = _port_values(df['from_port'])
+    to_port, to_valid = _port_values(df['to_port'])
+
+    checked = protocol != '-1'
+    is_icmp = protocol == 'icmp'
+    parsed = checked & from_valid & to_valid
+
+    not_integer = checked & ~(from_valid & to_valid)
+    icmp_invalid = parsed & is_icmp & ~(
+        (from_port >= 0) & (from_port <= 255) & (to_port >= 0) & (to_port <= 255))
+    range_invalid = parsed & ~is_icmp & ~(
+        (from_port >= 0) & (from_port <= 65535) & (to_port >= 0) & (to_port <= 65535))
+    order_invalid = parsed & ~is_icmp & ~range_invalid & (from_port > to_port)
+
+    positions = np.flatnonzero(not_integer | icmp_invalid | range_invalid | order_invalid)
+    messages = []
+    for pos in positions:
+        raw_from, raw_to = df['from_port'].iat[pos], df['to_port'].iat[pos]
+        if not_integer[pos]:
+            messages.append(f"Port values must be integers, got from_port={raw_from}, to_port={raw_to}")
+        elif icmp_invalid[pos]:
+            messages.append(f"Invalid ICMP ports: {parse_port(raw_from)}, {parse_port(raw_to)}. {validation_rules['icmp']}")
+        elif range_invalid[pos]:
+            messages.append(f"Invalid port range: {parse_port(raw_from)}, {parse_port(raw_to)}. {validation_rules['tcp/udp']}")
+        else:
+            messages.append(f"From port ({parse_port(raw_from)}) cannot be greater than to port ({parse_port(raw_to)})")
+
+    return row_errors(df, line_numbers, positions, messages)
+
+@validator("multiple_input_declarations", columns=SOURCE_COLUMNS, order=4)
+def validate_input_declarations(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Check that only one source (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) is specified per rule"""
+    errors = []
+    rule_conditions = [
+        (df['referenced_security_group_id'].fillna('null') != 'null') & 
+        (df['referenced_security_group_id'].fillna('null').str.lower() != 'null'),
+        (df['cidr_ipv4'].fillna('null') != 'null') & 
+        (df['cidr_ipv4'].fillna('null').str.lower() != 'null'),
+        (df['cidr_ipv6'].fillna('null') != 'null') & 
+        (df['cidr_ipv6'].fillna('null').str.lower() != 'null'),
+        (df['prefix_list_id'].fillna('null') != 'null') & 
+        (df['prefix_list_id'].fillna('null').str.lower() != 'null')
+    ]
+    
+    multiple_inputs = sum(rule_conditions) > 1
+    if multiple_inputs.any():
+        errors.extend(row_errors(df, line_numbers, np.flatnonzero(multiple_inputs.to_numpy()),
+                                  "Only one source (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) can be specified per rule"))
+
+    return errors
+
+@validator("invalid_input", columns=SOURCE_COLUMNS, order=8)
+def validate_null_input(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Ensure that at least one input (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) is set per rule."""
+
+    errors = []
+    rule_conditions = [
+        (df['referenced_security_group_id'].fillna('null').str.lower() != 'null'),
+        (df['cidr_ipv4'].fillna('null').str.lower() != 'null'),
+        (df['cidr_ipv6'].fillna('null').str.lower() != 'null'),
+        (df['prefix_list_id'].fillna('null').str.lower() != 'null')
+    ]
+
+    missing_inputs = sum(rule_conditions) == 0
+    if missing_inputs.any():
+        errors.extend(row_errors(df, line_numbers, np.flatnonzero(missing_inputs.to_numpy()),
+                                  "At least one input (security group, CIDR IPv4, CIDR IPv6 or prefix_list_id) must be specified."))
+
+    return errors
+
+
+
+def _cidr_error(ip, version: int):
+    """Return the validation error for a single cidr cell, or None if it is valid."""
+    if str(ip).lower() == 'null':
+        return None
+
+    # Check for CIDR notation
+    if '/' not in str(ip):
+        return f"IP address {ip} must be in CIDR notation (e.g., x.x.x.x/32 for IPv4, x:x:x:x:x:x:x:x/128 for IPv6)"
+
+    if not isinstance(ip, str):
+        return f"Invalid IP format: {ip} must be a string in CIDR notation"
+
+    ip_obj = parse_cidr(ip)
+    if ip_obj is None:
+        return f"Invalid CIDR block {ip}: Must be a valid IPv{version} CIDR notation"
+
+    # Verify IP version
+    if ip_obj.version != version:
+        return f"IP address {ip} must be a valid IPv{version} CIDR block"
+
+    # Verify prefix length
+    max_prefix = 32 if version == 4 else 128
+    if not (0 <= ip_obj.prefixlen <= max_prefix):
+        return f"IPv{version} CIDR {ip} must have a prefix length between 0 and {max_prefix}"
+
+    return None
+
+@validator("ip_validation", columns=['cidr_ipv4', 'cidr_ipv6'], order=5)
+def validate_ip_addresses(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Check IP address formats and ensure proper CIDR notation for security group rules.
+    IPv4: Must use /0 to /32
+    IPv6: Must use /0 to /128
+    Each distinct cidr string is checked once (parses are shared through rule_common.cidr)
+    and the result broadcast back to its rows.
+    """
+    fields = [('cidr_ipv4', 4), ('cidr_ipv6', 6)]
+    positions, field_order, messages = [], [], []
+
+    for field_index, (ip_field, version) in enumerate(fields):
+        codes, uniques = pd.factorize(df[ip_field])
+        unique_errors = [_cidr_error(ip, version) for ip in uniques]
+        failing_codes = [code for code, error in enumerate(unique_errors) if error is not None]
+        if not failing_codes:
+            continue
+        rows = np.flatnonzero(np.isin(codes, failing_codes))
+        positions.append(rows)
+        field_order.append(np.full(len(rows), field_index))
+        messages.extend(unique_errors[code] for code in codes[rows])
+
+    if not positions:
+        return []
+
+    # Report in row order, cidr_ipv4 before cidr_ipv6 within a row
+    positions = np.concatenate(positions)
+    field_order = np.concatenate(field_order)
+    order = np.lexsort((field_order, positions))
+    return row_errors(df, line_numbers, positions[order], [messages[i] for i in order])
+
+@validator("prefix_validation", columns=['prefix_list_id'], order=7)
+def validate_prefix_lists(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Ensure prefix_list_id is only 's3' or 'dynamodb'."""
+    errors = []
+    valid_prefix_lists = [ "s3", "dynamodb", "null"]
+
+    invalid_rows = ~df["prefix_list_id"].isin(valid_prefix_lists)
+
+    if invalid_rows.any():
+        positions = np.flatnonzero(invalid_rows.to_numpy())
+        errors.extend(row_errors(df, line_numbers, positions, [
+            f"Invalid prefix_list_id: '{df['prefix_list_id'].iat[pos]}'. "
+            f"Must be one of {', '.join(valid_prefix_lists)}."
+            for pos in positions
+        ]))
+    
+    return errors
+
+@validator("duplicates", columns=DUPLICATE_KEY_COLUMNS, order=6)
+def check_duplicates(df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+    """Check for duplicate rules."""
+    errors = []
+    duplicate_mask = df.duplicated(subset=DUPLICATE_KEY_COLUMNS, keep=False)
+
+    if duplicate_mask.any():
+        return row_errors(df, line_numbers, np.flatnonzero(duplicate_mask.to_numpy()), "Duplicate rule detected")
+    return errors
+
+def hash_rules(df: pd.DataFrame) -> np.ndarray:
+    """Hash the duplicate key columns of each rule into a uint64.
+    Hashes depend on dtype, so rules compared through a DuplicateIndex must be read with text
+    ports (iter_rule_chunks, or read_rules with int_ports=False); categoricals hash as their strings.
+    """
+    return pd.util.hash_pandas_object(df[DUPLICATE_KEY_COLUMNS], index=False).to_numpy()
+
+class DuplicateIndex:
+    """Sorted uint64 hashes of every rule seen so far, with the line each was first seen on.
+
+    Used in place of check_duplicates when the CSV is validated in chunks or against an
+    already-validated baseline, so duplicates are caught across chunk and file boundaries
+    while only 16 bytes per distinct rule are kept in memory. It also keeps the rule counts
+    per security group and direction (usage_counts), so quotas can be checked the same way;
+    usage is None for indexes saved before it was tracked.
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.lines = np.empty(0, dtype=np.int64)
+        self.row_count = 0
+        self.usage = empty_usage_counts()
+
+    @classmethod
+    def from_csv(cls, input_file: str, chunk_size: int = 100000) -> "DuplicateIndex":
+        """Build an index from an already-validated rules CSV."""
+        index = cls()
+        for chunk in iter_rule_chunks(input_file, chunk_size):
+            index._merge(chunk, chunk.index.to_series() + 2)
+        return index
+
+    @classmethod
+    def load(cls, index_file: str) -> "DuplicateIndex":
+        """Load an index written by save()."""
+        index = cls()
+        with np.load(index_file) as data:
+            index.hashes = data["hashes"]
+            index.lines = data["lines"]
+            index.row_count = int(data["row_count"])
+            index.usage = None
+            if "usage_rules" in data.files:
+                index.usage = pd.DataFrame(
+                    {"rules": data["usage_rules"], "prefix_lists": data["usage_prefix_lists"]},
+                    index=pd.MultiIndex.from_arrays([data["usage_sgs"], data["usage_directions"]],
+                                                    names=["security_group_id", "direction"]))
+        return index
+
+    def save(self, index_file: str) -> None:
+        """Persist the index as a compressed .npz file."""
+        with open(index_file, "wb") as f:
+            usage = {}
+            if self.usage is not None:
+                usage = {
+                    "usage_sgs": np.array(self.usage.index.get_level_values(0), dtype=str),
+                    "usage_directions": np.array(self.usage.index.get_level_values(1), dtype=str),
+                    "usage_rules": self.usage["rules"].to_numpy(),
+                    "usage_prefix_lists": self.usage["prefix_lists"].to_numpy(),
+                }
+            np.savez_compressed(f, hashes=self.hashes, lines=self.lines, row_count=self.row_count, **usage)
+
+    def _merge(self, df: pd.DataFrame, line_numbers):
+        """Add df's rules to the index.
+        Returns the positions in df that repeat an earlier rule and the line each first appeared on.
+        """
+        hashes = hash_rules(df)
+        lines = line_numbers.reindex(df.index).to_numpy(dtype=np.int64)
+
+        # First occurrence of each hash within df
+        df_hashes, first_pos, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        first_line = lines[first_pos]
+
+        # Hashes already in the index keep their original line
+        slots = np.searchsorted(self.hashes, df_hashes)
+        seen = slots < len(self.hashes)
+        seen[seen] = self.hashes[slots[seen]] == df_hashes[seen]
+        first_line[seen] = self.lines[slots[seen]]
+
+        duplicate = seen[inverse] | (np.arange(len(df)) != first_pos[inverse])
+        positions = np.flatnonzero(duplicate)
+
+        merged_hashes = np.concatenate([self.hashes, df_hashes[~seen]])
+        merged_lines = np.concatenate([self.lines, first_line[~seen]])
+        order = np.argsort(merged_hashes, kind="stable")
+        self.hashes, self.lines = merged_hashes[order], merged_lines[order]
+        self.row_count += len(df)
+        if self.usage is not None:
+            self.usage = add_usage_counts(self.usage, usage_counts(df))
+
+        return positions, first_line[inverse[positions]]
+
+    def check(self, df: pd.DataFrame, line_numbers) -> List[Dict[str, Any]]:
+        """Report rules in df that repeat an earlier rule, then add df's rules to the index."""
+        if df.empty:
+            return []
+        positions, first_lines = self._merge(df, line_numbers)
+        messages = [f"Duplicate rule detected (first seen on line {line})" for line in first_lines]
+        return row_errors(df, line_numbers, positions, messages)
+
+
+def validate_rules(df: pd.DataFrame, line_numbers, duplicate_index: DuplicateIndex = None,
+                   max_errors: int = None, fail_fast: bool = False, jobs: int = 1,
+                   profile: ValidationProfile = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Main validation function that runs every registered validator.
+    When a duplicate_index is given, duplicates are checked against it instead of within df only.
+    Stops once max_errors errors are collected, or after the first failing validator with
+    fail_fast. With jobs > 1 validators run concurrently in a thread pool over the same
+    read-only frame; results are still reported in registry order, and once max_errors or
+    fail_fast stops the run, queued validators are cancelled while running ones finish.
+    """
+    missing = sorted({column for v in VALIDATORS for column in v.columns} - set(df.columns))
+    if missing:
+        raise MissingColumnsError(f"input is missing required columns: {', '.join(missing)}")
+
+    def run(v: Validator) -> List[Dict[str, Any]]:
+        func = duplicate_index.check if v.issue_type == "duplicates" and duplicate_index is not None else v.func
+        start = time.perf_counter()
+        errors = func(df, line_numbers)
+        if profile is not None:
+            profile.record(v.issue_type, time.perf_counter() - start)
+        return errors
+
+    pool = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    if pool is not None:
+        futures = [pool.submit(run, v) for v in VALIDATORS]
+        results = (future.result() for future in futures)
+    else:
+        results = map(run, VALIDATORS)
+    if profile is not None:
+        profile.rows += len(df)
+
+    issues = {}
+    remaining = max_errors
+    try:
+        for v, errors in zip(VALIDATORS, results):
+            if errors:
+                if remaining is not None:
+                    errors = errors[:remaining]
+                    remaining -= len(errors)
+                issues[v.issue_type] = errors
+                if fail_fast or remaining == 0:
+                    break
+    finally:
+        if pool is not None:
+            # Validators that have not started when the cap is reached are cancelled
+            pool.shutdown(cancel_futures=True)
+
+    return issues
+
+def count_errors(issues: Dict[str, List[Dict[str, Any]]]) -> int:
+    return sum(len(items) for items in issues.values())
+
+def run_analyses(issues: Dict[str, List[Dict[str, Any]]], analyses: List[Callable[[], Dict[str, List[Dict[str, Any]]]]],
+                 max_errors: int = None, fail_fast: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """Add the issues of each analysis after the validators' while the error cap still allows."""
+    for analysis in analyses:
+        if (issues and fail_fast) or count_errors(issues) == max_errors:
+            break
+        for issue_type, items in analysis().items():
+            remaining = None if max_errors is None else max_errors - count_errors(issues)
+            if remaining == 0:
+                break
+            issues[issue_type] = items[:remaining]
+    return issues
+
+def validate_csv_in_chunks(input_file: str, chunk_size: int, duplicate_index: DuplicateIndex = None,
+                           max_errors: int = None, fail_fast: bool = False, jobs: int = 1,
+                           profile: ValidationProfile = None,
+                           quotas: Dict[str, int] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Validate the CSV chunk_size rows at a time so peak memory stays flat as the file grows.
+    Ports are read as text so every chunk hashes the same way, and duplicates (and, with
+    quotas, security group usage) are tracked across chunks through a DuplicateIndex.
+    No further chunks are read once max_errors is hit.
+    """
+    issues = {}
+    if duplicate_index is None:
+        duplicate_index = DuplicateIndex()
+    for chunk in iter_rule_chunks(input_file, chunk_size):
+        # Chunks keep a running RangeIndex, so line numbers stay file-relative
+        line_numbers = chunk.index.to_series() + 2
+        remaining = None if max_errors is None else max_errors - count_errors(issues)
+        usage = duplicate_index.usage
+        chunk_issues = validate_rules(chunk, line_numbers, duplicate_index, remaining, fail_fast, jobs, profile)
+        if quotas is not None:
+            chunk_issues = run_analyses(chunk_issues, [lambda: check_quotas(chunk, line_numbers, quotas, usage)],
+                                        remaining, fail_fast)
+        for issue_type, items in chunk_issues.items():
+            # Materialize rows now so the chunk itself can be released
+            for item in items:
+                item["row"] = dict(item["row"])
+            issues.setdefault(issue_type, []).extend(items)
+        if issues and (fail_fast or count_errors(issues) == max_errors):
+            break
+    return issues
+
+def load_baseline_index(baseline_file: str) -> DuplicateIndex:
+    """Load a persisted .npz duplicate index, or build one from an already-validated CSV."""
+    if baseline_file.endswith(".npz"):
+        return DuplicateIndex.load(baseline_file)
+    return DuplicateIndex.from_csv(baseline_file)
+
+def validate_delta(input_file: str, duplicate_index: DuplicateIndex, max_errors: int = None,
+                   fail_fast: bool = False, jobs: int = 1, profile: ValidationProfile = None,
+                   quotas: Dict[str, int] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Fully validate only the rows in input_file, checking duplicates against the baseline index,
+    and with quotas, the new rows' security group usage on top of the baseline's.
+    Line numbers are reported as they will appear once the rows are appended to the baseline.
+    """
+    if quotas is not None and duplicate_index.usage is None:
+        raise ValueError("baseline index has no security group usage to check quotas against")
+    df = read_rules(input_file, int_ports=False)
+    line_numbers = df.index.to_series() + duplicate_index.row_count + 2
+    usage = duplicate_index.usage
+    issues = validate_rules(df, line_numbers, duplicate_index, max_errors, fail_fast, jobs, profile)
+    if quotas is not None:
+        issues = run_analyses(issues, [lambda: check_quotas(df, line_numbers, quotas, usage)], max_errors, fail_fast)
+    return issues
+
+def check_quotas(df: pd.DataFrame, line_numbers, quotas: Dict[str, int],
+                 baseline: pd.DataFrame = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Report every rule that takes its security group and direction past the quota, in
+    CSV order, so the rows a request appends are the ones that fail. baseline is the
+    usage_counts of rules already in place before df.
+    """
+    limit = rule_limit(quotas)
+    usage = cumulative_usage(df, quotas, baseline).to_numpy()
+    positions = np.flatnonzero(usage > limit)
+    if len(positions) == 0:
+        return {}
+    sgs = df["security_group_id"].astype(str).to_numpy()
+    directions = df["direction"].astype(str).to_numpy()
+    messages = [f"Rule brings {directions[pos]} rules of {sgs[pos]} to {usage[pos]}, over the quota of {limit}"
+                for pos in positions]
+    return {"quota_exceeded": row_errors(df, line_numbers, positions, messages)}
+
+def validate_table(df: pd.DataFrame, max_errors: int = None, fail_fast: bool = False, jobs: int = 1,
+                   profile: ValidationProfile = None, check_shadowing: bool = False,
+                   quotas: Dict[str, int] = None, check_references: bool = False,
+                   check_pairing: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """Validate a whole rule table read from the top of a CSV, optionally followed by the
+    shadowing analysis, the quota check (when quotas are given) and the security group
+    reference and ingress/egress pairing checks while the error cap still allows.
+    """
+    line_numbers = df.index.to_series() + 2
+    issues = validate_rules(df, line_numbers, max_errors=max_errors, fail_fast=fail_fast,
+                            jobs=jobs, profile=profile)
+    analyses = []
+    if check_shadowing:
+        analyses.append(lambda: find_shadowed_rules(df, line_numbers))
+    if quotas is not None:
+        analyses.append(lambda: check_quotas(df, line_numbers, quotas))
+    if check_references:
+        analyses.append(lambda: find_unknown_references(df, line_numbers))
+    if check_pairing:
+        analyses.append(lambda: find_unpaired_rules(df, line_numbers))
+    return run_analyses(issues, analyses, max_errors, fail_fast)
+
+def summarize_issues(issues: Dict[str, List[Dict[str, Any]]], sample_size: int = 10) -> Dict[str, Dict[str, Any]]:
+    """Group errors by type into a count and the first few line numbers."""
+    return {
+        issue_type: {
+            "count": len(items),
+            "sample_lines": [item["line_number"] for item in items[:sample_size]]
+        }
+        for issue_type, items in issues.items()
+    }
+
+def _json_default(value):
+    """Serialize LazyRow and NumPy scalars as json.dump reaches them."""
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def print_report(issues: Dict[str, List[Dict[str, Any]]], output_format: str = "text", stopped_early: bool = False) -> None:
+    """Print the validation result as text (for issue comments) or JSON (for tooling)."""
+    summary = summarize_issues(issues)
+    if output_format == "json":
+        report = {
+            "status": "failed" if issues else "passed",
+            "stopped_early": stopped_early,
+            "summary": summary,
+            "issues": issues,
+        }
+        # json.dump writes incrementally, so each row is only converted when it is reached
+        json.dump(report, sys.stdout, default=_json_default, indent=2)
+        print()
+        return
+
+    if not issues:
+        print("Validation successful.")
+        return
+
+    print("Validation failed with the following issues:")
+    for issue_type, items in issues.items():
+        print(f"\n{issue_type.replace('_', ' ').title()}:")
+        for item in items:
+            print(f"Error: Line {item['line_number']}: {item['error']}")
+            print(f"Row data: {item['row']}\n")
+
+    print("Summary:")
+    for issue_type, group in summary.items():
+        lines = ", ".join(str(line) for line in group["sample_lines"])
+        more = ", ..." if group["count"] > len(group["sample_lines"]) else ""
+        print(f"- {issue_type.replace('_', ' ').title()}: {group['count']} (lines {lines}{more})")
+    if stopped_early:
+        print("Stopped early; rows after the last reported error may have further issues.")
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate firewall rules CSV.')
+    parser.add_argument('--input-file', required=True, help='Input CSV file')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='Validate the CSV this many rows at a time to bound memory (default: whole file)')
+    parser.add_argument('--baseline-file',
+                        help='Already-validated rules CSV or .npz index; only --input-file rows are validated against it')
+    parser.add_argument('--write-index', help='After successful validation, save a .npz duplicate index of all validated rules')
+    parser.add_argument('--check-shadowing', action='store_true',
+                        help='Also report rules shadowed by or overlapping another rule (whole-file mode only)')
+    parser.add_argument('--check-references', action='store_true',
+                        help='Also fail rules referencing a security group no rule defines (whole-file mode only)')
+    parser.add_argument('--check-pairing', action='store_true',
+                        help='Also fail SG-to-SG rules without the matching rule on the peer group (whole-file mode only)')
+    parser.add_argument('--check-quotas', action='store_true',
+                        help='Also fail rules that take a security group over its rules quota (with --baseline-file, '
+                             'counting the baseline\'s rules)')
+    parser.add_argument('--quota', type=parse_quota, action='append', default=[], metavar='NAME=VALUE',
+                        help=f'Override a quota for --check-quotas (defaults: '
+                             f'{", ".join(f"{k}={v}" for k, v in DEFAULT_QUOTAS.items())})')
+    parser.add_argument('--max-errors', type=int, default=0,
+                        help='Stop validating once this many errors are found (default: no limit)')
+    parser.add_argument('--fail-fast', action='store_true', help='Stop after the first check that reports errors')
+    parser.add_argument('--output-format', choices=['text', 'json'], default='text', help='Report format')
+    parser.add_argument('--jobs', type=int, default=1, help='Run validators concurrently in this many threads; once the error cap is reached, validators already running still finish')
+    parser.add_argument('--profile', action='store_true', help='Print wall time and row throughput per validator to stderr')
+    parser.add_argument('--snapshot-dir',
+                        help='Reuse (or save) a parsed snapshot of --input-file keyed by its content hash (whole-file mode)')
+    args = parser.parse_args()
+    if args.check_shadowing and (args.baseline_file or args.chunk_size > 0):
+        parser.error("--check-shadowing needs the whole rule set and cannot be combined with --chunk-size or --baseline-file")
+    for flag, enabled in (("--check-references", args.check_references), ("--check-pairing", args.check_pairing)):
+        if enabled and (args.baseline_file or args.chunk_size > 0):
+            parser.error(f"{flag} needs the whole rule set and cannot be combined with --chunk-size or --baseline-file")
+    quotas = dict(DEFAULT_QUOTAS, **dict(args.quota)) if args.check_quotas else None
+    max_errors = args.max_errors if args.max_errors > 0 else None
+    profile = ValidationProfile() if args.profile else None
+
+    duplicate_index = None
+    try:
+        if args.baseline_file:
+            duplicate_index = load_baseline_index(args.baseline_file)
+            if quotas is not None and duplicate_index.usage is None:
+                print(f"Error: {args.baseline_file} was saved without security group usage, so --check-quotas "
+                      f"cannot use it; rebuild it with --write-index.")
+                sys.exit(1)
+            issues = validate_delta(args.input_file, duplicate_index, max_errors, args.fail_fast,
+                                    args.jobs, profile, quotas)
+        elif args.chunk_size > 0:
+            duplicate_index = DuplicateIndex()
+            issues = validate_csv_in_chunks(args.input_file, args.chunk_size, duplicate_index,
+                                            max_errors, args.fail_fast, args.jobs, profile, quotas)
+        else:
+            df = read_rules(args.input_file, snapshot_dir=args.snapshot_dir)
+            issues = validate_table(df, max_errors, args.fail_fast, args.jobs, profile, args.check_shadowing,
+                                    quotas, args.check_references, args.check_pairing)
+    except ParserError as e:
+        print("Error: malformed CSV input.")
+        print(f"Details: {e}")
+        sys.exit(1)
+    except MissingColumnsError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except (OSError, UnicodeDecodeError, EmptyDataError) as e:
+        # Only failures to read the input; errors in the checks themselves keep their traceback
+        print("Error: could not read CSV.")
+        print(f"Details: {e}")
+        sys.exit(1)
+
+    stopped_early = bool(issues) and (args.fail_fast or count_errors(issues) == max_errors)
+    if not issues and args.write_index:
+        (duplicate_index or DuplicateIndex.from_csv(args.input_file)).save(args.write_index)
+    if profile is not None:
+        print(profile.report(), file=sys.stderr)
+    print_report(issues, args.output_format, stopped_early)
+    sys.exit(1 if issues else 0)
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,35 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rule_validation"))
+from generate_rules import COLUMNS, generate_rules
+from run_benchmarks import find_regressions
+from validate import validate_rules
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_generated_rules_are_valid_and_seeded(self):
+        """Test the generator is deterministic per seed and produces rules that pass validation."""
+        df = generate_rules(2000, seed=3)
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(len(df), 2000)
+        self.assertTrue(df.equals(generate_rules(2000, seed=3)))
+        self.assertFalse(df.equals(generate_rules(2000, seed=4)))
+        self.assertEqual(validate_rules(df, df.index.to_series() + 2), {})
+
+    def test_find_regressions(self):
+        """Test slowdowns and memory growth past the tolerance are reported, and noise is not."""
+        baseline = {"results": {"100": {"a": {"seconds": 1.0, "peak_mb": 10.0},
+                                        "b": {"seconds": 0.01, "peak_mb": 1.0}}}}
+        report = {"results": {"100": {"a": {"seconds": 1.6, "peak_mb": 20.0},
+                                      "b": {"seconds": 0.03, "peak_mb": 1.5},
+                                      "c": {"seconds": 9.0, "peak_mb": 9.0}}}}
+        self.assertEqual(find_regressions(report, baseline, 0.5),
+                         ["a at 100 rules: 1.6s vs 1.0s", "a at 100 rules: 20.0 MB vs 10.0 MB"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,22 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from rule_common.cidr import parse_cidr
+
+
+class TestCidr(unittest.TestCase):
+
+    def test_parse_cidr(self):
+        """Test parsing normalizes host bits and exposes the address interval."""
+        parsed = parse_cidr("10.1.2.3/16")
+        self.assertEqual((parsed.network, parsed.prefixlen, parsed.version), (0x0A010000, 16, 4))
+        self.assertEqual(parsed.last, 0x0A01FFFF)
+        self.assertEqual(parse_cidr("2001:db8::/126").last - parse_cidr("2001:db8::/126").network, 3)
+        self.assertIsNone(parse_cidr("10.0.0.1/33"))
+        self.assertIsNone(parse_cidr("null"))
+
+
+if __name__ == "__main__":
+    unittest.main()
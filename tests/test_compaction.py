@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rule_conversion"))
+from compaction import compact_records, compact_rules
+
+
+def rule(**fields):
+    base = {"RequestID": "R1", "name": "a", "security_group_id": "ecr.api", "direction": "egress",
+            "from_port": 443, "to_port": 443, "ip_protocol": "tcp", "referenced_security_group_id": "null",
+            "cidr_ipv4": "10.0.0.0/8", "cidr_ipv6": "null", "prefix_list_id": "null",
+            "business_justification": "x"}
+    base.update(fields)
+    return base
+
+
+class TestCompaction(unittest.TestCase):
+
+    def test_merge_ports(self):
+        """Test adjacent and overlapping port ranges merge, and other protocols are left alone."""
+        compacted = compact_records([
+            rule(RequestID="R1", from_port=80, to_port=89),
+            rule(RequestID="R2", from_port=90, to_port=99),
+            rule(RequestID="R3", from_port=95, to_port=120),
+            rule(RequestID="R4", from_port=200, to_port=200),
+            rule(RequestID="R5", ip_protocol="-1", from_port=0, to_port=0),
+        ])
+        ranges = sorted((r["ip_protocol"], r["from_port"], r["to_port"]) for r in compacted)
+        self.assertEqual(ranges, [("-1", 0, 0), ("tcp", 80, 120), ("tcp", 200, 200)])
+        merged = next(r for r in compacted if r["from_port"] == 80)
+        self.assertEqual(merged["source_request_ids"], ["R1", "R2", "R3"])
+        self.assertEqual(merged["RequestID"], "R1")
+
+        # Integer-valued decimal ports, which validation accepts, merge too
+        compacted = compact_records([
+            rule(RequestID="R1", from_port="80.0", to_port="89.0"),
+            rule(RequestID="R2", from_port="90.0", to_port="99.0"),
+        ])
+        self.assertEqual([(r["from_port"], r["to_port"]) for r in compacted], [("80.0", "99")])
+
+    def test_collapse_cidrs(self):
+        """Test sibling CIDRs aggregate and rules differing in another field do not merge."""
+        compacted = compact_records([
+            rule(RequestID="R1", cidr_ipv4="10.0.0.0/9"),
+            rule(RequestID="R2", cidr_ipv4="10.128.0.0/9"),
+            rule(RequestID="R3", cidr_ipv4="10.0.0.0/24"),
+            rule(RequestID="R4", cidr_ipv4="192.168.0.0/24", business_justification="y"),
+            rule(RequestID="R5", cidr_ipv4="192.168.1.0/24"),
+        ])
+        cidrs = sorted((r["cidr_ipv4"], tuple(r["source_request_ids"])) for r in compacted)
+        self.assertEqual(cidrs, [("10.0.0.0/8", ("R1", "R2", "R3")),
+                                 ("192.168.0.0/24", ("R4",)),
+                                 ("192.168.1.0/24", ("R5",))])
+
+    def test_ports_then_cidrs(self):
+        """Test a port merge can enable a CIDR merge on the next pass, and groups stay sorted."""
+        rules = {"egress": {"ecr.api": [
+            rule(RequestID="R1", cidr_ipv4="10.0.0.0/9", from_port=80, to_port=80),
+            rule(RequestID="R2", cidr_ipv4="10.0.0.0/9", from_port=81, to_port=81),
+            rule(RequestID="R3", cidr_ipv4="10.128.0.0/9", from_port=80, to_port=81),
+            rule(RequestID="R4", from_port=22, to_port=22),
+        ]}}
+        compacted = compact_rules(rules, ["direction", "from_port", "to_port", "cidr_ipv4"])["egress"]["ecr.api"]
+        self.assertEqual([(r["from_port"], r["to_port"], r["cidr_ipv4"]) for r in compacted],
+                         [(22, 22, "10.0.0.0/8"), (80, 81, "10.0.0.0/8")])
+        self.assertEqual(compacted[1]["source_request_ids"], ["R1", "R2", "R3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock
+import pandas as pd
+from pandas.errors import ParserError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from rule_common import loader
+from rule_common.loader import read_rules, iter_rule_chunks, content_hash, snapshot_path
+
+HEADER = ("RequestID,name,security_group_id,direction,from_port,to_port,ip_protocol,"
+          "referenced_security_group_id,cidr_ipv4,cidr_ipv6,prefix_list_id,business_justification")
+
+
+class TestLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_rules(self, *rows):
+        input_file = os.path.join(self.tmp_dir, "rules.csv")
+        with open(input_file, "w") as f:
+            f.write("\n".join((HEADER,) + rows) + "\n")
+        return input_file
+
+    def test_read_rules(self):
+        """Test declared dtypes, "null" filling and integer ports."""
+        input_file = self.write_rules(
+            "R1,a,a,egress,443,443,tcp,b,,null,,x",
+            "R1,a,a,ingress,22,22,tcp,null,10.0.0.0/8,null,null,x",
+        )
+        df = read_rules(input_file)
+        self.assertIsInstance(df["security_group_id"].dtype, pd.CategoricalDtype)
+        self.assertEqual(str(df["from_port"].dtype), "Int64")
+        self.assertEqual(df["cidr_ipv4"].tolist(), ["null", "10.0.0.0/8"])
+        self.assertEqual(df.iloc[0].to_dict()["prefix_list_id"], "null")
+        self.assertEqual(df.iloc[0].to_dict()["from_port"], 443)
+
+    def read_with_each_engine(self, input_file):
+        """read_rules with the C parser and, when installed, with pyarrow."""
+        with mock.patch.object(loader, "HAS_PYARROW", False):
+            frames = {"c": read_rules(input_file)}
+        if loader.HAS_PYARROW:
+            frames["pyarrow"] = read_rules(input_file)
+        return frames
+
+    def test_engines_agree(self):
+        """Test both engines load empty cells as "null" and text as written."""
+        input_file = self.write_rules(
+            "R1,a,a,egress,443,443,tcp,b,,null,,x",
+            "007,a,a,ingress,22,22,tcp,null,10.0.0.0/8,None,null,x",
+        )
+        frames = self.read_with_each_engine(input_file)
+        for engine, df in frames.items():
+            with self.subTest(engine=engine):
+                self.assertEqual(df["cidr_ipv4"].tolist(), ["null", "10.0.0.0/8"])
+                self.assertEqual(df["cidr_ipv6"].tolist(), ["null", "null"])
+                self.assertEqual(df["prefix_list_id"].tolist(), ["null", "null"])
+                self.assertEqual(df["RequestID"].tolist(), ["R1", "007"])
+                self.assertEqual(df["from_port"].tolist(), [443, 22])
+                pd.testing.assert_frame_equal(df, frames["c"])
+
+    def test_malformed_csv(self):
+        """Test a row with too many fields raises ParserError on either engine."""
+        input_file = self.write_rules(
+            "R1,a,a,egress,443,443,tcp,b,null,null,null,x",
+            "R1,a,a,egress,443,443,tcp,b,null,null,null,x,extra,extra",
+        )
+        with mock.patch.object(loader, "HAS_PYARROW", False):
+            self.assertRaises(ParserError, read_rules, input_file)
+        if loader.HAS_PYARROW:
+            self.assertRaises(ParserError, read_rules, input_file)
+
+    def test_integer_valued_ports(self):
+        """Test 80.0 reads as 80, and integer ports stay numbers next to empty or invalid cells."""
+        input_file = self.write_rules(
+            "R1,a,a,egress,80.0,443,tcp,b,null,null,null,x",
+            "R1,a,a,egress,,,-1,null,10.0.0.0/8,null,null,x",
+            "R1,a,a,egress,80,1.5,tcp,b,null,null,null,x",
+        )
+        for engine, df in self.read_with_each_engine(input_file).items():
+            with self.subTest(engine=engine):
+                self.assertEqual(df["from_port"].tolist(), [80, "null", 80])
+                self.assertEqual(df["to_port"].tolist(), [443, "null", "1.5"])
+                self.assertIs(type(df.iloc[0].to_dict()["from_port"]), int)
+
+    def test_text_ports(self):
+        """Test only non-integer ports stay as written, and every port does when asked."""
+        input_file = self.write_rules(
+            "R1,a,a,egress,http,443,tcp,b,null,null,null,x",
+            "R1,a,a,egress,22,,tcp,b,null,null,null,x",
+        )
+        df = read_rules(input_file)
+        self.assertEqual(df["from_port"].tolist(), ["http", 22])
+        self.assertEqual(df["to_port"].tolist(), [443, "null"])
+        self.assertEqual(read_rules(input_file, int_ports=False)["from_port"].tolist(), ["http", "22"])
+
+        chunks = list(iter_rule_chunks(input_file, chunk_size=1))
+        self.assertEqual([chunk.index[0] for chunk in chunks], [0, 1])
+        self.assertEqual(pd.util.hash_pandas_object(chunks[1], index=False).tolist(),
+                         pd.util.hash_pandas_object(read_rules(input_file, int_ports=False).iloc[1:],
+                                                    index=False).tolist())
+
+    def test_snapshot_needs_pyarrow(self):
+        """Test no snapshot is written or read without pyarrow."""
+        input_file = self.write_rules("R1,a,a,egress,443,443,tcp,b,null,null,null,x")
+        snapshot_dir = os.path.join(self.tmp_dir, "snapshots")
+        with mock.patch.object(loader, "HAS_PYARROW", False):
+            df = read_rules(input_file, snapshot_dir=snapshot_dir)
+        self.assertEqual(df["name"].tolist(), ["a"])
+        self.assertFalse(os.path.exists(snapshot_dir))
+
+    @unittest.skipUnless(loader.HAS_PYARROW, "snapshots need pyarrow")
+    def test_snapshot(self):
+        """Test a snapshot is saved on first read, reused for the same content and missed after an edit."""
+        input_file = self.write_rules("R1,a,a,egress,443,443,tcp,b,null,null,null,x")
+        snapshot_dir = os.path.join(self.tmp_dir, "snapshots")
+        df = read_rules(input_file, snapshot_dir=snapshot_dir)
+        path = snapshot_path(snapshot_dir, content_hash(input_file))
+        self.assertTrue(os.path.exists(path))
+
+        # Overwrite the snapshot (which keeps ports as text) so a cache hit is observable
+        read_rules(input_file, int_ports=False).assign(name="cached").to_feather(path)
+        self.assertEqual(read_rules(input_file, snapshot_dir=snapshot_dir)["name"].tolist(), ["cached"])
+
+        input_file = self.write_rules("R1,b,a,egress,443,443,tcp,b,null,null,null,x")
+        reread = read_rules(input_file, snapshot_dir=snapshot_dir)
+        self.assertEqual(reread["name"].tolist(), ["b"])
+        self.assertEqual(str(reread["from_port"].dtype), "Int64")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rule_pipeline"))
+from pipeline import run_pipeline
+import convert
+from convert import CONFIG
+
+HEADER = ("RequestID,name,security_group_id,direction,from_port,to_port,ip_protocol,"
+          "referenced_security_group_id,cidr_ipv4,cidr_ipv6,prefix_list_id,business_justification")
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        self.output_dir = CONFIG["OUTPUT_DIR"]
+        # rule_count.txt is written to the working directory
+        os.chdir(self.tmp_dir)
+        CONFIG["OUTPUT_DIR"] = os.path.join(self.tmp_dir, "sg_rules")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        CONFIG["OUTPUT_DIR"] = self.output_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def run_rows(self, *rows, **options):
+        input_file = os.path.join(self.tmp_dir, "rules.csv")
+        with open(input_file, "w") as f:
+            f.write("\n".join((HEADER,) + rows) + "\n")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            passed = run_pipeline(input_file, **options)
+        return passed, output.getvalue()
+
+    def test_valid_rules_are_converted(self):
+        """Test a passing CSV is written out as per-security-group JSON."""
+        passed, output = self.run_rows(
+            "R1,a,worker,egress,443,443,tcp,null,10.0.0.0/8,null,null,x",
+            "R1,a,worker,ingress,22,22,tcp,bastion,null,null,null,x",
+        )
+        self.assertTrue(passed, output)
+        self.assertIn("Validation successful.", output)
+        with open(os.path.join(CONFIG["OUTPUT_DIR"], "worker.json")) as f:
+            rules = json.load(f)
+        self.assertEqual([(r["direction"], r["from_port"]) for r in rules], [("egress", 443), ("ingress", 22)])
+        self.assertTrue(os.path.exists("rule_count.txt"))
+
+    def test_invalid_rules_are_not_converted(self):
+        """Test nothing is written when validation fails."""
+        passed, output = self.run_rows("R1,a,worker,egress,443,80,tcp,null,10.0.0.0/8,null,null,x")
+        self.assertFalse(passed)
+        self.assertIn("From port (443) cannot be greater than to port (80)", output)
+        self.assertFalse(os.path.exists(CONFIG["OUTPUT_DIR"]))
+
+    def test_rule_order(self):
+        """Test each file lists egress before ingress, ports ordered as text and ties in CSV order."""
+        passed, output = self.run_rows(
+            "R1,a,worker,ingress,22,22,tcp,bastion,null,null,null,x",
+            "R1,b,worker,egress,9,9,tcp,null,10.0.0.0/8,null,null,x",
+            "R1,c,worker,egress,8080,8080,tcp,null,10.0.0.0/8,null,null,x",
+            "R1,d,worker,egress,9,9,tcp,null,10.0.0.0/8,null,null,y",
+        )
+        self.assertTrue(passed, output)
+        with open(os.path.join(CONFIG["OUTPUT_DIR"], "worker.json")) as f:
+            self.assertEqual([rule["name"] for rule in json.load(f)], ["c", "b", "d", "a"])
+
+    def test_manifest_skips_unchanged_groups(self):
+        """Test unchanged groups are skipped through the manifest without reading their JSON."""
+        rows = ("R1,a,worker,egress,443,443,tcp,null,10.0.0.0/8,null,null,x",
+                "R1,a,bastion,egress,22,22,tcp,worker,null,null,null,x")
+        self.assertTrue(self.run_rows(*rows)[0])
+        with open(os.path.join(CONFIG["OUTPUT_DIR"], CONFIG["MANIFEST_FILE"])) as f:
+            self.assertEqual([line.split()[1] for line in f], ["bastion.json", "worker.json"])
+
+        with mock.patch.object(convert, "read_existing_json") as read_existing_json:
+            passed, output = self.run_rows(rows[0], rows[1].replace(",22,22,", ",2222,2222,"))
+        self.assertTrue(passed)
+        self.assertIn("No changes: " + os.path.join(CONFIG["OUTPUT_DIR"], "worker.json"), output)
+        self.assertIn("Updated: " + os.path.join(CONFIG["OUTPUT_DIR"], "bastion.json"), output)
+        read_existing_json.assert_not_called()
+
+    def test_concurrent_atomic_writes(self):
+        """Test groups written across threads match a serial run, and a failed write keeps the old file."""
+        rules = {"ingress": {}, "egress": {f"sg{i}": [{"direction": "egress", "from_port": i, "to_port": i,
+                                                      "ip_protocol": "tcp"}] for i in range(40)}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            convert.sync_rules(rules, jobs=8)
+        self.assertEqual(sorted(os.listdir(CONFIG["OUTPUT_DIR"])),
+                         sorted([f"sg{i}.json" for i in range(40)] + [CONFIG["MANIFEST_FILE"]]))
+        with open(os.path.join(CONFIG["OUTPUT_DIR"], "sg7.json")) as f:
+            self.assertEqual(json.load(f)[0]["from_port"], 7)
+
+        rules["egress"]["sg7"][0]["from_port"] = 8
+        with mock.patch.object(convert.os, "replace", side_effect=OSError("disk full")), \
+                contextlib.redirect_stdout(io.StringIO()), self.assertRaises(OSError):
+            convert.sync_rules(rules, jobs=8)
+        with open(os.path.join(CONFIG["OUTPUT_DIR"], "sg7.json")) as f:
+            self.assertEqual(json.load(f)[0]["from_port"], 7)
+        self.assertFalse([f for f in os.listdir(CONFIG["OUTPUT_DIR"]) if f.endswith(".tmp")])
+
+    def test_sharded_groups(self):
+        """Test groups over the cap are written as shards, and the unsharded file is emptied."""
+        rows = [f"R{port},a,worker,egress,{port},{port},tcp,null,10.0.0.0/8,null,null,x" for port in range(100, 110)]
+        self.run_rows(*rows)
+        passed, output = self.run_rows(*rows, max_rules=4)
+        self.assertTrue(passed, output)
+        shard_files = sorted(f for f in os.listdir(CONFIG["OUTPUT_DIR"]) if ".part-" in f)
+        self.assertGreater(len(shard_files), 2)
+        ports = []
+        for file_name in shard_files:
+            with open(os.path.join(CONFIG["OUTPUT_DIR"], file_name)) as f:
+                shard = json.load(f)
+            self.assertLessEqual(len(shard), 4)
+            ports.extend(rule["from_port"] for rule in shard)
+        self.assertEqual(sorted(ports), list(range(100, 110)))
+        with open(os.path.join(CONFIG["OUTPUT_DIR"], "worker.json")) as f:
+            self.assertEqual(json.load(f), [])
+        with open("rule_count.txt") as f:
+            self.assertIn(f"- worker : {len(shard_files)} shards", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
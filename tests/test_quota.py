@@ -0,0 +1,92 @@
+import unittest
+import io
+import os
+import shutil
+import sys
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rule_validation"))
+from rule_common.quota import DEFAULT_QUOTAS, capacity_report, format_markdown, rule_limit
+from validate import DuplicateIndex, load_baseline_index, validate_csv_in_chunks, validate_delta, validate_table
+
+HEADER = ("RequestID,name,security_group_id,direction,from_port,to_port,ip_protocol,"
+          "referenced_security_group_id,cidr_ipv4,cidr_ipv6,prefix_list_id,business_justification")
+
+
+def load_rows(rows):
+    return pd.read_csv(io.StringIO("\n".join([HEADER] + rows))).fillna("null")
+
+
+def rules(sg, direction, count, source="10.0.0.0/8,null,null"):
+    return [f"R{sg}{port},a,{sg},{direction},{port},{port},tcp,null,{source},x" for port in range(count)]
+
+
+class TestQuota(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_rows(self, name, rows):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "w") as f:
+            f.write("\n".join([HEADER] + rows) + "\n")
+        return path
+
+    def test_capacity_report(self):
+        """Test usage, headroom and ordering, with prefix lists weighted by references_per_rule."""
+        df = load_rows(rules("web", "ingress", 3) + rules("db", "egress", 2, "null,null,s3")
+                       + rules("db", "ingress", 1))
+        quotas = dict(DEFAULT_QUOTAS, rules_per_sg=5, references_per_rule=2)
+        report = capacity_report(df, quotas)
+        self.assertEqual([g["security_group_id"] for g in report["security_groups"]], ["db", "web"])
+        db = report["security_groups"][0]
+        self.assertEqual(db["egress"], {"rules": 2, "used": 4, "headroom": 1})
+        self.assertEqual(db["ingress"]["headroom"], 4)
+        self.assertEqual(report["over_quota"], [])
+        self.assertIn("| db | 1 | 4 | 4 | 1 | 0 | 80% |", format_markdown(report))
+
+    def test_rules_per_eni_lowers_limit(self):
+        """Test rules_per_sg x sgs_per_eni is held to 1000 rules per interface."""
+        self.assertEqual(rule_limit(dict(DEFAULT_QUOTAS, rules_per_sg=300, sgs_per_eni=5)), 200)
+        self.assertEqual(rule_limit(DEFAULT_QUOTAS), 60)
+
+    def test_check_quotas(self):
+        """Test only the rows past the quota fail, and only when quotas are given."""
+        df = load_rows(rules("web", "ingress", 4) + rules("web", "egress", 2) + rules("db", "ingress", 3))
+        self.assertEqual(validate_table(df), {})
+        issues = validate_table(df, quotas=dict(DEFAULT_QUOTAS, rules_per_sg=3))
+        self.assertEqual([i["line_number"] for i in issues["quota_exceeded"]], [5])
+        self.assertIn("over the quota of 3", issues["quota_exceeded"][0]["error"])
+
+    def test_check_quotas_against_baseline(self):
+        """Test delta rows count on top of the baseline's usage, from a CSV or a saved .npz index."""
+        quotas = dict(DEFAULT_QUOTAS, rules_per_sg=3, references_per_rule=2)
+        baseline = self.write_rows("baseline.csv", rules("web", "ingress", 1, "null,null,s3") + rules("db", "ingress", 3))
+        new_rows = [f"N{port},a,web,ingress,{port},{port},tcp,null,10.0.0.0/8,null,null,x" for port in (100, 101)]
+        new_rows += ["N1,a,db,egress,22,22,tcp,null,10.0.0.0/8,null,null,x"]
+        new_file = self.write_rows("new.csv", new_rows)
+
+        index_file = os.path.join(self.tmp_dir, "baseline.npz")
+        DuplicateIndex.from_csv(baseline).save(index_file)
+        for source in (baseline, index_file):
+            with self.subTest(source=os.path.basename(source)):
+                issues = validate_delta(new_file, load_baseline_index(source), quotas=quotas)
+                # web ingress: 2 slots for the prefix list rule, then 3 and 4
+                self.assertEqual([i["line_number"] for i in issues["quota_exceeded"]], [7])
+                self.assertIn("to 4, over the quota of 3", issues["quota_exceeded"][0]["error"])
+                self.assertNotIn("quota_exceeded", validate_delta(new_file, load_baseline_index(source)))
+
+    def test_check_quotas_in_chunks(self):
+        """Test usage carries across chunks."""
+        input_file = self.write_rows("rules.csv", rules("web", "ingress", 4) + rules("db", "ingress", 3))
+        issues = validate_csv_in_chunks(input_file, chunk_size=2, quotas=dict(DEFAULT_QUOTAS, rules_per_sg=3))
+        self.assertEqual([i["line_number"] for i in issues["quota_exceeded"]], [5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+import unittest
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rule_validation"))
+from validate import (validate_rules, validate_ports, validate_ip_addresses, validate_csv_in_chunks,
+                      validate_delta, load_baseline_index, DuplicateIndex, summarize_issues,
+                      validate_null_input, ValidationProfile, MissingColumnsError, Validator, VALIDATORS)
+from shadowing import find_shadowed_rules
+from sg_graph import ReferenceGraph, find_unknown_references, find_unpaired_rules
+from rule_common.errors import LazyRow
+
+HEADER = ("RequestID,name,security_group_id,direction,from_port,to_port,ip_protocol,"
+          "referenced_security_group_id,cidr_ipv4,cidr_ipv6,prefix_list_id,business_justification")
+
+
+def load_rows(*rows):
+    """Build a DataFrame the same way validate.py reads firewall_rules.csv."""
+    df = pd.read_csv(io.StringIO("\n".join((HEADER,) + rows))).fillna("null")
+    return df, df.index.to_series() + 2
+
+
+class TestRuleValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.test_cases_dir = "./tests/test_cases"
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_valid_rules(self):
+        """Test that the valid rules test case produces no issues."""
+        df = pd.read_csv(os.path.join(self.test_cases_dir, "valid_rules.csv")).fillna("null")
+        df["prefix_list_id"] = "null"
+        issues = validate_rules(df, df.index.to_series() + 2)
+        self.assertFalse(issues, f"Validation failed for valid rules: {issues}")
+
+    def test_port_errors(self):
+        """Test each port error message, in row order, with correct line numbers."""
+        df, line_numbers = load_rows(
+            "R1,a,a,egress,0,256,icmp,b,null,null,null,x",
+            "R1,a,a,ingress,65,0,udp,b,null,null,null,x",
+            "R1,a,a,ingress,0,65536,tcp,b,null,null,null,x",
+            "R1,a,a,ingress,http,80,tcp,b,null,null,null,x",
+            "R1,a,a,ingress,http,80,-1,b,null,null,null,x",
+        )
+        errors = validate_ports(df, line_numbers)
+        self.assertEqual([e["line_number"] for e in errors], [2, 3, 4, 5])
+        self.assertEqual([e["error"] for e in errors], [
+            "Invalid ICMP ports: 0, 256. ICMP: ports must be 0-255 (representing type/code)",
+            "From port (65) cannot be greater than to port (0)",
+            "Invalid port range: 0, 65536. TCP/UDP: ports must be 0-65535 and from_port <= to_port",
+            "Port values must be integers, got from_port=http, to_port=80",
+        ])
+        self.assertEqual(errors[0]["row"]["security_group_id"], "a")
+
+    def test_text_ports(self):
+        """Test ports read as text (chunked and delta modes) accept 80.0 but not 1.5."""
+        df = pd.read_csv(io.StringIO("\n".join((HEADER,
+            "R1,a,a,ingress,80.0,443,tcp,b,null,null,null,x",
+            "R1,a,a,ingress,1.5,443,tcp,b,null,null,null,x",
+        ))), dtype=str).fillna("null")
+        errors = validate_ports(df, df.index.to_series() + 2)
+        self.assertEqual([e["line_number"] for e in errors], [3])
+        self.assertEqual(errors[0]["error"], "Port values must be integers, got from_port=1.5, to_port=443")
+
+    def test_ip_errors(self):
+        """Test repeated cidrs each report, ordered by row then ipv4 before ipv6."""
+        df, line_numbers = load_rows(
+            "R1,a,a,egress,443,443,tcp,null,10.0.0.1,fe80::1,null,x",
+            "R1,a,a,egress,443,443,tcp,null,10.0.0.0/8,::/0,null,x",
+            "R1,a,a,egress,443,443,tcp,null,10.0.0.1,null,null,x",
+            "R1,a,a,egress,443,443,tcp,null,10.0.0.1/33,10.0.0.0/8,null,x",
+        )
+        errors = validate_ip_addresses(df, line_numbers)
+        self.assertEqual([e["line_number"] for e in errors], [2, 2, 4, 5, 5])
+        self.assertIn("10.0.0.1 must be in CIDR notation", errors[0]["error"])
+        self.assertIn("fe80::1 must be in CIDR notation", errors[1]["error"])
+        self.assertEqual(errors[3]["error"], "Invalid CIDR block 10.0.0.1/33: Must be a valid IPv4 CIDR notation")
+        self.assertEqual(errors[4]["error"], "IP address 10.0.0.0/8 must be a valid IPv6 CIDR block")
+
+    def test_chunked_duplicates(self):
+        """Test duplicates are caught across chunk boundaries with file-relative line numbers."""
+        rows = [f"R1,a,a,egress,{port},{port},tcp,b,null,null,null,x" for port in range(1, 8)]
+        rows += [rows[0], rows[5], rows[0]]
+        input_file = os.path.join(self.tmp_dir, "chunked.csv")
+        with open(input_file, "w") as f:
+            f.write("\n".join([HEADER] + rows) + "\n")
+
+        issues = validate_csv_in_chunks(input_file, chunk_size=3)
+        self.assertEqual(list(issues), ["duplicates"])
+        self.assertEqual([(e["line_number"], e["error"]) for e in issues["duplicates"]], [
+            (9, "Duplicate rule detected (first seen on line 2)"),
+            (10, "Duplicate rule detected (first seen on line 7)"),
+            (11, "Duplicate rule detected (first seen on line 2)"),
+        ])
+
+    def test_delta_against_baseline_index(self):
+        """Test new rows are checked against a persisted baseline index and numbered as appended lines."""
+        baseline_file = os.path.join(self.tmp_dir, "baseline.csv")
+        with open(baseline_file, "w") as f:
+            f.write("\n".join([HEADER] + [f"R1,a,a,egress,{p},{p},tcp,b,null,null,null,x" for p in (22, 443)]) + "\n")
+        index_file = os.path.join(self.tmp_dir, "baseline.npz")
+        DuplicateIndex.from_csv(baseline_file).save(index_file)
+
+        new_file = os.path.join(self.tmp_dir, "new.csv")
+        with open(new_file, "w") as f:
+            f.write("\n".join([HEADER, "R2,a,a,egress,443,443,tcp,b,null,null,null,y",
+                               "R2,a,a,egress,8443,8443,tcp,b,null,null,null,y"]) + "\n")
+
+        issues = validate_delta(new_file, load_baseline_index(index_file))
+        self.assertEqual(list(issues), ["duplicates"])
+        self.assertEqual([(e["line_number"], e["error"]) for e in issues["duplicates"]],
+                         [(4, "Duplicate rule detected (first seen on line 3)")])
+
+    def test_max_errors_and_fail_fast(self):
+        """Test error caps stop validation early and summaries group errors by type."""
+        df, line_numbers = load_rows(
+            "R1,a,a,sideways,22,22,tcp,b,null,null,null,x",
+            "R1,a,a,sideways,22,22,tcp,b,null,null,null,x",
+            "R1,a,a,egress,80,22,tcp,b,null,null,null,x",
+        )
+        issues = validate_rules(df, line_numbers)
+        self.assertEqual(list(issues), ["invalid_fields", "port_validation", "duplicates"])
+        self.assertEqual(summarize_issues(issues, sample_size=1)["invalid_fields"],
+                         {"count": 2, "sample_lines": [2]})
+
+        capped = validate_rules(df, line_numbers, max_errors=3)
+        self.assertEqual({k: len(v) for k, v in capped.items()}, {"invalid_fields": 2, "port_validation": 1})
+        self.assertEqual(list(validate_rules(df, line_numbers, fail_fast=True)), ["invalid_fields"])
+
+    def test_validator_registry(self):
+        """Test registered validators run concurrently with the same results and are profiled."""
+        self.assertEqual([v.issue_type for v in VALIDATORS], [
+            "missing_fields", "invalid_fields", "port_validation", "multiple_input_declarations",
+            "ip_validation", "duplicates", "prefix_validation", "invalid_input"])
+
+        df, line_numbers = load_rows(
+            "R1,a,a,egress,80,22,tcp,b,10.0.0.0/8,null,null,x",
+            "R1,a,a,egress,22,22,tcp,null,null,null,null,x",
+        )
+        self.assertEqual(validate_null_input(df.iloc[:1], line_numbers), [])
+
+        profile = ValidationProfile()
+        issues = validate_rules(df, line_numbers, jobs=4, profile=profile)
+        self.assertEqual(repr(issues), repr(validate_rules(df, line_numbers)))
+        self.assertEqual(profile.rows, 2)
+        self.assertEqual(set(profile.seconds), {v.issue_type for v in VALIDATORS})
+
+        with self.assertRaises(MissingColumnsError):
+            validate_rules(df.drop(columns=["prefix_list_id"]), line_numbers)
+
+    def test_validator_pool_cancels_after_cap(self):
+        """Test queued validators are cancelled once fail_fast stops a concurrent run."""
+        ran = []
+
+        def failing(df, line_numbers):
+            return [{"line_number": 2, "error": "failed"}]
+
+        def slow(df, line_numbers):
+            time.sleep(0.2)
+            return []
+
+        def recorded(df, line_numbers):
+            ran.append(True)
+            return []
+
+        registry = [Validator("first", failing, (), 1), Validator("second", slow, (), 2),
+                    Validator("third", slow, (), 3)]
+        registry += [Validator(f"queued{i}", recorded, (), 4 + i) for i in range(4)]
+        df, line_numbers = load_rows("R1,a,a,egress,80,80,tcp,null,10.0.0.0/8,null,null,x")
+        with mock.patch("validate.VALIDATORS", registry):
+            issues = validate_rules(df, line_numbers, fail_fast=True, jobs=2)
+        self.assertEqual(list(issues), ["first"])
+        self.assertEqual(ran, [])
+
+    def test_shadowed_and_overlapping_rules(self):
+        """Test containment through nested CIDRs, protocol -1 and partial port overlaps."""
+        df, line_numbers = load_rows(
+            "R1,a,a,egress,0,65535,tcp,null,10.0.0.0/16,null,null,x",
+            "R1,a,a,egress,443,443,tcp,null,10.0.0.5/32,null,null,x",
+            "R1,a,a,egress,400,450,udp,null,10.0.0.5/32,null,null,x",
+            "R1,a,a,ingress,443,443,tcp,null,10.0.0.5/32,null,null,x",
+            "R1,a,a,egress,53,53,udp,b,null,null,null,x",
+            "R1,a,a,egress,0,0,-1,b,null,null,null,x",
+            "R1,a,a,egress,443,500,udp,null,10.0.0.5/32,null,null,x",
+        )
+        issues = find_shadowed_rules(df, line_numbers)
+        self.assertEqual([(e["line_number"], e["error"]) for e in issues["shadowed_rules"]], [
+            (3, "Rule is shadowed by the rule on line 2"),
+            (6, "Rule is shadowed by the rule on line 7"),
+        ])
+        self.assertEqual([(e["line_number"], e["error"]) for e in issues["overlapping_rules"]],
+                         [(8, "Port range overlaps the rule on line 4")])
+        row = issues["overlapping_rules"][0]["row"]
+        self.assertIsInstance(row, LazyRow)
+        self.assertEqual((row["ip_protocol"], row["to_port"]), ("udp", 500))
+
+        # Integer-valued decimal ports, which validation accepts, are compared as integers
+        df, line_numbers = load_rows(
+            "R1,a,a,egress,0,65535,tcp,null,10.0.0.0/16,null,null,x",
+            "R1,a,a,egress,443,443,tcp,null,10.0.0.5/32,null,null,x",
+        )
+        df[["from_port", "to_port"]] = df[["from_port", "to_port"]].astype(str) + ".0"
+        issues = find_shadowed_rules(df, line_numbers)
+        self.assertEqual([e["line_number"] for e in issues["shadowed_rules"]], [3])
+
+    def test_reference_graph(self):
+        """Test unknown references, cycles, fan-in/fan-out and reachability queries."""
+        df, line_numbers = load_rows(
+            "R1,a,web,egress,443,443,tcp,api,null,null,null,x",
+            "R1,a,api,ingress,443,443,tcp,web,null,null,null,x",
+            "R1,a,api,egress,5432,5432,tcp,db,null,null,null,x",
+            "R1,a,db,egress,0,0,-1,api,null,null,null,x",
+            "R1,a,db,ingress,22,22,tcp,bastion,null,null,null,x",
+            "R1,a,web,ingress,443,443,tcp,null,0.0.0.0/0,null,null,x",
+        )
+        issues = find_unknown_references(df, line_numbers)
+        self.assertEqual([e["line_number"] for e in issues["unknown_security_group_references"]], [6])
+        self.assertIsInstance(issues["unknown_security_group_references"][0]["row"], LazyRow)
+
+        graph = ReferenceGraph(df)
+        self.assertEqual(graph.strongly_connected_components(), [["api", "db"]])
+        self.assertEqual((graph.fan_in("api"), graph.fan_out("api")), (2, 1))
+        self.assertEqual(graph.who_can_reach("api", 443), [
+            {"security_group_id": "db", "ingress": False, "egress": True, "positions": [3]},
+            {"security_group_id": "web", "ingress": True, "egress": True, "positions": [0, 1]},
+        ])
+        self.assertEqual(graph.who_can_reach("api", 80), [
+            {"security_group_id": "db", "ingress": False, "egress": True, "positions": [3]},
+        ])
+
+    def test_unpaired_rules(self):
+        """Test ingress and egress rules pair on peer, protocol and ports, with -1 pairing with anything."""
+        df, line_numbers = load_rows(
+            "R1,a,web,egress,443,443,tcp,api,null,null,null,x",
+            "R1,a,api,ingress,443,443,tcp,web,null,null,null,x",
+            "R1,a,web,egress,8080,8080,tcp,api,null,null,null,x",
+            "R1,a,api,ingress,9090,9090,tcp,web,null,null,null,x",
+            "R1,a,db,ingress,5432,5432,tcp,api,null,null,null,x",
+            "R1,a,api,egress,0,0,-1,db,null,null,null,x",
+            "R1,a,db,ingress,22,22,tcp,bastion,null,null,null,x",
+        )
+        issues = find_unpaired_rules(df, line_numbers)
+        self.assertEqual([(e["line_number"], e["error"]) for e in issues["unpaired_rules"]], [
+            (4, "No matching ingress rule on api referencing web"),
+            (5, "No matching egress rule on web referencing api"),
+            (7, "No matching ingress rule on db referencing api"),
+        ])
+        self.assertEqual(find_unpaired_rules(*load_rows(
+            "R1,a,web,egress,443,443,tcp,api,null,null,null,x",
+            "R1,a,api,ingress,443,443,tcp,web,null,null,null,x",
+        )), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import argparse
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rule_conversion"))
+from sharding import parse_max_rules, shard_records
+
+
+def rule(port, direction="egress"):
+    return {"RequestID": f"R{port}", "name": "a", "security_group_id": "worker", "direction": direction,
+            "from_port": port, "to_port": port, "ip_protocol": "tcp", "referenced_security_group_id": "null",
+            "cidr_ipv4": "10.0.0.0/8", "cidr_ipv6": "null", "prefix_list_id": "null",
+            "business_justification": "x"}
+
+
+class TestSharding(unittest.TestCase):
+
+    def test_cap_per_direction(self):
+        """Test shards stay within the cap per direction and keep every rule in order."""
+        records = [rule(port) for port in range(200)] + [rule(port, "ingress") for port in range(50)]
+        shards = shard_records(records, 40)
+        self.assertGreater(len(shards), 1)
+        for shard in shards.values():
+            self.assertLessEqual(sum(r["direction"] == "egress" for r in shard), 40)
+            self.assertLessEqual(sum(r["direction"] == "ingress" for r in shard), 40)
+            self.assertEqual(shard, [r for r in records if r in shard])
+        self.assertEqual(sorted(r["RequestID"] for shard in shards.values() for r in shard),
+                         sorted(r["RequestID"] for r in records))
+        self.assertEqual(shard_records(records[:40], 40), {1: records[:40]})
+
+    def test_stable_assignment(self):
+        """Test adding a rule or editing a justification changes only one shard."""
+        records = [rule(port) for port in range(200)]
+        before = shard_records(records, 40)
+        after = shard_records(records + [rule(1000)], 40)
+        changed = [shard for shard in set(before) | set(after) if before.get(shard) != after.get(shard)]
+        self.assertEqual(len(changed), 1)
+
+        edited = [dict(r, business_justification="y") if r["from_port"] == 7 else r for r in records]
+        after = shard_records(edited, 40)
+        self.assertEqual(set(before), set(after))
+        self.assertEqual(sum(before[shard] != after[shard] for shard in before), 1)
+
+    def test_max_rules_must_be_positive(self):
+        """Test a cap below one is rejected, by shard_records and as a command-line value."""
+        records = [rule(port) for port in range(3)]
+        for max_rules in (0, -1):
+            self.assertRaises(ValueError, shard_records, records, max_rules)
+        self.assertEqual(parse_max_rules("40"), 40)
+        for text in ("0", "-5", "x"):
+            self.assertRaises(argparse.ArgumentTypeError, parse_max_rules, text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rule_conversion"))
+from terraform import terraform_document, resource_name
+
+
+def rule(**fields):
+    base = {"RequestID": "R1", "name": "a", "security_group_id": "ecr.api", "direction": "egress",
+            "from_port": 443, "to_port": 443, "ip_protocol": "tcp", "referenced_security_group_id": "null",
+            "cidr_ipv4": "10.0.0.0/8", "cidr_ipv6": "null", "prefix_list_id": "null",
+            "business_justification": "x"}
+    base.update(fields)
+    return base
+
+
+class TestTerraform(unittest.TestCase):
+
+    def test_resources(self):
+        """Test rules map to typed resources with references and no ports on protocol -1."""
+        document = terraform_document([
+            rule(),
+            rule(direction="ingress", ip_protocol="-1", from_port=0, to_port=0, cidr_ipv4="null",
+                 referenced_security_group_id="worker_nodes"),
+            rule(cidr_ipv4="null", prefix_list_id="s3"),
+        ])
+        egress = document["resource"]["aws_vpc_security_group_egress_rule"]
+        ingress = document["resource"]["aws_vpc_security_group_ingress_rule"]
+        self.assertEqual(len(egress), 2)
+        (ingress_rule,) = ingress.values()
+        self.assertEqual(ingress_rule["referenced_security_group_id"], '${var.security_group_ids["worker_nodes"]}')
+        self.assertNotIn("from_port", ingress_rule)
+        self.assertIn('${var.prefix_list_ids["s3"]}', [r.get("prefix_list_id") for r in egress.values()])
+        self.assertEqual(terraform_document([]), {})
+
+    def test_stable_names(self):
+        """Test names depend only on identity fields and are valid Terraform identifiers."""
+        name = resource_name(rule())
+        self.assertTrue(name.startswith("ecr_api_"))
+        self.assertEqual(name, resource_name(rule(RequestID="R9", name="b", business_justification="y")))
+        self.assertNotEqual(name, resource_name(rule(to_port=444)))
+
+        document = terraform_document([rule(), rule(name="b")])
+        self.assertEqual(sorted(document["resource"]["aws_vpc_security_group_egress_rule"]), [name, f"{name}_2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,63 +1,177 @@
-import pytest
-import yaml
-import glob
-import subprocess
-import difflib
-from pathlib import Path
-
-def load_cases_and_ids():
-    all_cases = []
-    all_ids = []
-    for file in glob.glob("test_harness/*.yaml"):
-        with open(file) as f:
-            loaded = yaml.safe_load(f)
-            if isinstance(loaded, list):
-                for case in loaded:
-                    all_cases.append(case)
-                    case_name = case.get("name") or file
-                    all_ids.append(case_name)
-            elif isinstance(loaded, dict):
-                all_cases.append(loaded)
-                case_name = loaded.get("name") or file
-                all_ids.append(case_name)
-    return all_cases, all_ids
-
-cases, case_ids = load_cases_and_ids()
-
-@pytest.mark.parametrize("case", cases, ids=case_ids)
-def test_policy(case, tmp_path, output_mode):
-    req_file = tmp_path / "request.yaml"
-    req_file.write_text(case["request"])
-
-    validator_path = Path("../../yaml-duplicate-validator/yaml-duplicate-validator.py")
-
-    cmd = ["python3", str(validator_path), str(req_file)]
-
-    if case.get("existing") and case["existing"] not in [None, "", "null"]:
-        existing_file = tmp_path / "existing-policy.yaml"
-        existing_file.write_text(case["existing"])
-        cmd.append(str(existing_file))
-
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    actual_output = result.stdout.strip()
-    expected_output = case["expected_output"].strip()
-
-    if expected_output != actual_output:
-        if output_mode in ("actual", "all"):
-            print("\nEXPECTED OUTPUT:\n")
-            print(expected_output)
-            print("\nACTUAL OUTPUT:\n")
-            print(actual_output)
-        if output_mode in ("ndiff", "all"):
-            print("\nNDIFF (inline):\n")
-            for line in difflib.ndiff(expected_output.splitlines(), actual_output.splitlines()):
-                if line.startswith('- ') or line.startswith('+ '):
-                    print(line)
-        if output_mode in ("unified", "all"):
-            print("\nUNIFIED DIFF (patch style):\n")
-            print('\n'.join(difflib.unified_diff(
-                expected_output.splitlines(),
-                actual_output.splitlines(),
-                fromfile='expected', tofile='actual', lineterm=''
-            )))
-        assert False, "Output mismatch, see above diff(s)"
+import pytest
+import yaml
+import glob
+import subprocess
+import difflib
+from pathlib import Path
+
+def load_cases_and_ids():
+    all_cases = []
+    all_ids = []
+    for file in glob.glob("test_harness/*.yaml"):
+        with open(file) as f:
+            loaded = yaml.safe_load(f)
+            if isinstance(loaded, list):
+                for case in loaded:
+                    all_cases.append(case)
+                    case_name = case.get("name") or file
+                    all_ids.append(case_name)
+            elif isinstance(loaded, dict):
+                all_cases.append(loaded)
+                case_name = loaded.get("name") or file
+                all_ids.append(case_name)
+    return all_cases, all_ids
+
+cases, case_ids = load_cases_and_ids()
+
+NO_DUPLICATES = "💦 No Duplicates detected!"
+
+@pytest.mark.parametrize("case", cases, ids=case_ids)
+def test_policy(case, tmp_path, output_mode):
+    req_file = tmp_path / "request.yaml"
+    req_file.write_text(case["request"])
+
+    validator_path = Path("../../yaml-duplicate-validator/yaml-duplicate-validator.py")
+
+    cmd = ["python3", str(validator_path), *case.get("args", []), str(req_file)]
+
+    if case.get("existing") and case["existing"] not in [None, "", "null"]:
+        existing_file = tmp_path / "existing-policy.yaml"
+        existing_file.write_text(case["existing"])
+        cmd.append(str(existing_file))
+
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    actual_output = result.stdout.strip()
+    expected_output = case["expected_output"].strip()
+
+    if expected_output != actual_output:
+        if output_mode in ("actual", "all"):
+            print("\nEXPECTED OUTPUT:\n")
+            print(expected_output)
+            print("\nACTUAL OUTPUT:\n")
+            print(actual_output)
+        if output_mode in ("ndiff", "all"):
+            print("\nNDIFF (inline):\n")
+            for line in difflib.ndiff(expected_output.splitlines(), actual_output.splitlines()):
+                if line.startswith('- ') or line.startswith('+ '):
+                    print(line)
+        if output_mode in ("unified", "all"):
+            print("\nUNIFIED DIFF (patch style):\n")
+            print('\n'.join(difflib.unified_diff(
+                expected_output.splitlines(),
+                actual_output.splitlines(),
+                fromfile='expected', tofile='actual', lineterm=''
+            )))
+        assert False, "Output mismatch, see above diff(s)"
+
+def test_batch_matches_single_runs(tmp_path):
+    # Every case again, with the cases sharing an existing policy and flags checked in one --batch run
+    validator_path = Path("../../yaml-duplicate-validator/yaml-duplicate-validator.py")
+    groups = {}
+    for n, case in enumerate(cases):
+        existing = case.get("existing")
+        if existing in [None, "", "null"]:
+            existing = None
+        groups.setdefault((existing, tuple(case.get("args", []))), []).append((n, case))
+
+    for g, ((existing, args), group) in enumerate(groups.items()):
+        group_dir = tmp_path / f"group{g}"
+        (group_dir / "requests").mkdir(parents=True)
+        for n, case in group:
+            (group_dir / "requests" / f"case{n}.yaml").write_text(case["request"])
+        cmd = ["python3", str(validator_path), *args, "--batch", str(group_dir / "requests"),
+               "--report-dir", str(group_dir / "reports"), "--jobs", "2"]
+        if existing is not None:
+            (group_dir / "existing-policy.yaml").write_text(existing)
+            cmd += ["--existing-file", str(group_dir / "existing-policy.yaml")]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+        for n, case in group:
+            report = (group_dir / "reports" / f"case{n}.md").read_text().strip()
+            assert report == case["expected_output"].strip(), case.get("name")
+        assert result.returncode == batch_exit_code(case for _, case in group)
+        assert "ERROR" not in result.stderr and "Traceback" not in result.stderr
+
+def batch_exit_code(group):
+    # 2 if any request has duplicates, else 0
+    return 2 if any(case["expected_output"].strip() != NO_DUPLICATES for case in group) else 0
+
+def test_batch_pairs_match_single_runs(tmp_path):
+    # Every case again, each with its own existing policy as a REQUEST,EXISTING_FILE entry, in one
+    # --batch run per set of flags
+    validator_path = Path("../../yaml-duplicate-validator/yaml-duplicate-validator.py")
+    groups = {}
+    for n, case in enumerate(cases):
+        groups.setdefault(tuple(case.get("args", [])), []).append((n, case))
+
+    for g, (args, group) in enumerate(groups.items()):
+        group_dir = tmp_path / f"group{g}"
+        group_dir.mkdir()
+        entries = []
+        for n, case in group:
+            (group_dir / f"case{n}.yaml").write_text(case["request"])
+            entry = str(group_dir / f"case{n}.yaml")
+            if case.get("existing") not in [None, "", "null"]:
+                (group_dir / f"existing{n}.yaml").write_text(case["existing"])
+                entry += f",{group_dir / f'existing{n}.yaml'}"
+            entries.append(entry)
+        cmd = ["python3", str(validator_path), *args, "--batch", *entries,
+               "--report-dir", str(group_dir / "reports")]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+        for n, case in group:
+            report = (group_dir / "reports" / f"case{n}.md").read_text().strip()
+            assert report == case["expected_output"].strip(), case.get("name")
+        assert result.returncode == batch_exit_code(case for _, case in group)
+        assert "ERROR" not in result.stderr and "Traceback" not in result.stderr
+
+existing_cases = [(case, case_id) for case, case_id in zip(cases, case_ids)
+                  if case.get("existing") not in [None, "", "null"]]
+
+@pytest.mark.parametrize("case", [c for c, _ in existing_cases], ids=[i for _, i in existing_cases])
+def test_index_dir_matches_yaml(case, tmp_path):
+    # The first run compiles the existing policy into --index-dir, the second loads it from there
+    req_file = tmp_path / "request.yaml"
+    req_file.write_text(case["request"])
+    existing_file = tmp_path / "existing-policy.yaml"
+    existing_file.write_text(case["existing"])
+
+    validator_path = Path("../../yaml-duplicate-validator/yaml-duplicate-validator.py")
+    cmd = ["python3", str(validator_path), *case.get("args", []), "--index-dir", str(tmp_path / "index"),
+           str(req_file), str(existing_file)]
+    for run in ("Saved", "Loaded"):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        assert f"DEBUG: {run} existing policy index" in result.stderr
+        assert result.stdout.strip() == case["expected_output"].strip()
+
+def test_index_dir_saves_enabled_kinds(tmp_path):
+    # Only the index kinds the enabled checks use are saved; a later run with more checks adds
+    # its kinds, and an unreadable index file is rebuilt instead of trusted
+    case = existing_cases[0][0]
+    req_file = tmp_path / "request.yaml"
+    req_file.write_text(case["request"])
+    existing_file = tmp_path / "existing-policy.yaml"
+    existing_file.write_text(case["existing"])
+    index_dir = tmp_path / "index"
+
+    validator_path = Path("../../yaml-duplicate-validator/yaml-duplicate-validator.py")
+    def run(*args):
+        return subprocess.run(["python3", str(validator_path), *args, str(req_file), str(existing_file)],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    run("--index-dir", str(index_dir))
+    assert sorted(p.name.rsplit("-", 1)[1] for p in index_dir.iterdir()) == ["exact.json", "rules.json"]
+
+    expected = run("--containment").stdout
+    result = run("--containment", "--index-dir", str(index_dir))
+    assert "DEBUG: Loaded existing policy index" in result.stderr
+    assert "DEBUG: Saved existing policy index" in result.stderr
+    assert result.stdout == expected
+    assert sorted(p.name.rsplit("-", 1)[1] for p in index_dir.iterdir()) == ["containment.json", "exact.json",
+                                                                             "rules.json"]
+
+    for path in index_dir.glob("*-containment.json"):
+        path.write_text("not json")
+    result = run("--containment", "--index-dir", str(index_dir))
+    assert "WARNING: ignoring unreadable index" in result.stderr
+    assert result.stdout == expected
@@ -1,282 +1,801 @@
-import os
-import sys
-import yaml
-from collections import Counter
-
-def load_yaml_file(filepath):
-    with open(filepath, "r") as f:
-        return yaml.safe_load(f)
-
-def normalize_ip(ip):
-    return ip.strip()
-
-def normalize_url(url):
-    url = (url or "").lower()
-    for prefix in ("https://", "http://"):
-        if url.startswith(prefix):
-            url = url[len(prefix):]
-    return url.rstrip("/")
-
-def rules_five_tuple_key(rule, ip_direction_key):
-    ips = frozenset(normalize_ip(ip) for ip in rule[ip_direction_key]['ips'])
-    protocol = str(rule.get("protocol", "")).lower()
-    port = str(rule.get("port", "")).strip()
-    appid = str(rule.get("appid", "")).lower()
-    url = normalize_url(rule.get("url", ""))
-    return (ips, protocol, port, appid, url)
-
-def highlight_rule(rule, ip_direction_key, highlight_ips=None, highlight_all=False):
-    lines = []
-    lines.append(f"    - request_id: {rule.get('request_id')}")
-    lines.append(f"      {ip_direction_key}:")
-    lines.append(f"        ips:")
-    for ip in rule[ip_direction_key]['ips']:
-        prefix = ">>" if highlight_all or (highlight_ips and ip in highlight_ips) else "  "
-        lines.append(f"{prefix}          - {ip}")
-    for key in ["protocol", "port", "appid", "url"]:
-        val = rule.get(key)
-        prefix = ">>" if highlight_all else "  "
-        lines.append(f"{prefix}      {key}: {val}")
-    return "\n".join(lines)
-
-def find_duplicate_ips_within_rule(rules, ip_direction_key):
-    result = []
-    for idx, rule in enumerate(rules):
-        ips = rule[ip_direction_key]['ips']
-        dup_ips = [ip for ip, c in Counter(ips).items() if c > 1]
-        if dup_ips:
-            block = []
-            block.append(f"### Duplicate detected within requested policy rule {idx+1}")
-            block.append("```yaml")
-            block.append(highlight_rule(rule, ip_direction_key, set(dup_ips)))
-            block.append("```")
-            result.append("\n".join(block))
-    return result
-
-def find_five_tuple_dupes_within(rules, ip_direction_key):
-    result = []
-    seen = {}
-    for i, rule_i in enumerate(rules):
-        key = rules_five_tuple_key(rule_i, ip_direction_key)
-        if key in seen:
-            j = seen[key]
-            block = []
-            block.append(f"### Duplicate detected between requested policy rule {j+1} and rule {i+1}")
-            block.append("")
-            block.append(f"#### Requested policy rule {j+1}")
-            block.append("```yaml")
-            block.append(highlight_rule(rules[j], ip_direction_key, highlight_all=True))
-            block.append("```")
-            block.append("")
-            block.append(f"#### Requested policy rule {i+1}")
-            block.append("```yaml")
-            block.append(highlight_rule(rule_i, ip_direction_key, highlight_all=True))
-            block.append("```")
-            result.append("\n".join(block))
-        else:
-            seen[key] = i
-    return result
-
-def find_per_ip_5tuple_dupes_within(rules, ip_direction_key):
-    result = []
-    seen = {}
-    for idx, rule in enumerate(rules):
-        proto = str(rule.get("protocol", "")).lower()
-        port = str(rule.get("port", "")).strip()
-        appid = str(rule.get("appid", "")).lower()
-        url = normalize_url(rule.get("url", ""))
-        for ip in rule[ip_direction_key]['ips']:
-            key = (normalize_ip(ip), proto, port, appid, url)
-            if key in seen:
-                for other_idx in seen[key]:
-                    if idx == other_idx:
-                        continue
-                    if set(rule[ip_direction_key]['ips']) != set(rules[other_idx][ip_direction_key]['ips']):
-                        pair = tuple(sorted([idx, other_idx]))
-                        block = []
-                        block.append(f"### Duplicate detected between requested policy rule {other_idx+1} and rule {idx+1}")
-                        block.append("")
-                        block.append(f"#### Requested policy rule {other_idx+1}")
-                        block.append("```yaml")
-                        block.append(highlight_rule(rules[other_idx], ip_direction_key, highlight_ips={ip}))
-                        block.append("```")
-                        block.append("")
-                        block.append(f"#### Requested policy rule {idx+1}")
-                        block.append("```yaml")
-                        block.append(highlight_rule(rule, ip_direction_key, highlight_ips={ip}))
-                        block.append("```")
-                        result.append("\n".join(block))
-                seen[key].append(idx)
-            else:
-                seen[key] = [idx]
-    return result
-
-def find_five_tuple_dupes_between(req_rules, exist_rules, ip_direction_key):
-    result = []
-    matched_req = set()
-    matched_exist = set()
-    full_tuple_pairs = set()
-    for i, req_rule in enumerate(req_rules):
-        req_key = rules_five_tuple_key(req_rule, ip_direction_key)
-        for j, exist_rule in enumerate(exist_rules):
-            exist_key = rules_five_tuple_key(exist_rule, ip_direction_key)
-            if req_key == exist_key:
-                matched_req.add(i)
-                matched_exist.add(j)
-                full_tuple_pairs.add((i, j))
-                block = []
-                block.append(f"### Duplicate detected between requested policy rule {i+1} and existing policy rule {j+1}")
-                block.append("")
-                block.append(f"#### Requested policy rule {i+1}")
-                block.append("```yaml")
-                block.append(highlight_rule(req_rule, ip_direction_key, highlight_all=True))
-                block.append("```")
-                block.append("")
-                block.append(f"#### Existing policy rule {j+1}")
-                block.append("```yaml")
-                block.append(highlight_rule(exist_rule, ip_direction_key, highlight_all=True))
-                block.append("```")
-                result.append("\n".join(block))
-    return result, full_tuple_pairs
-
-def find_per_ip_5tuple_dupes_between(req_rules, exist_rules, ip_direction_key, already_full_pairs=None):
-    result = []
-    emitted = set()
-    already_full_pairs = already_full_pairs or set()
-    for i, req_rule in enumerate(req_rules):
-        proto = str(req_rule.get("protocol", "")).lower()
-        port = str(req_rule.get("port", "")).strip()
-        appid = str(req_rule.get("appid", "")).lower()
-        url = normalize_url(req_rule.get("url", ""))
-        for req_ip in req_rule[ip_direction_key]['ips']:
-            req_tuple = (normalize_ip(req_ip), proto, port, appid, url)
-            for j, exist_rule in enumerate(exist_rules):
-                if (i, j) in already_full_pairs:
-                    continue  # skip rule-pairs already reported as full 5-tuple dupes
-                exist_proto = str(exist_rule.get("protocol", "")).lower()
-                exist_port = str(exist_rule.get("port", "")).strip()
-                exist_appid = str(exist_rule.get("appid", "")).lower()
-                exist_url = normalize_url(exist_rule.get("url", ""))
-                for exist_ip in exist_rule[ip_direction_key]['ips']:
-                    exist_tuple = (normalize_ip(exist_ip), exist_proto, exist_port, exist_appid, exist_url)
-                    if req_tuple == exist_tuple:
-                        pair = (i, j, req_ip)
-                        if pair in emitted:
-                            continue
-                        emitted.add(pair)
-                        block = []
-                        block.append(f"### Duplicate detected between requested policy rule {i+1} and existing policy rule {j+1}")
-                        block.append("")
-                        block.append(f"#### Requested policy rule {i+1}")
-                        block.append("```yaml")
-                        block.append(highlight_rule(req_rule, ip_direction_key, {req_ip}))
-                        block.append("```")
-                        block.append("")
-                        block.append(f"#### Existing policy rule {j+1}")
-                        block.append("```yaml")
-                        block.append(highlight_rule(exist_rule, ip_direction_key, {exist_ip}))
-                        block.append("```")
-                        result.append("\n".join(block))
-    return result
-
-def main():
-    try:
-        # print("DEBUG: yaml-duplicate-validator starting...", file=sys.stderr)
-
-        if len(sys.argv) < 2:
-            print("Usage: python yaml-duplicate-validator.py <request_file> [existing_file]", file=sys.stderr)
-            sys.exit(2)
-
-        request_file = sys.argv[1]
-        existing_file = sys.argv[2] if len(sys.argv) > 2 else None
-
-        print(f"DEBUG: request_file={request_file}", file=sys.stderr)
-        if existing_file:
-            print(f"DEBUG: existing_file={existing_file}", file=sys.stderr)
-
-        if not os.path.isfile(request_file):
-            print(f"ERROR: Cannot find request_file {request_file}", file=sys.stderr)
-            sys.exit(3)
-
-        request_policy = load_yaml_file(request_file)
-        service_type = request_policy.get("security_group", {}).get("serviceType", "")
-        ip_direction_key = "source" if service_type == "privatelink-consumer" else "destination"
-        rules = request_policy.get("rules", [])
-
-        print(f"DEBUG: Loaded {len(rules)} rules from {request_file}", file=sys.stderr)
-
-        sections_within = {}
-        sections_between = {}
-
-        key_within_5tuple = "Full 5-tuple rule duplicate within requested policy"
-        key_within_per_ip = "Per-IP 5-tuple duplicate within requested policy"
-        key_within_dupe_ips = "Duplicate IPs within a single rule"
-        key_between_5tuple = "Full 5-tuple duplicate between requested and existing policy"
-        key_between_per_ip = "Per-IP 5-tuple duplicates across files"
-
-        within_5tuple = find_five_tuple_dupes_within(rules, ip_direction_key)
-        if within_5tuple:
-            sections_within[key_within_5tuple] = within_5tuple
-        within_per_ip = find_per_ip_5tuple_dupes_within(rules, ip_direction_key)
-        if within_per_ip:
-            sections_within[key_within_per_ip] = within_per_ip
-        within_dupe_ips = find_duplicate_ips_within_rule(rules, ip_direction_key)
-        if within_dupe_ips:
-            sections_within[key_within_dupe_ips] = within_dupe_ips
-
-        exist_rules = []
-        full_tuple_pairs = set()
-        if existing_file and os.path.isfile(existing_file):
-            existing_policy = load_yaml_file(existing_file)
-            exist_rules = existing_policy.get("rules", [])
-            between_5tuple, full_tuple_pairs = find_five_tuple_dupes_between(rules, exist_rules, ip_direction_key)
-            if between_5tuple:
-                sections_between[key_between_5tuple] = between_5tuple
-            between_per_ip = find_per_ip_5tuple_dupes_between(rules, exist_rules, ip_direction_key, already_full_pairs=full_tuple_pairs)
-            if between_per_ip:
-                sections_between[key_between_per_ip] = between_per_ip
-
-        output_lines = []
-
-        if sections_within:
-            output_lines.append("# ❌ Duplicates detected within requested policy")
-            for header in [
-                key_within_5tuple,
-                key_within_per_ip,
-                key_within_dupe_ips,
-            ]:
-                if header in sections_within:
-                    output_lines.append("")  
-                    output_lines.append(f"## {header}")
-                    for block in sections_within[header]:
-                        output_lines.append("")
-                        output_lines.append(block)
-
-        if sections_between:
-            if output_lines:
-                output_lines.append("")
-            output_lines.append("# ❌ Duplicates detected between requested and existing policy")
-            for header in [
-                key_between_5tuple,
-                key_between_per_ip,
-            ]:
-                if header in sections_between:
-                    output_lines.append("")
-                    output_lines.append(f"## {header}")
-                    for block in sections_between[header]:
-                        output_lines.append("")
-                        output_lines.append(block)
-
-        if output_lines:
-            print("\n".join(output_lines).rstrip())
-            sys.exit(2)
-        else:
-            print("💦 No Duplicates detected!")
-            sys.exit(0)
-    
-    except Exception as e:
-        print(f"ERROR: {e}", file=sys.stderr)
-        sys.exit(1)
-
-if __name__ == "__main__":
-    main()
+import argparse
+import bisect
+import gc
+import glob
+import hashlib
+import ipaddress
+import json
+import os
+import sys
+import tempfile
+import yaml
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+def load_yaml_file(filepath):
+    with open(filepath, "r") as f:
+        return yaml.safe_load(f)
+
+def normalize_ip(ip):
+    return ip.strip()
+
+def normalize_url(url):
+    url = (url or "").lower()
+    for prefix in ("https://", "http://"):
+        if url.startswith(prefix):
+            url = url[len(prefix):]
+    return url.rstrip("/")
+
+def rule_fields_key(rule):
+    protocol = str(rule.get("protocol", "")).lower()
+    port = str(rule.get("port", "")).strip()
+    appid = str(rule.get("appid", "")).lower()
+    url = normalize_url(rule.get("url", ""))
+    return (protocol, port, appid, url)
+
+def rules_five_tuple_key(rule, ip_direction_key):
+    ips = frozenset(normalize_ip(ip) for ip in rule[ip_direction_key]['ips'])
+    return (ips,) + rule_fields_key(rule)
+
+def build_existing_index(exist_rules, ip_direction_key):
+    # Normalize every existing rule once: full 5-tuple -> [rule index], and
+    # per-IP 5-tuple -> [(rule index, first IP of that rule with the key)], both in file order
+    five_tuple_index = {}
+    per_ip_index = {}
+    for j, exist_rule in enumerate(exist_rules):
+        five_tuple_index.setdefault(rules_five_tuple_key(exist_rule, ip_direction_key), []).append(j)
+        fields = rule_fields_key(exist_rule)
+        for exist_ip in exist_rule[ip_direction_key]['ips']:
+            matches = per_ip_index.setdefault((normalize_ip(exist_ip),) + fields, [])
+            if not matches or matches[-1][0] != j:
+                matches.append((j, exist_ip))
+    return five_tuple_index, per_ip_index
+
+def highlight_rule(rule, ip_direction_key, highlight_ips=None, highlight_all=False):
+    lines = []
+    lines.append(f"    - request_id: {rule.get('request_id')}")
+    lines.append(f"      {ip_direction_key}:")
+    lines.append(f"        ips:")
+    for ip in rule[ip_direction_key]['ips']:
+        prefix = ">>" if highlight_all or (highlight_ips and ip in highlight_ips) else "  "
+        lines.append(f"{prefix}          - {ip}")
+    for key in ["protocol", "port", "appid", "url"]:
+        val = rule.get(key)
+        prefix = ">>" if highlight_all else "  "
+        lines.append(f"{prefix}      {key}: {val}")
+    return "\n".join(lines)
+
+def find_duplicate_ips_within_rule(rules, ip_direction_key):
+    result = []
+    for idx, rule in enumerate(rules):
+        ips = rule[ip_direction_key]['ips']
+        dup_ips = [ip for ip, c in Counter(ips).items() if c > 1]
+        if dup_ips:
+            block = []
+            block.append(f"### Duplicate detected within requested policy rule {idx+1}")
+            block.append("```yaml")
+            block.append(highlight_rule(rule, ip_direction_key, set(dup_ips)))
+            block.append("```")
+            result.append("\n".join(block))
+    return result
+
+def find_five_tuple_dupes_within(rules, ip_direction_key):
+    result = []
+    seen = {}
+    for i, rule_i in enumerate(rules):
+        key = rules_five_tuple_key(rule_i, ip_direction_key)
+        if key in seen:
+            j = seen[key]
+            block = []
+            block.append(f"### Duplicate detected between requested policy rule {j+1} and rule {i+1}")
+            block.append("")
+            block.append(f"#### Requested policy rule {j+1}")
+            block.append("```yaml")
+            block.append(highlight_rule(rules[j], ip_direction_key, highlight_all=True))
+            block.append("```")
+            block.append("")
+            block.append(f"#### Requested policy rule {i+1}")
+            block.append("```yaml")
+            block.append(highlight_rule(rule_i, ip_direction_key, highlight_all=True))
+            block.append("```")
+            result.append("\n".join(block))
+        else:
+            seen[key] = i
+    return result
+
+def find_per_ip_5tuple_dupes_within(rules, ip_direction_key):
+    result = []
+    seen = {}
+    for idx, rule in enumerate(rules):
+        proto = str(rule.get("protocol", "")).lower()
+        port = str(rule.get("port", "")).strip()
+        appid = str(rule.get("appid", "")).lower()
+        url = normalize_url(rule.get("url", ""))
+        for ip in rule[ip_direction_key]['ips']:
+            key = (normalize_ip(ip), proto, port, appid, url)
+            if key in seen:
+                for other_idx in seen[key]:
+                    if idx == other_idx:
+                        continue
+                    if set(rule[ip_direction_key]['ips']) != set(rules[other_idx][ip_direction_key]['ips']):
+                        pair = tuple(sorted([idx, other_idx]))
+                        block = []
+                        block.append(f"### Duplicate detected between requested policy rule {other_idx+1} and rule {idx+1}")
+                        block.append("")
+                        block.append(f"#### Requested policy rule {other_idx+1}")
+                        block.append("```yaml")
+                        block.append(highlight_rule(rules[other_idx], ip_direction_key, highlight_ips={ip}))
+                        block.append("```")
+                        block.append("")
+                        block.append(f"#### Requested policy rule {idx+1}")
+                        block.append("```yaml")
+                        block.append(highlight_rule(rule, ip_direction_key, highlight_ips={ip}))
+                        block.append("```")
+                        result.append("\n".join(block))
+                seen[key].append(idx)
+            else:
+                seen[key] = [idx]
+    return result
+
+def find_five_tuple_dupes_between(req_rules, exist_rules, ip_direction_key, index=None):
+    result = []
+    full_tuple_pairs = set()
+    if index is None:
+        index = build_existing_index(exist_rules, ip_direction_key) if req_rules else ({}, {})
+    for i, req_rule in enumerate(req_rules):
+        req_key = rules_five_tuple_key(req_rule, ip_direction_key)
+        for j in index[0].get(req_key, ()):
+            exist_rule = exist_rules[j]
+            full_tuple_pairs.add((i, j))
+            block = []
+            block.append(f"### Duplicate detected between requested policy rule {i+1} and existing policy rule {j+1}")
+            block.append("")
+            block.append(f"#### Requested policy rule {i+1}")
+            block.append("```yaml")
+            block.append(highlight_rule(req_rule, ip_direction_key, highlight_all=True))
+            block.append("```")
+            block.append("")
+            block.append(f"#### Existing policy rule {j+1}")
+            block.append("```yaml")
+            block.append(highlight_rule(exist_rule, ip_direction_key, highlight_all=True))
+            block.append("```")
+            result.append("\n".join(block))
+    return result, full_tuple_pairs
+
+def find_per_ip_5tuple_dupes_between(req_rules, exist_rules, ip_direction_key, already_full_pairs=None, index=None):
+    result = []
+    emitted = set()
+    already_full_pairs = already_full_pairs or set()
+    if index is None:
+        index = build_existing_index(exist_rules, ip_direction_key) if req_rules else ({}, {})
+    for i, req_rule in enumerate(req_rules):
+        fields = rule_fields_key(req_rule)
+        for req_ip in req_rule[ip_direction_key]['ips']:
+            req_tuple = (normalize_ip(req_ip),) + fields
+            for j, exist_ip in index[1].get(req_tuple, ()):
+                if (i, j) in already_full_pairs:
+                    continue  # skip rule-pairs already reported as full 5-tuple dupes
+                exist_rule = exist_rules[j]
+                pair = (i, j, req_ip)
+                if pair in emitted:
+                    continue
+                emitted.add(pair)
+                block = []
+                block.append(f"### Duplicate detected between requested policy rule {i+1} and existing policy rule {j+1}")
+                block.append("")
+                block.append(f"#### Requested policy rule {i+1}")
+                block.append("```yaml")
+                block.append(highlight_rule(req_rule, ip_direction_key, {req_ip}))
+                block.append("```")
+                block.append("")
+                block.append(f"#### Existing policy rule {j+1}")
+                block.append("```yaml")
+                block.append(highlight_rule(exist_rule, ip_direction_key, {exist_ip}))
+                block.append("```")
+                result.append("\n".join(block))
+    return result
+
+class PrefixTrie:
+    # Binary trie over address bits; a network is stored at the node its prefix ends on,
+    # so the networks containing a query are the ones on its path from the root
+    def __init__(self, root=None):
+        self.root = root if root is not None else [None, None, []]
+
+    def insert(self, network, value):
+        node = self.root
+        address = int(network.network_address)
+        for depth in range(network.prefixlen):
+            bit = (address >> (network.max_prefixlen - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, []]
+            node = node[bit]
+        node[2].append(value)
+
+    def covering(self, network):
+        # Values of networks equal to or containing network, broadest first
+        found = []
+        node = self.root
+        address = int(network.network_address)
+        for depth in range(network.prefixlen + 1):
+            found.extend(node[2])
+            if depth == network.prefixlen:
+                break
+            node = node[(address >> (network.max_prefixlen - 1 - depth)) & 1]
+            if node is None:
+                break
+        return found
+
+    def inside(self, network):
+        # Values of networks strictly inside network
+        node = self.root
+        address = int(network.network_address)
+        for depth in range(network.prefixlen):
+            node = node[(address >> (network.max_prefixlen - 1 - depth)) & 1]
+            if node is None:
+                return []
+        found = []
+        stack = [child for child in (node[1], node[0]) if child is not None]
+        while stack:
+            node = stack.pop()
+            found.extend(node[2])
+            stack.extend(child for child in (node[1], node[0]) if child is not None)
+        return found
+
+def parse_network(ip):
+    try:
+        return ipaddress.ip_network(normalize_ip(str(ip)), strict=False)
+    except ValueError:
+        return None
+
+def build_containment_index(exist_rules, ip_direction_key):
+    # (protocol, port, appid, url, IP version) -> PrefixTrie of (rule index, IP) for the existing policy
+    tries = {}
+    for j, exist_rule in enumerate(exist_rules):
+        fields = rule_fields_key(exist_rule)
+        for exist_ip in exist_rule[ip_direction_key]['ips']:
+            network = parse_network(exist_ip)
+            if network is not None:
+                tries.setdefault(fields + (network.version,), PrefixTrie()).insert(network, (j, exist_ip))
+    return tries
+
+def find_containment_between(req_rules, exist_rules, ip_direction_key, already_full_pairs=None, index=None):
+    # Request IPs covered by (or written differently from) an existing network, and request IPs
+    # containing narrower existing networks, with the same protocol, port, appid and url.
+    # Exact string matches are left to the per-IP check.
+    covered = []
+    overlapping = []
+    already_full_pairs = already_full_pairs or set()
+    if index is None:
+        index = build_containment_index(exist_rules, ip_direction_key) if req_rules else {}
+    tries = index
+    for i, req_rule in enumerate(req_rules):
+        fields = rule_fields_key(req_rule)
+        for req_ip in dict.fromkeys(req_rule[ip_direction_key]['ips']):
+            network = parse_network(req_ip)
+            trie = tries.get(fields + (network.version,)) if network is not None else None
+            if trie is None:
+                continue
+            for label, matches, result in (("is covered by", trie.covering(network), covered),
+                                           ("contains", trie.inside(network), overlapping)):
+                first_ip = {}
+                for j, exist_ip in matches:
+                    if (i, j) in already_full_pairs or normalize_ip(exist_ip) == normalize_ip(req_ip):
+                        continue
+                    first_ip.setdefault(j, exist_ip)
+                for j in sorted(first_ip):
+                    block = []
+                    block.append(f"### Requested policy rule {i+1} IP {normalize_ip(req_ip)} {label} "
+                                 f"existing policy rule {j+1} network {normalize_ip(first_ip[j])}")
+                    block.append("")
+                    block.append(f"#### Requested policy rule {i+1}")
+                    block.append("```yaml")
+                    block.append(highlight_rule(req_rule, ip_direction_key, {req_ip}))
+                    block.append("```")
+                    block.append("")
+                    block.append(f"#### Existing policy rule {j+1}")
+                    block.append("```yaml")
+                    block.append(highlight_rule(exist_rules[j], ip_direction_key, {first_ip[j]}))
+                    block.append("```")
+                    result.append("\n".join(block))
+    return covered, overlapping
+
+def parse_ports(port):
+    # "443", 443, "440-450", "443,8443" or "any" -> [(low, high), ...]; None if unparsable
+    text = str(port).strip().lower()
+    if text == "any":
+        return [(0, 65535)]
+    ranges = []
+    for part in text.split(","):
+        low, sep, high = part.strip().partition("-")
+        try:
+            low = int(low)
+            high = int(high) if sep else low
+        except ValueError:
+            return None
+        if not 0 <= low <= high <= 65535:
+            return None
+        ranges.append((low, high))
+    return ranges
+
+class IntervalIndex:
+    # Port ranges sorted by start, with a running max of the ends, so the ranges overlapping
+    # a query are found by binary search plus a walk over the matches only
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: (e[0], e[1]))
+        self.starts = [e[0] for e in self.entries]
+        self.max_ends = []
+        for entry in self.entries:
+            self.max_ends.append(max(entry[1], self.max_ends[-1]) if self.max_ends else entry[1])
+
+    def overlapping(self, low, high):
+        found = []
+        k = bisect.bisect_right(self.starts, high) - 1
+        while k >= 0 and self.max_ends[k] >= low:
+            if self.entries[k][1] >= low:
+                found.append(self.entries[k])
+            k -= 1
+        return found
+
+def build_port_index(exist_rules, ip_direction_key):
+    # (IP, protocol, appid, url) -> IntervalIndex of (low, high, rule index, IP) for the existing policy
+    entries = {}
+    for j, exist_rule in enumerate(exist_rules):
+        protocol, port, appid, url = rule_fields_key(exist_rule)
+        ranges = parse_ports(port)
+        if ranges is None:
+            continue
+        for exist_ip in exist_rule[ip_direction_key]['ips']:
+            for low, high in ranges:
+                entries.setdefault((normalize_ip(exist_ip), protocol, appid, url), []).append((low, high, j, exist_ip))
+    return {key: IntervalIndex(values) for key, values in entries.items()}
+
+def find_port_overlaps_between(req_rules, exist_rules, ip_direction_key, already_full_pairs=None, index=None):
+    # Request IPs whose port range overlaps a differently written port of an existing rule with the
+    # same IP, protocol, appid and url. Identical ports are left to the per-IP check.
+    result = []
+    already_full_pairs = already_full_pairs or set()
+    if index is None:
+        index = build_port_index(exist_rules, ip_direction_key) if req_rules else {}
+    for i, req_rule in enumerate(req_rules):
+        protocol, port, appid, url = rule_fields_key(req_rule)
+        ranges = parse_ports(port)
+        if ranges is None:
+            continue
+        for req_ip in dict.fromkeys(req_rule[ip_direction_key]['ips']):
+            intervals = index.get((normalize_ip(req_ip), protocol, appid, url))
+            if intervals is None:
+                continue
+            first_ip = {}
+            for low, high in ranges:
+                for _, _, j, exist_ip in intervals.overlapping(low, high):
+                    if (i, j) in already_full_pairs or rule_fields_key(exist_rules[j])[1] == port:
+                        continue
+                    first_ip.setdefault(j, exist_ip)
+            for j in sorted(first_ip):
+                exist_port = rule_fields_key(exist_rules[j])[1]
+                block = []
+                block.append(f"### Requested policy rule {i+1} IP {normalize_ip(req_ip)} port {port} "
+                             f"overlaps existing policy rule {j+1} port {exist_port}")
+                block.append("")
+                block.append(f"#### Requested policy rule {i+1}")
+                block.append("```yaml")
+                block.append(highlight_rule(req_rule, ip_direction_key, {req_ip}))
+                block.append("```")
+                block.append("")
+                block.append(f"#### Existing policy rule {j+1}")
+                block.append("```yaml")
+                block.append(highlight_rule(exist_rules[j], ip_direction_key, {first_ip[j]}))
+                block.append("```")
+                result.append("\n".join(block))
+    return result
+
+IP_DIRECTION_KEYS = ("destination", "source")
+
+INDEX_BUILDERS = {
+    "exact": build_existing_index,
+    "containment": build_containment_index,
+    "ports": build_port_index,
+}
+
+# Part of every persisted index name; bump when the index structures or normalization change
+INDEX_VERSION = 2
+
+KEY_WITHIN_5TUPLE = "Full 5-tuple rule duplicate within requested policy"
+KEY_WITHIN_PER_IP = "Per-IP 5-tuple duplicate within requested policy"
+KEY_WITHIN_DUPE_IPS = "Duplicate IPs within a single rule"
+KEY_BETWEEN_5TUPLE = "Full 5-tuple duplicate between requested and existing policy"
+KEY_BETWEEN_PER_IP = "Per-IP 5-tuple duplicates across files"
+KEY_BETWEEN_COVERED = "Request IPs covered by existing policy networks"
+KEY_BETWEEN_OVERLAPPING = "Request IPs containing narrower existing policy networks"
+KEY_BETWEEN_PORTS = "Request port ranges overlapping existing policy"
+
+class ExistingPolicy:
+    # The existing policy's rules and their indexes, built once per IP direction key and kind and
+    # reused for every request checked against it
+    def __init__(self, rules, containment=False, port_overlap=False):
+        self.rules = rules
+        self.containment = containment
+        self.port_overlap = port_overlap
+        self._indexes = {}
+
+    def _index(self, ip_direction_key, kind):
+        if (ip_direction_key, kind) not in self._indexes:
+            try:
+                self._indexes[(ip_direction_key, kind)] = INDEX_BUILDERS[kind](self.rules, ip_direction_key)
+            except Exception as e:
+                # e.g. existing rules without this direction key; raised again for each request using it
+                self._indexes[(ip_direction_key, kind)] = e
+        index = self._indexes[(ip_direction_key, kind)]
+        if isinstance(index, Exception):
+            raise index
+        return index
+
+    def kinds(self):
+        return ["exact"] + ["containment"] * self.containment + ["ports"] * self.port_overlap
+
+    def indexes(self, ip_direction_key):
+        return {kind: self._index(ip_direction_key, kind) for kind in self.kinds()}
+
+    def compile(self, kinds=None):
+        # Build the given kinds of index (by default those the enabled checks use) for every direction key
+        for ip_direction_key in IP_DIRECTION_KEYS:
+            for kind in kinds or self.kinds():
+                try:
+                    self._index(ip_direction_key, kind)
+                except Exception:
+                    pass
+
+def content_hash(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def index_path(index_dir, digest, part):
+    return os.path.join(index_dir, f"existing-v{INDEX_VERSION}-{digest}-{part}.json")
+
+def _load_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def _save_json(value, path):
+    # Written through a temporary file, so a concurrent run never reads a partial index
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _json_safe(value):
+    # Whether value comes back from JSON unchanged (YAML dates or non-string keys do not)
+    try:
+        return json.loads(json.dumps(value)) == value
+    except (TypeError, ValueError):
+        return False
+
+def _encode_exact(index):
+    five_tuple_index, per_ip_index = index
+    return {"five_tuple": [[sorted(key[0]), *key[1:], rules] for key, rules in five_tuple_index.items()],
+            "per_ip": [[*key, matches] for key, matches in per_ip_index.items()]}
+
+def _decode_exact(data):
+    five_tuple_index = {(frozenset(entry[0]),) + tuple(entry[1:-1]): entry[-1] for entry in data["five_tuple"]}
+    per_ip_index = {tuple(entry[:-1]): [tuple(match) for match in entry[-1]] for entry in data["per_ip"]}
+    return five_tuple_index, per_ip_index
+
+# Persisted indexes are plain JSON rather than pickles, so a tampered cache cannot run code.
+# kind -> (index -> JSON value, JSON value -> index); tuple keys are stored as lists ending in the value
+INDEX_CODECS = {
+    "exact": (_encode_exact, _decode_exact),
+    "containment": (lambda tries: [[*key, trie.root] for key, trie in tries.items()],
+                    lambda data: {tuple(entry[:-1]): PrefixTrie(entry[-1]) for entry in data}),
+    "ports": (lambda intervals: [[*key, index.entries] for key, index in intervals.items()],
+              lambda data: {tuple(entry[:-1]): IntervalIndex(entry[-1]) for entry in data}),
+}
+
+def _load_index(index_dir, digest, containment, port_overlap):
+    # (policy, kinds it has no index file for) from index_dir, or (None, None) if the rules are not there
+    # Restoring millions of small containers is several times faster without the cyclic GC
+    # rescanning them, so it is paused for the load only
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        existing = ExistingPolicy(_load_json(index_path(index_dir, digest, "rules")), containment, port_overlap)
+        missing = []
+        for kind in existing.kinds():
+            try:
+                saved = _load_json(index_path(index_dir, digest, kind))
+            except FileNotFoundError:
+                missing.append(kind)
+                continue
+            decode = INDEX_CODECS[kind][1]
+            for ip_direction_key, index in saved.items():
+                existing._indexes[(ip_direction_key, kind)] = decode(index)
+        return existing, missing
+    except FileNotFoundError:
+        return None, None
+    except Exception as e:
+        print(f"WARNING: ignoring unreadable index {index_path(index_dir, digest, '*')}: {e}", file=sys.stderr)
+        return None, None
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def load_existing_policy(existing_file, containment=False, port_overlap=False, index_dir=None):
+    # With an index_dir, the rules and each kind of index the enabled checks use are saved there as
+    # JSON keyed by the YAML's SHA-256; later runs on the same content load those instead of parsing
+    # the YAML, and build and save only the kinds not saved yet
+    if not index_dir:
+        existing_policy = load_yaml_file(existing_file)
+        return ExistingPolicy(existing_policy.get("rules", []), containment, port_overlap)
+
+    digest = content_hash(existing_file)
+    existing, missing = _load_index(index_dir, digest, containment, port_overlap)
+    loaded = existing is not None
+    if loaded:
+        print(f"DEBUG: Loaded existing policy index {index_path(index_dir, digest, '*')}", file=sys.stderr)
+    else:
+        existing_policy = load_yaml_file(existing_file)
+        existing = ExistingPolicy(existing_policy.get("rules", []), containment, port_overlap)
+        missing = existing.kinds()
+        if not _json_safe(existing.rules):
+            print(f"WARNING: not saving an index of {existing_file}: it has values JSON cannot store", file=sys.stderr)
+            return existing
+    if not missing:
+        return existing
+
+    existing.compile(missing)
+    os.makedirs(index_dir, exist_ok=True)
+    for kind in missing:
+        # A direction key whose index failed to build is left out, and fails again when used
+        encode = INDEX_CODECS[kind][0]
+        _save_json({ip_direction_key: encode(existing._indexes[(ip_direction_key, kind)])
+                    for ip_direction_key in IP_DIRECTION_KEYS
+                    if not isinstance(existing._indexes[(ip_direction_key, kind)], Exception)},
+                   index_path(index_dir, digest, kind))
+    if not loaded:
+        # Rules last: a run that finds them finds the index files saved with them too
+        _save_json(existing.rules, index_path(index_dir, digest, "rules"))
+    print(f"DEBUG: Saved existing policy index {index_path(index_dir, digest, '*')}", file=sys.stderr)
+    return existing
+
+def check_policy(request_policy, existing=None):
+    # Markdown report and exit code (0 clean, 2 duplicates) for one request policy
+    service_type = request_policy.get("security_group", {}).get("serviceType", "")
+    ip_direction_key = "source" if service_type == "privatelink-consumer" else "destination"
+    rules = request_policy.get("rules", [])
+
+    sections_within = {}
+    sections_between = {}
+
+    within_5tuple = find_five_tuple_dupes_within(rules, ip_direction_key)
+    if within_5tuple:
+        sections_within[KEY_WITHIN_5TUPLE] = within_5tuple
+    within_per_ip = find_per_ip_5tuple_dupes_within(rules, ip_direction_key)
+    if within_per_ip:
+        sections_within[KEY_WITHIN_PER_IP] = within_per_ip
+    within_dupe_ips = find_duplicate_ips_within_rule(rules, ip_direction_key)
+    if within_dupe_ips:
+        sections_within[KEY_WITHIN_DUPE_IPS] = within_dupe_ips
+
+    if existing is not None:
+        exist_rules = existing.rules
+        # One index of the existing rules serves every between-file check
+        indexes = existing.indexes(ip_direction_key) if rules else {}
+        between_5tuple, full_tuple_pairs = find_five_tuple_dupes_between(rules, exist_rules, ip_direction_key, index=indexes.get("exact"))
+        if between_5tuple:
+            sections_between[KEY_BETWEEN_5TUPLE] = between_5tuple
+        between_per_ip = find_per_ip_5tuple_dupes_between(rules, exist_rules, ip_direction_key, already_full_pairs=full_tuple_pairs, index=indexes.get("exact"))
+        if between_per_ip:
+            sections_between[KEY_BETWEEN_PER_IP] = between_per_ip
+        if existing.containment:
+            between_covered, between_overlapping = find_containment_between(rules, exist_rules, ip_direction_key, already_full_pairs=full_tuple_pairs, index=indexes.get("containment"))
+            if between_covered:
+                sections_between[KEY_BETWEEN_COVERED] = between_covered
+            if between_overlapping:
+                sections_between[KEY_BETWEEN_OVERLAPPING] = between_overlapping
+        if existing.port_overlap:
+            between_ports = find_port_overlaps_between(rules, exist_rules, ip_direction_key, already_full_pairs=full_tuple_pairs, index=indexes.get("ports"))
+            if between_ports:
+                sections_between[KEY_BETWEEN_PORTS] = between_ports
+
+    output_lines = []
+
+    if sections_within:
+        output_lines.append("# ❌ Duplicates detected within requested policy")
+        for header in [
+            KEY_WITHIN_5TUPLE,
+            KEY_WITHIN_PER_IP,
+            KEY_WITHIN_DUPE_IPS,
+        ]:
+            if header in sections_within:
+                output_lines.append("")  
+                output_lines.append(f"## {header}")
+                for block in sections_within[header]:
+                    output_lines.append("")
+                    output_lines.append(block)
+
+    if sections_between:
+        if output_lines:
+            output_lines.append("")
+        output_lines.append("# ❌ Duplicates detected between requested and existing policy")
+        for header in [
+            KEY_BETWEEN_5TUPLE,
+            KEY_BETWEEN_PER_IP,
+            KEY_BETWEEN_COVERED,
+            KEY_BETWEEN_OVERLAPPING,
+            KEY_BETWEEN_PORTS,
+        ]:
+            if header in sections_between:
+                output_lines.append("")
+                output_lines.append(f"## {header}")
+                for block in sections_between[header]:
+                    output_lines.append("")
+                    output_lines.append(block)
+
+    if output_lines:
+        return "\n".join(output_lines).rstrip(), 2
+    return "💦 No Duplicates detected!", 0
+
+_worker_existing = None
+
+def _init_worker(existing):
+    global _worker_existing
+    _worker_existing = existing
+
+def check_request_file(request_file, existing=None):
+    # (report, exit code) for one request file; errors are reported, not raised, so one bad
+    # request does not stop a batch
+    if existing is None:
+        existing = _worker_existing
+    if not os.path.isfile(request_file):
+        return f"ERROR: Cannot find request_file {request_file}", 3
+    try:
+        return check_policy(load_yaml_file(request_file), existing)
+    except Exception as e:
+        return f"ERROR: {e}", 1
+
+def expand_request_files(paths):
+    # Request files named directly, plus the *.yaml and *.yml files of named directories
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.yaml")) + glob.glob(os.path.join(path, "*.yml"))))
+        else:
+            files.append(path)
+    return files
+
+def expand_batch_entries(entries, existing_file=None):
+    # [(request file, existing file or None)] for --batch entries, each a request file or directory
+    # optionally followed by ",<existing file>"; entries without one use existing_file
+    pairs = []
+    for entry in entries:
+        path, sep, entry_existing = entry.partition(",")
+        for request_file in expand_request_files([path]):
+            pairs.append((request_file, (entry_existing or None) if sep else existing_file))
+    return pairs
+
+def run_batch(request_files, existing=None, jobs=1):
+    # [(request file, report, exit code)] in request order; the existing policy is indexed once
+    # here, and the worker processes inherit the built indexes
+    if existing is not None:
+        existing.compile()  # failures are reported by each request using that direction key
+    if jobs > 1 and len(request_files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(existing,)) as pool:
+            results = list(pool.map(check_request_file, request_files))
+    else:
+        results = [check_request_file(request_file, existing) for request_file in request_files]
+    return [(request_file, report, code) for request_file, (report, code) in zip(request_files, results)]
+
+def batch_main(args):
+    if args.batch_existing_file and not os.path.isfile(args.batch_existing_file):
+        print(f"ERROR: Cannot find existing_file {args.batch_existing_file}", file=sys.stderr)
+        sys.exit(3)
+    pairs = expand_batch_entries(args.batch, args.batch_existing_file)
+
+    # Requests are checked grouped by existing policy, so each is loaded and indexed once.
+    # As in the two-file form, a request whose existing policy is missing is checked on its own
+    groups = {}
+    for k, (request_file, existing_file) in enumerate(pairs):
+        if existing_file and not os.path.isfile(existing_file):
+            print(f"DEBUG: existing_file {existing_file} not found, checking {request_file} on its own",
+                  file=sys.stderr)
+            existing_file = None
+        groups.setdefault(existing_file, []).append(k)
+
+    print(f"DEBUG: checking {len(pairs)} request files against {len(groups.keys() - {None})} existing "
+          f"policies with {args.jobs} jobs", file=sys.stderr)
+    results = [None] * len(pairs)
+    for existing_file, positions in groups.items():
+        existing = None
+        if existing_file:
+            existing = load_existing_policy(existing_file, args.containment, args.port_overlap, args.index_dir)
+        for k, result in zip(positions, run_batch([pairs[k][0] for k in positions], existing, args.jobs)):
+            results[k] = result
+
+    report_names = {}
+    if args.report_dir:
+        os.makedirs(args.report_dir, exist_ok=True)
+    for request_file, report, code in results:
+        if args.report_dir:
+            name = os.path.splitext(os.path.basename(request_file))[0]
+            report_names[name] = report_names.get(name, 0) + 1
+            if report_names[name] > 1:
+                name = f"{name}-{report_names[name]}"
+            with open(os.path.join(args.report_dir, f"{name}.md"), "w") as f:
+                f.write(report + "\n")
+        else:
+            print(f"==> {request_file} <==")
+            print(report)
+            print()
+
+    statuses = {0: "no duplicates", 2: "duplicates"}
+    print("# Batch summary")
+    for request_file, report, code in results:
+        print(f"- {request_file} : {statuses.get(code, 'error')}")
+
+    codes = {code for _, _, code in results}
+    if codes - {0, 2}:
+        sys.exit(1)
+    sys.exit(2 if 2 in codes else 0)
+
+def main():
+    try:
+        # print("DEBUG: yaml-duplicate-validator starting...", file=sys.stderr)
+
+        parser = argparse.ArgumentParser(description="Check a request policy for duplicates within itself and against an existing policy.")
+        parser.add_argument("request_file", nargs="?")
+        parser.add_argument("existing_file", nargs="?")
+        parser.add_argument("--containment", action="store_true",
+                            help="Also report request IPs covered by, or containing, existing networks (CIDR-aware)")
+        parser.add_argument("--port-overlap", action="store_true",
+                            help="Also report request port ranges overlapping existing rules for the same IP")
+        parser.add_argument("--index-dir",
+                            help="Reuse (or save) the parsed and indexed existing policy, keyed by its content hash")
+        parser.add_argument("--batch", nargs="+", metavar="REQUEST[,EXISTING_FILE]",
+                            help="Check many request files (or directories of them), each against the existing "
+                                 "policy after its comma, or else --existing-file")
+        parser.add_argument("--existing-file", dest="batch_existing_file", metavar="EXISTING_FILE",
+                            help="Existing policy for --batch entries without their own")
+        parser.add_argument("--jobs", type=int, default=1, help="Worker processes for --batch (default: 1)")
+        parser.add_argument("--report-dir", help="Write one <request>.md report per --batch request here")
+        args = parser.parse_args()
+        if args.batch:
+            if args.request_file or args.existing_file:
+                parser.error("--batch takes the request files; give the existing policy with --existing-file")
+            batch_main(args)
+        if not args.request_file:
+            parser.error("request_file is required")
+        request_file = args.request_file
+        existing_file = args.existing_file
+
+        print(f"DEBUG: request_file={request_file}", file=sys.stderr)
+        if existing_file:
+            print(f"DEBUG: existing_file={existing_file}", file=sys.stderr)
+
+        if not os.path.isfile(request_file):
+            print(f"ERROR: Cannot find request_file {request_file}", file=sys.stderr)
+            sys.exit(3)
+
+        request_policy = load_yaml_file(request_file)
+
+        print(f"DEBUG: Loaded {len(request_policy.get('rules', []))} rules from {request_file}", file=sys.stderr)
+
+        existing = None
+        if existing_file and os.path.isfile(existing_file):
+            existing = load_existing_policy(existing_file, args.containment, args.port_overlap, args.index_dir)
+
+        report, code = check_policy(request_policy, existing)
+        print(report)
+        sys.exit(code)
+    
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()